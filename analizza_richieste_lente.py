@@ -0,0 +1,58 @@
+"""
+Riepilogo del log delle richieste lente (instance/slow_requests.jsonl),
+scritto dall'app per ogni richiesta oltre app.config['SLOW_REQUEST_MS'].
+
+Per ogni endpoint mostra numero di richieste lente, tempo mediano, 95° percentile
+e massimo, tempo SQL medio e query medie, dal più costoso in totale: serve a
+capire quale vista (dashboard, lavori_admin, fatturazione, ...) occupa i worker.
+
+Istruzioni:
+1. Assicurati di essere nella directory del progetto
+2. Esegui: python analizza_richieste_lente.py [percorso_log]
+   (default instance/slow_requests.jsonl)
+"""
+import json
+import statistics
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+LOG_DEFAULT = Path(__file__).resolve().parent / "instance" / "slow_requests.jsonl"
+
+
+def _percentile(valori, p):
+    valori = sorted(valori)
+    return valori[min(len(valori) - 1, int(round(p / 100 * (len(valori) - 1))))]
+
+
+def main():
+    percorso = Path(sys.argv[1]) if len(sys.argv) > 1 else LOG_DEFAULT
+    if not percorso.exists():
+        print(f"[!] Log non trovato: {percorso}")
+        return
+
+    per_endpoint = defaultdict(list)
+    with open(percorso, encoding="utf-8") as f:
+        for riga in f:
+            riga = riga.strip()
+            if riga:
+                r = json.loads(riga)
+                per_endpoint[r["endpoint"]].append(r)
+
+    if not per_endpoint:
+        print("[i] Nessuna richiesta lenta registrata")
+        return
+
+    print(f"{'Endpoint':<42}{'N':>6}{'Mediana':>10}{'P95':>10}{'Max':>10}{'SQL medio':>11}{'Query':>8}")
+    print("-" * 97)
+    for endpoint, righe in sorted(per_endpoint.items(), key=lambda x: -sum(r["totale_ms"] for r in x[1])):
+        tempi = [r["totale_ms"] for r in righe]
+        print(f"{endpoint:<42}{len(righe):>6}{statistics.median(tempi):>10.1f}{_percentile(tempi, 95):>10.1f}"
+              f"{max(tempi):>10.1f}{statistics.mean(r['sql_ms'] for r in righe):>11.1f}"
+              f"{statistics.mean(r['query'] for r in righe):>8.1f}")
+    print()
+    print("[i] Tempi in ms")
+
+
+if __name__ == "__main__":
+    main()
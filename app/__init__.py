@@ -8,13 +8,37 @@ login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
 login_manager.login_message = "Effettua il login per accedere."
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
     
     # Configurazione
     app.config['SECRET_KEY'] = 'chiave_super_segreta_cambiala_in_produzione'
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///gestionale.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Processi per la generazione massiva delle offerte (None = automatico)
+    app.config['OFFERTE_BATCH_WORKERS'] = None
+    # Advisor indici: logga le query con scansioni complete (None = solo in debug)
+    app.config['INDEX_ADVISOR'] = None
+    # PRAGMA SQLite per ogni connessione (WAL, synchronous, cache, mmap, busy_timeout):
+    # None = valori di app/utils/sqlite_pragmas.py, oppure un dict che li sostituisce
+    app.config['SQLITE_PRAGMAS'] = None
+    # Profilazione richieste: header Server-Timing con query e tempo SQL (None =
+    # in debug e per gli admin, True / False = sempre / mai), e log JSON-lines
+    # (nella cartella instance) delle richieste oltre SLOW_REQUEST_MS
+    # (None = log disattivato)
+    app.config['SERVER_TIMING'] = None
+    app.config['SLOW_REQUEST_MS'] = 500
+    app.config['SLOW_REQUEST_LOG'] = 'slow_requests.jsonl'
+    # Eventi in tempo reale per gli admin (/api/eventi, Server-Sent Events):
+    # ogni pagina admin aperta tiene occupato un thread del server per al massimo
+    # EVENTI_SSE_DURATA secondi, poi si riconnette. Disattivati di default: con
+    # pochi worker (PythonAnywhere) bastano poche schede aperte per occuparli tutti
+    app.config['EVENTI_SSE'] = False
+    app.config['EVENTI_SSE_INTERVALLO'] = 15  # Secondi tra keepalive / controlli delle versioni
+    app.config['EVENTI_SSE_DURATA'] = 300
+    # Valori che sostituiscono quelli sopra (es. database dei benchmark)
+    if config:
+        app.config.update(config)
 
     # Collega estensioni all'app
     db.init_app(app)
@@ -34,105 +58,19 @@ def create_app():
     app.register_blueprint(auth_bp)
     app.register_blueprint(main_bp)
 
-    # Crea il database se non esiste
+    # Database: PRAGMA SQLite, advisor indici, profilazione e schema aggiornato
     with app.app_context():
-        db.create_all()
-        
-        # Auto-migrazione: aggiunge colonne mancanti alla tabella user
-        try:
-            inspector = db.inspect(db.engine)
-            if inspector.has_table('user'):
-                user_columns = [col['name'] for col in inspector.get_columns('user')]
-                from sqlalchemy import text
-                if 'last_seen_note_id' not in user_columns:
-                    db.session.execute(text('ALTER TABLE user ADD COLUMN last_seen_note_id INTEGER DEFAULT 0'))
-                if 'dismissed_changelog_id' not in user_columns:
-                    db.session.execute(text('ALTER TABLE user ADD COLUMN dismissed_changelog_id INTEGER DEFAULT 0'))
-                db.session.commit()
-        except Exception:
-            db.session.rollback()
-        
-        # Auto-migrazione: crea tabella changelog se non esiste
-        try:
-            inspector = db.inspect(db.engine)
-            if not inspector.has_table('changelog'):
-                from sqlalchemy import text
-                db.session.execute(text('''
-                    CREATE TABLE changelog (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        versione VARCHAR(50) NOT NULL,
-                        titolo VARCHAR(200) NOT NULL,
-                        contenuto TEXT NOT NULL,
-                        data_pubblicazione DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        attivo BOOLEAN DEFAULT 1,
-                        ordine INTEGER DEFAULT 0
-                    )
-                '''))
-                db.session.commit()
-        except Exception:
-            db.session.rollback()
-        
-        # Crea utenti admin/base di default SOLO se non esistono
-        # NOTA: Non resettiamo le password degli utenti esistenti per evitare problemi su PythonAnywhere
-        # Usa init_users.py per resettare manualmente le password quando necessario
-        
-        default_pass = 'Ciao1234'
-        
-        # Admin users - crea solo se non esistono
-        admins = ['Roberto', 'Lucio', 'Giuseppe', 'Carmela']
-        for username in admins:
-            if not User.query.filter_by(username=username).first():
-                admin = User(username=username, role='admin', admin_view_mode='extra2')
-                admin.set_password(default_pass)
-                db.session.add(admin)
-        
-        # Base users - crea solo se non esistono
-        base_users = ['Gianmarco', 'Francescos', 'Francescou', 'Giovanni', 'Marco']
-        for username in base_users:
-            if not User.query.filter_by(username=username).first():
-                base = User(username=username, role='base', admin_view_mode='standard')
-                base.set_password(default_pass)
-                db.session.add(base)
-            
-        db.session.commit()
+        from app.utils.sqlite_pragmas import init_sqlite_pragmas
+        from app.utils.index_advisor import init_index_advisor
+        from app.utils.profilazione import init_profilazione
+        init_sqlite_pragmas(db.engine, app.config['SQLITE_PRAGMAS'])
+        init_index_advisor(db.engine)
+        init_profilazione(app, db.engine)
 
-        # Auto-seed changelog: aggiunge il nuovo changelog se non esiste
-        try:
-            from app.models import Changelog
-            if not Changelog.query.filter_by(versione="2026-02-21").first():
-                nuovo_changelog = Changelog(
-                    versione="2026-02-21",
-                    titolo="Aggiornamento Dashboard e Fatturazione",
-                    contenuto="""<h4>💰 Fatturazione Differenziata</h4>
-<p>La logica di fatturazione è stata aggiornata per distinguere i diversi soggetti:</p>
-<p><em>...video in arrivo...</em></p>
-
-<h4>📊 Card Fatturazione Aggiornata</h4>
-<p>La card di fatturazione nella dashboard ora mostra informazioni più dettagliate:</p>
-<ul>
-    <li><strong>Lavori da fatturare</strong>: numero di lavori per cui manca ancora la fattura (divisi per soggetto)</li>
-    <li><strong>Lavori incassati</strong>: lavori per cui la fattura è stata emessa e il pagamento ricevuto</li>
-    <li>Visione chiara e immediata dello stato di fatturazione complessivo</li>
-</ul>
-
-<h4>💸 Card Lavori da Incassare</h4>
-<p>Nuova card dedicata ai lavori da incassare:</p>
-<ul>
-    <li>Mostra i lavori per i quali la fattura FE è stata emessa ma il <strong>pagamento non è ancora stato ricevuto</strong></li>
-    <li>Permette di tenere sotto controllo i crediti in sospeso</li>
-</ul>
-
-<h4>🎨 Miglioramenti Layout Dashboard</h4>
-<ul>
-    <li><strong>Card stati lavori riposizionate</strong>: le card che mostrano gli stati dei lavori sono state spostate per migliorare l'utilizzo dello spazio</li>
-    <li>Layout più compatto e leggibile, con le informazioni più importanti in primo piano</li>
-</ul>""",
-                    attivo=True,
-                    ordine=2
-                )
-                db.session.add(nuovo_changelog)
-                db.session.commit()
-        except Exception:
-            db.session.rollback()
+        # Migrazioni versionate (app/migrazioni.py): se lo schema è già
+        # aggiornato costa una sola SELECT su schema_version
+        from app.migrazioni import assicura_schema
+        for passo in assicura_schema(db.engine):
+            app.logger.info("Migrazione applicata: %s", passo)
 
     return app
\ No newline at end of file
@@ -0,0 +1,354 @@
+from __future__ import annotations
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from werkzeug.security import generate_password_hash
+
+from app import db
+
+
+# Migrazioni versionate dello schema. Ogni passo di MIGRAZIONI corrisponde a
+# uno degli script migrate_*.py (che restano per l'esecuzione manuale) o ai
+# dati iniziali che create_app inseriva ad ogni avvio; la tabella
+# schema_version ricorda l'ultimo passo applicato. All'avvio basta quindi
+# confrontare un intero: solo se il database è indietro vengono eseguiti
+# create_all e i passi mancanti, in un'unica transazione.
+# Per una nuova migrazione: aggiungere un passo in fondo (mai riordinare).
+
+
+def _colonne(conn, tabella):
+    return {riga[1] for riga in conn.exec_driver_sql(f'PRAGMA table_info("{tabella}")')}
+
+
+def _aggiungi_colonne(conn, tabella, colonne):
+    """Aggiunge le colonne mancanti; ritorna i nomi di quelle aggiunte."""
+    esistenti = _colonne(conn, tabella)
+    aggiunte = []
+    for nome, tipo in colonne:
+        if nome not in esistenti:
+            conn.exec_driver_sql(f'ALTER TABLE "{tabella}" ADD COLUMN {nome} {tipo}')
+            aggiunte.append(nome)
+    return aggiunte
+
+
+def _crea_indici(conn, indici):
+    for nome, tabella, colonne in indici:
+        conn.exec_driver_sql(f'CREATE INDEX IF NOT EXISTS {nome} ON "{tabella}" ({colonne})')
+
+
+def _ricostruisci_fatture(conn):
+    from app.services.fatture import ricostruisci_fatture
+
+    session = Session(bind=conn)
+    try:
+        ricostruisci_fatture(session)
+    finally:
+        session.close()
+
+
+# --- PASSI ---
+
+def _campi_utenti_base(conn):
+    _aggiungi_colonne(conn, 'lavoro_admin', [
+        ('data_contatto', 'DATE'),
+        ('note', 'TEXT'),
+        ('sollecito', 'BOOLEAN DEFAULT 0'),
+        ('data_sollecito', 'DATE'),
+        ('compenso', 'REAL DEFAULT 0.0'),
+    ])
+
+
+def _campi_abbandono(conn):
+    _aggiungi_colonne(conn, 'bene', [
+        ('motivo_abbandono', 'VARCHAR(100)'),
+        ('commento_abbandono', 'TEXT'),
+        ('data_abbandono', 'DATE'),
+    ])
+
+
+def _ordine_abbandono(conn):
+    if _aggiungi_colonne(conn, 'bene', [('ordine_abbandono', 'INTEGER')]):
+        # Ordine progressivo per i beni già abbandonati (l'id approssima l'ordine storico)
+        ids = conn.execute(text("SELECT id FROM bene WHERE stato = 'abbandonato' ORDER BY id ASC")).scalars().all()
+        if ids:
+            conn.execute(
+                text("UPDATE bene SET ordine_abbandono = :ord WHERE id = :id"),
+                [{'ord': ordine, 'id': bene_id} for ordine, bene_id in enumerate(ids, start=1)],
+            )
+
+
+def _note_admin(conn):
+    # La tabella note_admin viene creata da create_all
+    _aggiungi_colonne(conn, 'user', [('last_seen_note_id', 'INTEGER DEFAULT 0')])
+
+
+def _changelog(conn):
+    # La tabella changelog viene creata da create_all
+    _aggiungi_colonne(conn, 'user', [('dismissed_changelog_id', 'INTEGER DEFAULT 0')])
+
+
+def _categoria(conn):
+    _aggiungi_colonne(conn, 'lavoro_admin', [('categoria', 'VARCHAR(20)')])
+
+
+def _colonne_ext(conn):
+    _aggiungi_colonne(conn, 'lavoro_admin', [
+        ('ext_type', "VARCHAR(10) DEFAULT 'perc'"),
+        ('ext_value', 'FLOAT DEFAULT 0.0'),
+    ])
+
+
+def _colonne_data_fattura(conn):
+    _aggiungi_colonne(conn, 'lavoro_admin', [
+        (f'data_fattura_{soggetto}', 'DATE')
+        for soggetto in ('fe', 'amin', 'galvan', 'fh', 'bianc', 'deloitte', 'ext', 'revisore', 'caricamento')
+    ])
+
+
+def _colonne_sabatini(conn):
+    _aggiungi_colonne(conn, 'lavoro_admin', [
+        ('has_sabatini', 'BOOLEAN DEFAULT 0'),
+        ('nome_sabatini', 'VARCHAR(100)'),
+        ('importo_sabatini', 'FLOAT DEFAULT 0.0'),
+        ('sab_type', "VARCHAR(10) DEFAULT 'perc'"),
+        ('sab_value', 'FLOAT DEFAULT 0.0'),
+        ('c_sabatini', 'FLOAT DEFAULT 0.0'),
+        ('f_sabatini', 'VARCHAR(50)'),
+        ('data_fattura_sabatini', 'DATE'),
+    ])
+
+
+def _contatori_beni(conn):
+    _aggiungi_colonne(conn, 'lavoro_admin', [
+        ('beni_totali', 'INTEGER NOT NULL DEFAULT 0'),
+        ('beni_abbandonati', 'INTEGER NOT NULL DEFAULT 0'),
+        ('is_fully_abbandonato', 'BOOLEAN NOT NULL DEFAULT 0'),
+    ])
+    _crea_indici(conn, [('ix_lavoro_admin_is_fully_abbandonato', 'lavoro_admin', 'is_fully_abbandonato')])
+    conn.exec_driver_sql("""
+        UPDATE lavoro_admin SET
+            beni_totali = (SELECT COUNT(*) FROM bene WHERE bene.lavoro_id = lavoro_admin.id),
+            beni_abbandonati = (
+                SELECT COUNT(*) FROM bene
+                WHERE bene.lavoro_id = lavoro_admin.id AND bene.stato = 'abbandonato'
+            )
+    """)
+    conn.exec_driver_sql("""
+        UPDATE lavoro_admin
+        SET is_fully_abbandonato = (beni_totali > 0 AND beni_abbandonati = beni_totali)
+    """)
+
+
+def _indici_created_at(conn):
+    _crea_indici(conn, [
+        (f'ix_{tabella}_created_at', tabella, 'created_at')
+        for tabella in ('lavoro_admin', 'lavoro40', 'lavoro50')
+    ])
+
+
+def _fatture(conn):
+    # Tabelle fattura / fattura_riga create da create_all
+    _ricostruisci_fatture(conn)
+
+
+def _fatture_totali(conn):
+    _aggiungi_colonne(conn, 'fattura', [
+        ('totale_compensi', 'FLOAT'),
+        ('n_lavori', 'INTEGER'),
+        ('primo_lavoro_id', 'INTEGER'),
+    ])
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_fattura_elenco "
+        "ON fattura (soggetto, coalesce(data, '') DESC, primo_lavoro_id)"
+    )
+    _ricostruisci_fatture(conn)
+
+
+def _indice_stato_beni(conn):
+    _crea_indici(conn, [('ix_bene_lavoro_stato', 'bene', 'lavoro_id, stato')])
+
+
+def _indici_colonne_filtrate(conn):
+    _crea_indici(conn, [
+        ('ix_lavoro_admin_numero', 'lavoro_admin', 'numero'),
+        ('ix_lavoro_admin_cliente_id', 'lavoro_admin', 'cliente_id'),
+        ('ix_lavoro_admin_stato_numero', 'lavoro_admin', 'stato, numero'),
+        ('ix_lavoro_admin_collaboratore_numero', 'lavoro_admin', 'collaboratore, numero'),
+        ('ix_bene_stato_lavoro', 'bene', 'stato, lavoro_id'),
+        ('ix_bene_ordine_abbandono', 'bene', 'ordine_abbandono'),
+        ('ix_note_admin_created_at', 'note_admin', 'created_at'),
+        ('ix_changelog_attivo_ordine', 'changelog', 'attivo, ordine'),
+    ])
+
+
+# Utenti admin/base di default, creati solo se non esistono.
+# NOTA: le password degli utenti esistenti non vengono toccate; per resettarle
+# usare init_users.py
+UTENTI_DEFAULT = {
+    'admin': ['Roberto', 'Lucio', 'Giuseppe', 'Carmela'],
+    'base': ['Gianmarco', 'Francescos', 'Francescou', 'Giovanni', 'Marco'],
+}
+PASSWORD_DEFAULT = 'Ciao1234'
+
+
+def _utenti_default(conn):
+    from app.models import User
+
+    esistenti = set(conn.execute(text('SELECT username FROM user')).scalars())
+    nuovi = [
+        {
+            'username': username,
+            'role': ruolo,
+            'admin_view_mode': 'extra2' if ruolo == 'admin' else 'standard',
+            'password_hash': generate_password_hash(PASSWORD_DEFAULT),
+        }
+        for ruolo, utenti in UTENTI_DEFAULT.items()
+        for username in utenti
+        if username not in esistenti
+    ]
+    if nuovi:
+        conn.execute(User.__table__.insert(), nuovi)
+
+
+CHANGELOG_2026_02_21 = """<h4>💰 Fatturazione Differenziata</h4>
+<p>La logica di fatturazione è stata aggiornata per distinguere i diversi soggetti:</p>
+<p><em>...video in arrivo...</em></p>
+
+<h4>📊 Card Fatturazione Aggiornata</h4>
+<p>La card di fatturazione nella dashboard ora mostra informazioni più dettagliate:</p>
+<ul>
+    <li><strong>Lavori da fatturare</strong>: numero di lavori per cui manca ancora la fattura (divisi per soggetto)</li>
+    <li><strong>Lavori incassati</strong>: lavori per cui la fattura è stata emessa e il pagamento ricevuto</li>
+    <li>Visione chiara e immediata dello stato di fatturazione complessivo</li>
+</ul>
+
+<h4>💸 Card Lavori da Incassare</h4>
+<p>Nuova card dedicata ai lavori da incassare:</p>
+<ul>
+    <li>Mostra i lavori per i quali la fattura FE è stata emessa ma il <strong>pagamento non è ancora stato ricevuto</strong></li>
+    <li>Permette di tenere sotto controllo i crediti in sospeso</li>
+</ul>
+
+<h4>🎨 Miglioramenti Layout Dashboard</h4>
+<ul>
+    <li><strong>Card stati lavori riposizionate</strong>: le card che mostrano gli stati dei lavori sono state spostate per migliorare l'utilizzo dello spazio</li>
+    <li>Layout più compatto e leggibile, con le informazioni più importanti in primo piano</li>
+</ul>"""
+
+
+def _changelog_2026_02_21(conn):
+    from app.models import Changelog
+
+    if conn.execute(text("SELECT 1 FROM changelog WHERE versione = '2026-02-21'")).first() is None:
+        conn.execute(Changelog.__table__.insert().values(
+            versione="2026-02-21",
+            titolo="Aggiornamento Dashboard e Fatturazione",
+            contenuto=CHANGELOG_2026_02_21,
+            attivo=True,
+            ordine=2,
+        ))
+
+
+def _ricerca_full_text(conn):
+    from app.services.ricerca import crea_indice_ricerca, ricostruisci_indice_ricerca
+
+    crea_indice_ricerca(conn)
+    ricostruisci_indice_ricerca(conn)
+
+
+def _versioni_dati(conn):
+    from app.services.versioni import DOMINI, TUTTI
+
+    for dominio in sorted({TUTTI, *DOMINI.values()}):
+        conn.execute(text('INSERT OR IGNORE INTO versione_dati (dominio, versione) VALUES (:d, 0)'), {'d': dominio})
+
+
+def _versione_dashboard(conn):
+    _aggiungi_colonne(conn, 'dashboard_summary', [('versione', 'INTEGER NOT NULL DEFAULT 0')])
+
+
+def _dashboard_incrementale(conn):
+    # La tabella dashboard_contributo è creata da create_all; la colonna
+    # dashboard_summary.versione del passo 20 resta, non più usata
+    from app.services.dashboard import ricostruisci_dashboard_summary
+
+    session = Session(bind=conn)
+    try:
+        ricostruisci_dashboard_summary(session)
+        session.flush()
+    finally:
+        session.close()
+
+
+# (versione, script / descrizione, funzione): le versioni sono progressive
+MIGRAZIONI = [
+    (1, 'migrate_add_base_user_fields', _campi_utenti_base),
+    (2, 'migrate_add_abbandono_fields', _campi_abbandono),
+    (3, 'migrate_add_ordine_abbandono', _ordine_abbandono),
+    (4, 'migrate_create_note_admin_table', _note_admin),
+    (5, 'migrate_add_changelog', _changelog),
+    (6, 'migrate_add_categoria_column', _categoria),
+    (7, 'migrate_add_ext_columns', _colonne_ext),
+    (8, 'migrate_add_data_fattura_columns', _colonne_data_fattura),
+    (9, 'migrate_add_sabatini_columns', _colonne_sabatini),
+    (10, 'migrate_add_beni_counters', _contatori_beni),
+    (11, 'migrate_add_created_at_indexes', _indici_created_at),
+    (12, 'migrate_add_fatture', _fatture),
+    (13, 'migrate_add_fatture_totali', _fatture_totali),
+    (14, 'migrate_add_bene_stato_index', _indice_stato_beni),
+    (15, 'migrate_add_hot_indexes', _indici_colonne_filtrate),
+    (16, 'utenti di default', _utenti_default),
+    (17, 'changelog 2026-02-21', _changelog_2026_02_21),
+    (18, 'ricerca full-text (FTS5)', _ricerca_full_text),
+    (19, 'versioni dei dati (ETag)', _versioni_dati),
+    (20, 'dashboard ricalcolata alla lettura', _versione_dashboard),
+    (21, 'dashboard aggiornata per differenze', _dashboard_incrementale),
+    (22, 'ricerca senza numero lavoro', _ricerca_full_text),
+]
+
+SCHEMA_VERSION = MIGRAZIONI[-1][0]
+
+
+def versione_corrente(engine):
+    """Versione registrata in schema_version (0 se la tabella non esiste)."""
+    try:
+        with engine.connect() as conn:
+            return conn.exec_driver_sql('SELECT versione FROM schema_version WHERE id = 1').scalar() or 0
+    except OperationalError:
+        return 0
+
+
+def applica_migrazioni(engine):
+    """
+    Porta il database a SCHEMA_VERSION: create_all per le tabelle mancanti e
+    poi i passi successivi alla versione registrata. Ritorna i passi applicati.
+    """
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            'CREATE TABLE IF NOT EXISTS schema_version ('
+            'id INTEGER PRIMARY KEY CHECK (id = 1), versione INTEGER NOT NULL)'
+        )
+        # Prende subito il lock di scrittura, poi rilegge la versione: se più
+        # worker partono insieme, gli altri attendono e trovano lo schema aggiornato
+        conn.exec_driver_sql('UPDATE schema_version SET versione = versione WHERE id = 1')
+        conn.exec_driver_sql('INSERT OR IGNORE INTO schema_version (id, versione) VALUES (1, 0)')
+        versione = conn.exec_driver_sql('SELECT versione FROM schema_version WHERE id = 1').scalar()
+        if versione >= SCHEMA_VERSION:
+            return []
+
+        db.metadata.create_all(bind=conn)
+        applicati = []
+        for numero, nome, passo in MIGRAZIONI:
+            if numero > versione:
+                passo(conn)
+                applicati.append(f'{numero}: {nome}')
+        conn.execute(text('UPDATE schema_version SET versione = :v WHERE id = 1'), {'v': SCHEMA_VERSION})
+    return applicati
+
+
+def assicura_schema(engine):
+    """Percorso veloce dell'avvio: una sola SELECT se lo schema è già aggiornato."""
+    if versione_corrente(engine) >= SCHEMA_VERSION:
+        return []
+    return applica_migrazioni(engine)
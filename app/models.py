@@ -1,5 +1,6 @@
 from app import db
 from flask_login import UserMixin
+from sqlalchemy import and_, case, event, inspect
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 
@@ -33,6 +34,14 @@ class Cliente(db.Model):
 
 # --- BENI (Tabella separata per beni multipli) ---
 class Bene(db.Model):
+    __table_args__ = (
+        # Idoneità alla fatturazione: GROUP BY lavoro_id sugli stati dei beni
+        # (copre anche le ricerche per solo lavoro_id)
+        db.Index('ix_bene_lavoro_stato', 'lavoro_id', 'stato'),
+        # Lavori con almeno un bene in uno stato (es. 'da incassare', 'abbandonato')
+        db.Index('ix_bene_stato_lavoro', 'stato', 'lavoro_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     lavoro_id = db.Column(db.Integer, db.ForeignKey('lavoro_admin.id'), nullable=False)
     descrizione = db.Column(db.Text, nullable=False)
@@ -44,17 +53,23 @@ class Bene(db.Model):
     motivo_abbandono = db.Column(db.String(100), nullable=True)  # Motivo abbandono: 'assegnato_altro_studio', 'abbandonato_cliente', 'altro'
     commento_abbandono = db.Column(db.Text, nullable=True)  # Commento quando motivo_abbandono è 'altro'
     data_abbandono = db.Column(db.Date, nullable=True)  # Data in cui il bene è stato abbandonato
-    ordine_abbandono = db.Column(db.Integer, nullable=True)  # Ordine progressivo globale di abbandono
+    ordine_abbandono = db.Column(db.Integer, nullable=True, index=True)  # Ordine progressivo globale di abbandono
     
-    lavoro = db.relationship('LavoroAdmin', backref='beni_list')
+    lavoro = db.relationship('LavoroAdmin', backref=db.backref('beni_list', order_by='Bene.ordine'))
 
 # --- LAVORI ADMIN (NUOVO) ---
 class LavoroAdmin(db.Model):
+    __table_args__ = (
+        # Elenchi filtrati per stato / collaboratore e ordinati per numero
+        db.Index('ix_lavoro_admin_stato_numero', 'stato', 'numero'),
+        db.Index('ix_lavoro_admin_collaboratore_numero', 'collaboratore', 'numero'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    numero = db.Column(db.Integer) 
+    numero = db.Column(db.Integer, index=True)
     
     # Anagrafica
-    cliente_id = db.Column(db.Integer, db.ForeignKey('cliente.id'))
+    cliente_id = db.Column(db.Integer, db.ForeignKey('cliente.id'), index=True)
     cliente_rel = db.relationship('Cliente', backref='lavori')
     cliente_nome = db.Column(db.String(150)) 
 
@@ -84,6 +99,11 @@ class LavoroAdmin(db.Model):
     
     # Stato
     stato = db.Column(db.String(50), default='vuoto') 
+
+    # Contatori beni (mantenuti dagli event hook su Bene, vedi fondo file)
+    beni_totali = db.Column(db.Integer, default=0, nullable=False)
+    beni_abbandonati = db.Column(db.Integer, default=0, nullable=False)
+    is_fully_abbandonato = db.Column(db.Boolean, default=False, nullable=False, index=True)  # True se TUTTI i beni sono abbandonati
     
     # Categoria lavoro
     categoria = db.Column(db.String(20))  # 'old', 'iperamm', 'rsid', 'varie'
@@ -157,7 +177,7 @@ class LavoroAdmin(db.Model):
     data_fattura_caricamento = db.Column(db.Date, nullable=True)
     data_fattura_sabatini = db.Column(db.Date, nullable=True)
 
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
 # --- LAVORI BASE (LEGACY) ---
 # Manteniamo questi per far funzionare la dashboard base
@@ -172,7 +192,7 @@ class Lavoro40(db.Model):
     esito = db.Column(db.String(50))
     sollecito = db.Column(db.Boolean, default=False)
     compenso = db.Column(db.Float, default=0.0)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
 class Lavoro50(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -186,24 +206,155 @@ class Lavoro50(db.Model):
     ex_ante = db.Column(db.String(20))
     perc_20 = db.Column(db.Boolean, default=False)
     ex_post = db.Column(db.String(20))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
 # --- NOTE ADMIN (Note condivise tra admin) ---
 class NoteAdmin(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     contenuto = db.Column(db.Text, nullable=False)
     autore_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     autore = db.relationship('User', backref='note_admin')
 
 # --- CHANGELOG (Novità e aggiornamenti) ---
 class Changelog(db.Model):
+    __table_args__ = (
+        # Changelog attivi non ancora visti, in ordine di pubblicazione
+        db.Index('ix_changelog_attivo_ordine', 'attivo', 'ordine'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     versione = db.Column(db.String(50), nullable=False)  # Es: "1.0.0" o "2024-02-16"
     titolo = db.Column(db.String(200), nullable=False)
     contenuto = db.Column(db.Text, nullable=False)  # Markdown o HTML
     data_pubblicazione = db.Column(db.DateTime, default=datetime.utcnow)
     attivo = db.Column(db.Boolean, default=True)  # Se False, non viene mostrato
-    ordine = db.Column(db.Integer, default=0)  # Per ordinare i changelog (più recenti prima)
\ No newline at end of file
+    ordine = db.Column(db.Integer, default=0)  # Per ordinare i changelog (più recenti prima)
+
+# --- DASHBOARD SUMMARY (Totali dashboard admin precalcolati) ---
+class DashboardSummary(db.Model):
+    # Riga unica (id=1) con la somma dei contributi di DashboardContributo,
+    # aggiornata nella transazione dei commit che li modificano: vedi
+    # app/services/dashboard.py
+    id = db.Column(db.Integer, primary_key=True)
+    dati = db.Column(db.JSON, nullable=False)  # Totali e conteggi mostrati in dashboard
+    data_riferimento = db.Column(db.Date, nullable=False)  # Giorno dell'ultimo aggiornamento
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class DashboardContributo(db.Model):
+    # Contributo di un lavoro ai totali della dashboard (senza chiave esterna:
+    # la riga di un lavoro eliminato viene tolta dallo stesso commit)
+    lavoro_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    dati = db.Column(db.JSON, nullable=False)
+
+
+# --- VERSIONI DEI DATI (ETag delle API JSON) ---
+class VersioneDati(db.Model):
+    # Un contatore per dominio ('lavori', 'note', ...) più 'tutti', incrementati
+    # nella transazione di ogni commit che li modifica: vedi app/services/versioni.py
+    dominio = db.Column(db.String(20), primary_key=True)
+    versione = db.Column(db.Integer, nullable=False, default=0)
+
+
+# --- FATTURE ---
+# Vista normalizzata delle colonne f_* / data_fattura_* di LavoroAdmin, che
+# restano la fonte dei dati: Fattura e FatturaRiga vengono riallineate ad ogni
+# flush da app/services/fatture.py.
+
+class Fattura(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('soggetto', 'numero', name='uq_fattura_soggetto_numero'),
+        db.Index('ix_fattura_soggetto_data', 'soggetto', 'data'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    soggetto = db.Column(db.String(20), nullable=False)  # 'fe', 'amin', 'galvan', 'fh', 'bianc', 'deloitte', 'ext', 'revisore', 'caricamento', 'sabatini'
+    numero = db.Column(db.String(50), nullable=False)
+    data = db.Column(db.Date, nullable=True)  # Data fattura del primo lavoro (id più basso)
+    # Aggregati delle righe, così l'elenco paginato delle fatture non le rilegge
+    totale_compensi = db.Column(db.Float, default=0.0)
+    n_lavori = db.Column(db.Integer, default=0)
+    primo_lavoro_id = db.Column(db.Integer, nullable=True)  # Spareggio dell'ordinamento per data
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    righe = db.relationship('FatturaRiga', backref='fattura', order_by='FatturaRiga.lavoro_id')
+
+
+class FatturaRiga(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('lavoro_id', 'soggetto', name='uq_fattura_riga_lavoro_soggetto'),
+        db.Index('ix_fattura_riga_fattura_lavoro', 'fattura_id', 'lavoro_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    fattura_id = db.Column(db.Integer, db.ForeignKey('fattura.id'), nullable=False)
+    lavoro_id = db.Column(db.Integer, db.ForeignKey('lavoro_admin.id'), nullable=False)
+    soggetto = db.Column(db.String(20), nullable=False)  # Copia di Fattura.soggetto (un lavoro ha una sola fattura per soggetto)
+    data = db.Column(db.Date, nullable=True)  # data_fattura_<soggetto> del lavoro
+    compenso = db.Column(db.Float, default=0.0)  # Compenso del soggetto sui beni attivi, ricalcolato a ogni modifica del lavoro
+
+    lavoro = db.relationship('LavoroAdmin')
+
+
+# Elenco fatture paginato: WHERE soggetto = ? ORDER BY data DESC (senza data in
+# fondo), primo_lavoro_id letto direttamente dall'indice
+FATTURA_DATA_ORDINE = db.func.coalesce(Fattura.data, db.literal_column("''"))
+db.Index('ix_fattura_elenco', Fattura.soggetto, FATTURA_DATA_ORDINE.desc(), Fattura.primo_lavoro_id)
+
+
+# --- CONTATORI BENI SU LAVORO ADMIN ---
+# beni_totali / beni_abbandonati / is_fully_abbandonato vengono aggiornati nello
+# stesso flush in cui un Bene viene inserito, eliminato o cambia stato, così le
+# viste non devono più riaggregare l'intera tabella bene ad ogni richiesta.
+
+def _aggiorna_contatori_beni(connection, lavoro_id, delta_totali, delta_abbandonati):
+    if not lavoro_id or (delta_totali == 0 and delta_abbandonati == 0):
+        return
+    t = LavoroAdmin.__table__
+    nuovi_totali = t.c.beni_totali + delta_totali
+    nuovi_abbandonati = t.c.beni_abbandonati + delta_abbandonati
+    connection.execute(
+        t.update()
+        .where(t.c.id == lavoro_id)
+        .values(
+            beni_totali=nuovi_totali,
+            beni_abbandonati=nuovi_abbandonati,
+            is_fully_abbandonato=case(
+                (and_(nuovi_totali > 0, nuovi_abbandonati == nuovi_totali), True),
+                else_=False,
+            ),
+        )
+    )
+
+
+def _valore_persistito(target, attr):
+    """Valore dell'attributo com'era sul DB prima delle modifiche in sospeso."""
+    hist = inspect(target).attrs[attr].history
+    return hist.deleted[0] if hist.deleted else getattr(target, attr)
+
+
+@event.listens_for(Bene, 'after_insert')
+def _bene_after_insert(mapper, connection, target):
+    _aggiorna_contatori_beni(connection, target.lavoro_id, 1, int(target.stato == 'abbandonato'))
+
+
+@event.listens_for(Bene, 'after_delete')
+def _bene_after_delete(mapper, connection, target):
+    lavoro_id = _valore_persistito(target, 'lavoro_id')
+    era_abbandonato = _valore_persistito(target, 'stato') == 'abbandonato'
+    _aggiorna_contatori_beni(connection, lavoro_id, -1, -int(era_abbandonato))
+
+
+@event.listens_for(Bene, 'after_update')
+def _bene_after_update(mapper, connection, target):
+    vecchio_lavoro_id = _valore_persistito(target, 'lavoro_id')
+    era_abbandonato = _valore_persistito(target, 'stato') == 'abbandonato'
+    abbandonato = target.stato == 'abbandonato'
+    if vecchio_lavoro_id != target.lavoro_id:
+        _aggiorna_contatori_beni(connection, vecchio_lavoro_id, -1, -int(era_abbandonato))
+        _aggiorna_contatori_beni(connection, target.lavoro_id, 1, int(abbandonato))
+    elif era_abbandonato != abbandonato:
+        _aggiorna_contatori_beni(connection, target.lavoro_id, 0, 1 if abbandonato else -1)
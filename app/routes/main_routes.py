@@ -1,14 +1,26 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file, current_app, make_response
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file, current_app, get_template_attribute, stream_with_context
 from flask_login import login_required, current_user
-from datetime import datetime
-from sqlalchemy import func
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, or_, select
 from app import db 
 from werkzeug.security import generate_password_hash, check_password_hash
-from app.models import Lavoro40, Lavoro50, LavoroAdmin, User, Cliente, Bene, NoteAdmin, Changelog
-from dateutil.relativedelta import relativedelta
+from app.models import Lavoro40, Lavoro50, LavoroAdmin, User, Cliente, Bene, NoteAdmin, Changelog, Fattura
 from pathlib import Path
-
-from app.utils.offerta_docx import generate_offerta_docx, format_date_it_long
+import tempfile
+
+from app.services.lavori import with_beni, query_lavori_con_beni, criterio_beni_in_stato
+from app.services.autocomplete import suggerimenti
+from app.services.ricerca import cerca as cerca_full_text
+from app.services.versioni import con_etag
+from app.services.eventi import pubblica, stream_eventi
+from app.services.numerazione import esci_da_numerazione, entra_in_numerazione, in_numerazione, riallinea_numerazione
+from app.services.dashboard import get_dashboard_summary
+from app.services.timeline import get_timeline, FINESTRE_MESI
+from app.services.fatture import criterio_fattura, pagina_fatture, righe_fatture
+from app.services.paginazione import (
+    PER_PAGINA_DEFAULT, CursoreNonValido, codifica_cursore, decodifica_cursore, leggi_per_pagina, pagina_keyset
+)
+from app.utils.profilazione import statistiche_endpoint
 
 
 def _recalc_compensi(lavoro, shown_importo, total_importo):
@@ -160,29 +172,58 @@ def _build_beni_list_for_offerta(lavoro: LavoroAdmin) -> list[dict]:
     return beni_list
 
 
-def _generate_offerta_response(*, lavoro: LavoroAdmin, tipo: str) :
-    cliente = Cliente.query.get(lavoro.cliente_id) if lavoro.cliente_id else None
+_TIPI_OFFERTA = ('old', 'iper', 'rsid', 'varie')
+_TIPO_OFFERTA_DA_CATEGORIA = {'old': 'old', 'iperamm': 'iper', 'rsid': 'rsid', 'varie': 'varie'}
+_STATI_OFFERTA_AVANZATI = ['da firmare', 'pec da inviare', 'da fatturare', 'da incassare', 'incassata', 'chiusa']
+_MESI_BREVI = ["", "gen", "feb", "mar", "apr", "mag", "giu", "lug", "ago", "set", "ott", "nov", "dic"]
+
+
+def _resolve_tipo_offerta(lavoro: LavoroAdmin, tipo: str = '') -> str:
+    """Tipo offerta ('old' | 'iper' | 'rsid' | 'varie'); stringa vuota se non determinabile."""
+    tipo = (tipo or '').strip().lower()
+
+    # Se il tipo non è specificato, determinalo dalla categoria
+    if not tipo:
+        # Prima prova con offerta_tipo esistente (per retrocompatibilità)
+        tipo = (getattr(lavoro, 'offerta_tipo', '') or '').strip().lower()
+
+        # Se ancora non c'è, usa la categoria
+        if not tipo:
+            categoria = (getattr(lavoro, 'categoria', '') or '').strip().lower()
+            tipo = _TIPO_OFFERTA_DA_CATEGORIA.get(categoria, '')
+
+    return tipo if tipo in _TIPI_OFFERTA else ''
+
 
+def _template_offerta(lavoro: LavoroAdmin, tipo: str) -> str:
     # Gestione template in base al tipo
     # Per "rsid" non ha variante _amm
     # Per "varie" ha variante _amm se ci sono spese amministrative
     if tipo == 'rsid':
-        template_name = "off_rsid.docx"
-    elif tipo == 'varie':
-        suffix = "_amm" if getattr(lavoro, 'spese_amministrative', False) else ""
-        template_name = f"off_varie{suffix}.docx"
-    else:
-        # Per "old" e "iper" mantieni la logica esistente
-        suffix = "_amm" if getattr(lavoro, 'spese_amministrative', False) else ""
-        template_name = f"off_{tipo}{suffix}.docx"
-    
-    template_path = Path(current_app.root_path) / "doc_templates" / "offerte" / template_name
-    if not template_path.exists():
-        return jsonify({'error': f"Template mancante: {template_name}"}), 404
+        return "off_rsid.docx"
+    # Per "old", "iper" e "varie" mantieni la logica esistente
+    suffix = "_amm" if getattr(lavoro, 'spese_amministrative', False) else ""
+    return f"off_{tipo}{suffix}.docx"
 
-    beni_list = _build_beni_list_for_offerta(lavoro)
 
-    today = datetime.now().date()
+def _sanitize_filename(s: str) -> str:
+    s = (s or "").strip()
+    for ch in ['<', '>', ':', '\"', '/', '\\\\', '|', '?', '*']:
+        s = s.replace(ch, ' ')
+    s = " ".join(s.split())
+    return s
+
+
+def _prepara_offerta(lavoro: LavoroAdmin, tipo: str, cliente, today: date) -> dict:
+    """
+    Raccoglie tutto ciò che serve a generare l'offerta di un lavoro senza
+    modificarlo: template, dati per generate_offerta_docx (solo valori semplici,
+    quindi passabili a un altro processo), revisione e nome del file.
+    """
+    # python-docx viene caricato solo quando serve generare un'offerta
+    from app.utils.offerta_docx import format_date_it_long
+
+    template_name = _template_offerta(lavoro, tipo)
 
     current_rev = int(getattr(lavoro, 'offerta_revision', 0) or 0)
     dirty = bool(getattr(lavoro, 'offerta_dirty', False))
@@ -198,8 +239,7 @@ def _generate_offerta_response(*, lavoro: LavoroAdmin, tipo: str) :
 
     cliente_nome = lavoro.cliente_nome or (cliente.nome if cliente else "")
 
-    buf = generate_offerta_docx(
-        template_path,
+    dati = dict(
         cliente_nome=cliente_nome,
         indirizzo=(cliente.indirizzo if cliente else ""),
         civico=(cliente.civico if cliente else ""),
@@ -211,44 +251,9 @@ def _generate_offerta_response(*, lavoro: LavoroAdmin, tipo: str) :
         importo_caricamento=getattr(lavoro, 'importo_caricamento', 0) or 0,
         importo_revisione=getattr(lavoro, 'importo_revisione', 0) or 0,
         importo_sabatini=getattr(lavoro, 'importo_sabatini', 0) or 0,
-        beni=beni_list,
+        beni=_build_beni_list_for_offerta(lavoro),
     )
 
-    lavoro.data_offerta = today
-    lavoro.data_offerta_check = True
-    lavoro.offerta_tipo = tipo
-    if has_prev_offerta and dirty:
-        lavoro.offerta_revision = rev_to_use
-    lavoro.offerta_dirty = False
-    
-    # Imposta automaticamente lo stato 'da firmare' quando viene generata o revisionata un'offerta
-    # Imposta lo stato a livello di lavoro e di tutti i beni
-    if lavoro.stato not in ['da firmare', 'pec da inviare', 'da fatturare', 'da incassare', 'incassata', 'chiusa']:
-        lavoro.stato = 'da firmare'
-    
-    # Imposta lo stato 'da firmare' per tutti i beni che non hanno già uno stato avanzato
-    if lavoro.beni_list:
-        for bene in lavoro.beni_list:
-            if bene.stato == 'abbandonato':
-                continue
-            if bene.stato not in ['da firmare', 'pec da inviare', 'da fatturare', 'da incassare', 'incassata', 'chiusa']:
-                bene.stato = 'da firmare'
-    elif lavoro.stato == 'da firmare' and not lavoro.beni_list:
-        # Se non ci sono beni nella tabella separata, lo stato è già stato impostato a livello di lavoro
-        pass
-    
-    db.session.commit()
-
-    mesi = ["", "gen", "feb", "mar", "apr", "mag", "giu", "lug", "ago", "set", "ott", "nov", "dic"]
-    data_breve = f"{today.day:02d}-{mesi[today.month]}"
-
-    def sanitize_filename(s: str) -> str:
-        s = (s or "").strip()
-        for ch in ['<', '>', ':', '\"', '/', '\\\\', '|', '?', '*']:
-            s = s.replace(ch, ' ')
-        s = " ".join(s.split())
-        return s
-
     # Determina il suffisso del nome file in base al tipo
     if tipo == 'rsid':
         tipo_suffix = 'RSID'
@@ -256,23 +261,71 @@ def _generate_offerta_response(*, lavoro: LavoroAdmin, tipo: str) :
         tipo_suffix = 'VARIE'
     else:
         tipo_suffix = '4.0'  # Per "old" e "iper"
-    
-    base_name = f"Prev. First Eng_{sanitize_filename(cliente_nome)}_{tipo_suffix}"
+
+    base_name = f"Prev. First Eng_{_sanitize_filename(cliente_nome)}_{tipo_suffix}"
     if rev_to_use > 0:
         base_name = f"{base_name} (Rev. {rev_to_use})"
 
     # Prefisso data AAAAMMGG del giorno di generazione / revisione offerta
     date_prefix = today.strftime("%Y%m%d")
-    download_name = f"{date_prefix}_{base_name}.docx"
+
+    return {
+        'template_name': template_name,
+        'template_path': Path(current_app.root_path) / "doc_templates" / "offerte" / template_name,
+        'dati': dati,
+        'rev_to_use': rev_to_use,
+        'bump_revision': has_prev_offerta and dirty,
+        'download_name': f"{date_prefix}_{base_name}.docx",
+        'data_breve': f"{today.day:02d}-{_MESI_BREVI[today.month]}",
+    }
+
+
+def _applica_stato_offerta(lavoro: LavoroAdmin, tipo: str, offerta: dict, today: date) -> None:
+    """Registra sul lavoro (senza commit) l'offerta generata da _prepara_offerta."""
+    lavoro.data_offerta = today
+    lavoro.data_offerta_check = True
+    lavoro.offerta_tipo = tipo
+    if offerta['bump_revision']:
+        lavoro.offerta_revision = offerta['rev_to_use']
+    lavoro.offerta_dirty = False
+
+    # Imposta automaticamente lo stato 'da firmare' quando viene generata o revisionata un'offerta
+    # Imposta lo stato a livello di lavoro e di tutti i beni
+    if lavoro.stato not in _STATI_OFFERTA_AVANZATI:
+        lavoro.stato = 'da firmare'
+
+    # Imposta lo stato 'da firmare' per tutti i beni che non hanno già uno stato avanzato
+    # (senza beni nella tabella separata lo stato è già stato impostato a livello di lavoro)
+    for bene in lavoro.beni_list or []:
+        if bene.stato == 'abbandonato':
+            continue
+        if bene.stato not in _STATI_OFFERTA_AVANZATI:
+            bene.stato = 'da firmare'
+
+
+def _generate_offerta_response(*, lavoro: LavoroAdmin, tipo: str) :
+    from app.utils.offerta_docx import generate_offerta_docx
+
+    cliente = Cliente.query.get(lavoro.cliente_id) if lavoro.cliente_id else None
+    today = datetime.now().date()
+
+    offerta = _prepara_offerta(lavoro, tipo, cliente, today)
+    if not offerta['template_path'].exists():
+        return jsonify({'error': f"Template mancante: {offerta['template_name']}"}), 404
+
+    buf = generate_offerta_docx(offerta['template_path'], **offerta['dati'])
+
+    _applica_stato_offerta(lavoro, tipo, offerta, today)
+    db.session.commit()
 
     resp = send_file(
         buf,
         mimetype="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
         as_attachment=True,
-        download_name=download_name,
+        download_name=offerta['download_name'],
     )
-    resp.headers["X-Offerta-Data-Breve"] = data_breve
-    resp.headers["X-Offerta-Revision"] = str(rev_to_use)
+    resp.headers["X-Offerta-Data-Breve"] = offerta['data_breve']
+    resp.headers["X-Offerta-Revision"] = str(offerta['rev_to_use'])
     return resp
 
 bp = Blueprint('main', __name__)
@@ -280,57 +333,10 @@ bp = Blueprint('main', __name__)
 @bp.route('/dashboard')
 @login_required
 def dashboard():
-    # --- HELPER PER TIMELINE (Ultimi 3 mesi) ---
-    def get_timeline_data(model_list):
-        # model_list è una lista di classi DB da interrogare (es. [Lavoro40, Lavoro50])
-        now = datetime.now()
-        months_data = []
-        colors = ['var(--primary)', '#ff9f43', '#00A651'] # Blu, Arancio, Verde
-        
-        # Calcoliamo per mese corrente (0), mese scorso (1), due mesi fa (2)
-        max_count = 0
-        for i in range(3):
-            # Data di inizio e fine del mese 'i'
-            target_date = now - relativedelta(months=i)
-            month_name = target_date.strftime('%B') # Nome mese (es. October)
-            
-            # Traduzione semplice (opzionale, o usa locale)
-            mesi_it = {'January':'Gen', 'February':'Feb', 'March':'Mar', 'April':'Apr', 'May':'Mag', 'June':'Giu',
-                       'July':'Lug', 'August':'Ago', 'September':'Set', 'October':'Ott', 'November':'Nov', 'December':'Dic'}
-            month_label = mesi_it.get(month_name, month_name)
-
-            # Conta lavori creati in quel mese e anno
-            count = 0
-            for model in model_list:
-                # Metodo semplice compatibile con tutto:
-                start_dt = datetime(target_date.year, target_date.month, 1)
-                if target_date.month == 12:
-                    end_dt = datetime(target_date.year + 1, 1, 1)
-                else:
-                    end_dt = datetime(target_date.year, target_date.month + 1, 1)
-                
-                # Nota: Assicurarsi che i modelli abbiano il campo created_at, altrimenti usare data_contatto o simile
-                if hasattr(model, 'created_at'):
-                    c = model.query.filter(model.created_at >= start_dt, model.created_at < end_dt).count()
-                    count += c
-
-            if count > max_count:
-                max_count = count
-            
-            months_data.append({
-                'label': month_label,
-                'count': count,
-                'color': colors[i]
-            })
-        
-        # Calcolo percentuali larghezza barre
-        for m in months_data:
-            if max_count > 0:
-                m['width'] = (m['count'] / max_count) * 100
-            else:
-                m['width'] = 0
-                
-        return months_data 
+    # --- TIMELINE: finestra in mesi (3 di default, oppure 12 / 24) ---
+    timeline_mesi = request.args.get('mesi', 3, type=int)
+    if timeline_mesi not in FINESTRE_MESI:
+        timeline_mesi = 3
 
     # --- LOGICA DASHBOARD ---
     timeline = []
@@ -338,133 +344,11 @@ def dashboard():
     # --- LOGICA PER ADMIN ---
     if current_user.role == 'admin':
         # TIMELINE ADMIN (Basata su LavoroAdmin)
-        timeline = get_timeline_data([LavoroAdmin])
-        
-        # 1. Calcolo Fatturati (Widget Rosso)
-        # ESCLUDI solo i lavori con TUTTI i beni abbandonati dai calcoli.
-        # Lavori parzialmente abbandonati restano inclusi.
-        from sqlalchemy import func as sql_func_dash
-        total_beni_dash = db.session.query(
-            Bene.lavoro_id,
-            sql_func_dash.count(Bene.id).label('total')
-        ).group_by(Bene.lavoro_id).subquery()
-        abandoned_beni_dash = db.session.query(
-            Bene.lavoro_id,
-            sql_func_dash.count(Bene.id).label('abandoned')
-        ).filter(Bene.stato == 'abbandonato').group_by(Bene.lavoro_id).subquery()
-        lavori_ids_fully_abbandonati = [row[0] for row in db.session.query(total_beni_dash.c.lavoro_id)
-            .join(abandoned_beni_dash, total_beni_dash.c.lavoro_id == abandoned_beni_dash.c.lavoro_id)
-            .filter(total_beni_dash.c.total == abandoned_beni_dash.c.abandoned)
-            .all()]
-        
-        # --- IMPORTI E COMPENSI (ricalcolati escludendo beni abbandonati) ---
-        set_fully_abb = set(lavori_ids_fully_abbandonati)
-        all_lavori_db = LavoroAdmin.query.all()
-
-        tot_importo = 0
-        tot_importo_da_fatturare = 0
-        tot_importo_incassata = 0
-
-        tot_fe = 0
-        tot_amin = 0
-        tot_galvan = 0
-        tot_fh = 0
-        tot_fe_incassata = 0
-        tot_amin_incassata = 0
-        tot_galvan_incassata = 0
-        tot_fh_incassata = 0
-        tot_fe_fatturato = 0
-        tot_amin_fatturato = 0
-        tot_galvan_fatturato = 0
-        tot_fh_fatturato = 0
-
-        for lavoro in all_lavori_db:
-            if lavoro.id in set_fully_abb:
-                continue
-
-            all_beni = lavoro.beni_list or []
-            beni_attivi = [b for b in all_beni if b.stato != 'abbandonato']
-            if all_beni:
-                shown_importo = sum((b.importo_offerta or 0) for b in beni_attivi)
-            else:
-                shown_importo = lavoro.importo_offerta or 0
-
-            tot_importo += shown_importo
-
-            comp = _active_compensi(lavoro)
-            c_fe = comp['c_fe']
-            c_amin = comp['c_amin']
-            c_galvan = comp['c_galvan']
-            c_fh = comp['c_fh']
-
-            tot_fe += c_fe
-            tot_amin += c_amin
-            tot_galvan += c_galvan
-            tot_fh += c_fh
-
-            is_chiusa = lavoro.stato == 'chiusa'
-
-            if is_chiusa:
-                tot_importo_incassata += shown_importo
-            elif beni_attivi:
-                all_da_fatturare = all(b.stato == 'da fatturare' for b in beni_attivi)
-                all_incassata = all(b.stato == 'incassata' for b in beni_attivi)
-                if all_da_fatturare:
-                    tot_importo_da_fatturare += shown_importo
-                if all_incassata:
-                    tot_importo_incassata += shown_importo
-                    if not (lavoro.f_amin and str(lavoro.f_amin).strip()):
-                        tot_amin_incassata += c_amin
-                    if not (lavoro.f_galvan and str(lavoro.f_galvan).strip()):
-                        tot_galvan_incassata += c_galvan
-                    if not (lavoro.f_fh and str(lavoro.f_fh).strip()):
-                        tot_fh_incassata += c_fh
-
-            has_f_fe = bool(lavoro.f_fe and str(lavoro.f_fe).strip())
-            if has_f_fe or is_chiusa:
-                tot_fe_fatturato += c_fe
-            if bool(lavoro.f_amin and str(lavoro.f_amin).strip()) or is_chiusa:
-                tot_amin_fatturato += c_amin
-            if bool(lavoro.f_galvan and str(lavoro.f_galvan).strip()) or is_chiusa:
-                tot_galvan_fatturato += c_galvan
-            if bool(lavoro.f_fh and str(lavoro.f_fh).strip()) or is_chiusa:
-                tot_fh_fatturato += c_fh
+        timeline = get_timeline([LavoroAdmin], timeline_mesi)
         
-        # Conteggi lavori
-        # Escludi solo lavori con TUTTI i beni abbandonati (non quelli parzialmente abbandonati)
-        query_lavori_attivi = LavoroAdmin.query.filter(LavoroAdmin.stato != 'chiusa')
-        if lavori_ids_fully_abbandonati:
-            query_lavori_attivi = query_lavori_attivi.filter(~LavoroAdmin.id.in_(lavori_ids_fully_abbandonati))
-        total_lavori = query_lavori_attivi.count()
-        
-        stati_esclusi_in_lavorazione = [
-            'abbandonato',
-            'chiusa',
-            'da firmare',
-            'da fatturare',
-            'da incassare',
-            'incassata',
-        ]
-        lavori_ids_in_lavorazione = [
-            row[0]
-            for row in db.session.query(LavoroAdmin.id)
-                                 .distinct()
-                                 .join(Bene, LavoroAdmin.id == Bene.lavoro_id)
-                                 .filter(
-                                     LavoroAdmin.stato != 'chiusa',
-                                     ~LavoroAdmin.id.in_(lavori_ids_fully_abbandonati)
-                                     if lavori_ids_fully_abbandonati
-                                     else True,
-                                     ~Bene.stato.in_(stati_esclusi_in_lavorazione),
-                                 )
-                                 .all()
-        ]
-        in_corso = len(set(lavori_ids_in_lavorazione))
-        
-        completati = LavoroAdmin.query.filter(LavoroAdmin.stato == 'chiusa').count()
-        
-        # Abbandonati: conta i singoli beni con stato "abbandonato"
-        abbandonati = db.session.query(func.count(Bene.id)).filter(Bene.stato == 'abbandonato').scalar() or 0
+        # Totali, conteggi e "da incassare" dalla riga precalcolata
+        # (aggiornata ad ogni commit che modifica lavori o beni)
+        summary = get_dashboard_summary()
         
         # Recupera tutte le note per la card (scrollabile)
         tutte_note = NoteAdmin.query.order_by(NoteAdmin.created_at.desc()).all()
@@ -476,58 +360,15 @@ def dashboard():
             NoteAdmin.autore_id != current_user.id
         ).count()
         
-        # --- CALCOLO LAVORI DA INCASSARE (Fatturati FE ma non ancora incassati) ---
-        today = datetime.now().date()
-        # Lavori con almeno un bene con stato "da incassare" (escludi abbandonati)
-        lavori_ids_da_incassare = [row[0] for row in db.session.query(LavoroAdmin.id).distinct().join(Bene, LavoroAdmin.id == Bene.lavoro_id).filter(
-            Bene.stato == 'da incassare',
-            Bene.stato != 'abbandonato'
-        ).all()]
-        if lavori_ids_da_incassare:
-            lavori_da_incassare = LavoroAdmin.query.filter(LavoroAdmin.id.in_(lavori_ids_da_incassare)).all()
-        else:
-            lavori_da_incassare = []
-        da_incassare_totale = len(lavori_da_incassare)
-        
-        importo_da_incassare = 0
-        for l in lavori_da_incassare:
-            active_beni = [b for b in (l.beni_list or []) if b.stato != 'abbandonato']
-            if active_beni:
-                importo_da_incassare += sum((b.importo_offerta or 0) for b in active_beni)
-            else:
-                importo_da_incassare += l.importo_offerta or 0
-        
-        # Conteggio per settimane di ritardo (dalla data fattura FE)
-        da_incassare_2w = 0
-        da_incassare_3w = 0
-        da_incassare_4w = 0
-        for lavoro in lavori_da_incassare:
-            if lavoro.data_fattura_fe:
-                giorni = (today - lavoro.data_fattura_fe).days
-                if giorni >= 28:  # 4+ settimane
-                    da_incassare_4w += 1
-                elif giorni >= 21:  # 3+ settimane
-                    da_incassare_3w += 1
-                elif giorni >= 14:  # 2+ settimane
-                    da_incassare_2w += 1
-        
         return render_template('main/dashboard.html',
                                role='admin',
-                               tot_importo=tot_importo, tot_importo_da_fatturare=tot_importo_da_fatturare, 
-                               tot_importo_incassata=tot_importo_incassata,
-                               tot_fe=tot_fe, tot_amin=tot_amin, tot_galvan=tot_galvan, tot_fh=tot_fh,
-                               tot_fe_incassata=tot_fe_incassata, tot_amin_incassata=tot_amin_incassata, 
-                               tot_galvan_incassata=tot_galvan_incassata, tot_fh_incassata=tot_fh_incassata,
-                               tot_fe_fatturato=tot_fe_fatturato, tot_amin_fatturato=tot_amin_fatturato,
-                               tot_galvan_fatturato=tot_galvan_fatturato, tot_fh_fatturato=tot_fh_fatturato,
-                               total_lavori=total_lavori, in_corso=in_corso, completati=completati, abbandonati=abbandonati,
-                               timeline=timeline, tutte_note=tutte_note, nuove_note_count=nuove_note_count,
-                               da_incassare_totale=da_incassare_totale, importo_da_incassare=importo_da_incassare,
-                               da_incassare_2w=da_incassare_2w, da_incassare_3w=da_incassare_3w, da_incassare_4w=da_incassare_4w)
+                               timeline=timeline, timeline_mesi=timeline_mesi,
+                               tutte_note=tutte_note, nuove_note_count=nuove_note_count,
+                               **summary)
 
     else:
         # TIMELINE BASE (Basata su Lavoro40 + Lavoro50)
-        timeline = get_timeline_data([Lavoro40, Lavoro50])
+        timeline = get_timeline([Lavoro40, Lavoro50], timeline_mesi)
         # Conteggi totali
         count_40 = Lavoro40.query.count()
         count_50 = Lavoro50.query.count()
@@ -540,13 +381,14 @@ def dashboard():
         return render_template('main/dashboard.html', 
                                role='base',
                                total_lavori=total_lavori, in_corso=in_corso, completati=completati, fatturato=fatturato_totale,
-                               timeline=timeline)
+                               timeline=timeline, timeline_mesi=timeline_mesi)
 
 # --- API E ROTTE ADMIN (NUOVE FUNZIONALITÀ) ---
 
 # --- API DA INCASSARE (Dashboard Card) ---
 @bp.route('/api/da-incassare')
 @login_required
+@con_etag('lavori', giornaliero=True)
 def api_da_incassare():
     """Restituisce i lavori da incassare con filtro per settimane di ritardo"""
     if current_user.role != 'admin':
@@ -561,7 +403,7 @@ def api_da_incassare():
         Bene.stato != 'abbandonato'
     ).all()]
     if lavori_ids_da_incassare:
-        lavori = LavoroAdmin.query.filter(LavoroAdmin.id.in_(lavori_ids_da_incassare)).order_by(LavoroAdmin.numero.asc()).all()
+        lavori = query_lavori_con_beni(LavoroAdmin.id.in_(lavori_ids_da_incassare)).order_by(LavoroAdmin.numero.asc()).all()
     else:
         lavori = []
     
@@ -618,25 +460,25 @@ def api_da_incassare():
     return jsonify({'lavori': result, 'totale': len(result)})
 
 # --- API NOTE ADMIN ---
+def _nota_json(nota):
+    return {
+        'id': nota.id,
+        'contenuto': nota.contenuto,
+        'autore': nota.autore.username,
+        'created_at': nota.created_at.strftime('%d/%m/%Y %H:%M'),
+        'updated_at': nota.updated_at.strftime('%d/%m/%Y %H:%M') if nota.updated_at else None
+    }
+
 @bp.route('/api/note', methods=['GET'])
 @login_required
+@con_etag('note', 'utenti')
 def api_note():
     """Restituisce tutte le note in ordine cronologico (più recenti prima)"""
     if current_user.role != 'admin':
         return jsonify({'error': 'Accesso negato'}), 403
     
     note = NoteAdmin.query.order_by(NoteAdmin.created_at.desc()).all()
-    note_list = []
-    for nota in note:
-        note_list.append({
-            'id': nota.id,
-            'contenuto': nota.contenuto,
-            'autore': nota.autore.username,
-            'created_at': nota.created_at.strftime('%d/%m/%Y %H:%M'),
-            'updated_at': nota.updated_at.strftime('%d/%m/%Y %H:%M') if nota.updated_at else None
-        })
-    
-    return jsonify({'note': note_list})
+    return jsonify({'note': [_nota_json(nota) for nota in note]})
 
 @bp.route('/api/note', methods=['POST'])
 @login_required
@@ -659,13 +501,9 @@ def api_note_create():
     db.session.add(nuova_nota)
     db.session.commit()
     
-    return jsonify({
-        'id': nuova_nota.id,
-        'contenuto': nuova_nota.contenuto,
-        'autore': nuova_nota.autore.username,
-        'created_at': nuova_nota.created_at.strftime('%d/%m/%Y %H:%M'),
-        'updated_at': nuova_nota.updated_at.strftime('%d/%m/%Y %H:%M') if nuova_nota.updated_at else None
-    }), 201
+    dati = _nota_json(nuova_nota)
+    pubblica('nota', {'azione': 'creata', 'nota': dati, 'utente_id': current_user.id})
+    return jsonify(dati), 201
 
 @bp.route('/api/note/<int:note_id>', methods=['PUT'])
 @login_required
@@ -686,13 +524,9 @@ def api_note_update(note_id):
     
     db.session.commit()
     
-    return jsonify({
-        'id': nota.id,
-        'contenuto': nota.contenuto,
-        'autore': nota.autore.username,
-        'created_at': nota.created_at.strftime('%d/%m/%Y %H:%M'),
-        'updated_at': nota.updated_at.strftime('%d/%m/%Y %H:%M') if nota.updated_at else None
-    })
+    dati = _nota_json(nota)
+    pubblica('nota', {'azione': 'modificata', 'nota': dati, 'utente_id': current_user.id})
+    return jsonify(dati)
 
 @bp.route('/api/note/<int:note_id>', methods=['DELETE'])
 @login_required
@@ -705,6 +539,7 @@ def api_note_delete(note_id):
     db.session.delete(nota)
     db.session.commit()
     
+    pubblica('nota', {'azione': 'eliminata', 'nota': {'id': note_id}, 'utente_id': current_user.id})
     return jsonify({'message': 'Nota eliminata con successo'}), 200
 
 @bp.route('/api/note/mark-seen', methods=['POST'])
@@ -724,6 +559,7 @@ def api_note_mark_seen():
 # --- API CHANGELOG ---
 @bp.route('/api/changelog', methods=['GET'])
 @login_required
+@con_etag('changelog', 'utenti')
 def api_changelog():
     """Restituisce tutti i changelog non visti dall'utente, dal più vecchio al più recente (solo per admin)"""
     if current_user.role != 'admin':
@@ -768,6 +604,7 @@ def api_changelog_dismiss():
 
 @bp.route('/api/changelog/all', methods=['GET'])
 @login_required
+@con_etag('changelog')
 def api_changelog_all():
     """Restituisce tutti i changelog (solo per admin, per gestione)"""
     if current_user.role != 'admin':
@@ -798,6 +635,7 @@ def api_changelog_create():
     data = request.get_json()
     changelog_id = data.get('id')
     
+    azione = 'modificato' if changelog_id else 'creato'
     if changelog_id:
         # Update
         changelog = Changelog.query.get_or_404(changelog_id)
@@ -819,7 +657,7 @@ def api_changelog_create():
     
     db.session.commit()
     
-    return jsonify({
+    dati = {
         'id': changelog.id,
         'versione': changelog.versione,
         'titolo': changelog.titolo,
@@ -827,7 +665,29 @@ def api_changelog_create():
         'data_pubblicazione': changelog.data_pubblicazione.strftime('%d/%m/%Y'),
         'attivo': changelog.attivo,
         'ordine': changelog.ordine
-    })
+    }
+    pubblica('changelog', {'azione': azione, 'changelog': dati, 'utente_id': current_user.id})
+    return jsonify(dati)
+
+# --- EVENTI IN TEMPO REALE (note e changelog) ---
+@bp.route('/api/eventi')
+@login_required
+def api_eventi():
+    """Stream Server-Sent Events di note e changelog per gli admin (app/services/eventi.py)."""
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Accesso negato'}), 403
+    if not current_app.config['EVENTI_SSE']:
+        # 204: EventSource smette di riconnettersi
+        return '', 204
+
+    # Lo stream resta aperto a lungo: la connessione della sessione torna subito al pool
+    db.session.close()
+    eventi = stream_eventi(current_app.config['EVENTI_SSE_INTERVALLO'], current_app.config['EVENTI_SSE_DURATA'])
+    return current_app.response_class(
+        stream_with_context(eventi),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
 
 @bp.route('/api/clienti')
 @login_required
@@ -835,123 +695,82 @@ def api_clienti():
     query = request.args.get('q', '')
     if len(query) < 2:
         return jsonify([])
-    # Cerca clienti simili
-    clienti = Cliente.query.filter(Cliente.nome.ilike(f'%{query}%')).limit(10).all()
-    results = []
-    for c in clienti:
-        results.append({
-            'nome': c.nome,
-            'p_iva': c.p_iva,
-            'indirizzo': c.indirizzo,
-            'civico': c.civico,
-            'cap': c.cap,
-            'comune': c.comune,
-            'provincia': c.provincia,
-            'pec': c.pec
-        })
-    return jsonify(results)
+    # Clienti simili dall'indice in memoria (app/services/autocomplete.py)
+    return jsonify(suggerimenti('clienti', query))
+
+# Stati dei beni che escludono un lavoro dalla vista "in lavorazione"
+_STATI_ESCLUSI_IN_LAVORAZIONE = [
+    'abbandonato',
+    'chiusa',
+    'da firmare',
+    'da fatturare',
+    'da incassare',
+    'incassata',
+]
+
+# Lavori abbandonati senza ordine_abbandono: in fondo all'elenco (NULLS LAST)
+_ORDINE_ABBANDONO_NULL = 2 ** 62
+
+# Tabelle di lavori_admin.html (macro in main/_lavori_admin_righe.html) per view_mode
+_RIGHE_PER_VIEW_MODE = {
+    'standard': ('standard', 'standard_compensi', 'standard_fatture', 'standard_extra'),
+    'extra1': ('extra1',),
+    'extra2': ('focus', 'focus_compensi', 'focus_fatture'),
+    'focus_special': ('focus', 'focus_compensi', 'focus_fatture'),
+}
+
+
+def _lavori_admin_query(filtro_stato):
+    """
+    Query su LavoroAdmin (beni precaricati) per un filtro_stato di lavori_admin,
+    con le chiavi di ordinamento usate per la paginazione keyset.
+    """
+    per_numero = (func.coalesce(LavoroAdmin.numero, 0), LavoroAdmin.id)
 
-@bp.route('/lavori_admin')
-@login_required
-def lavori_admin():
-    if current_user.role != 'admin':
-        return redirect(url_for('main.dashboard'))
-        
-    view_mode = current_user.admin_view_mode
-    if view_mode == 'extra2':
-        view_mode = 'standard'
-    
-    # Filtro per stato (se passato come parametro)
-    filtro_stato = request.args.get('filtro_stato', '').lower()
-    
-    # Query base
     if filtro_stato == 'in_lavorazione':
-        stati_esclusi_in_lavorazione = [
-            'abbandonato',
-            'chiusa',
-            'da firmare',
-            'da fatturare',
-            'da incassare',
-            'incassata',
-        ]
-        lavori_ids_in_lavorazione = [
-            row[0]
-            for row in db.session.query(LavoroAdmin.id)
-                                 .distinct()
-                                 .join(Bene, LavoroAdmin.id == Bene.lavoro_id)
-                                 .filter(
-                                     LavoroAdmin.stato != 'chiusa',
-                                     ~Bene.stato.in_(stati_esclusi_in_lavorazione),
-                                 )
-                                 .all()
-        ]
-        if lavori_ids_in_lavorazione:
-            lavori = (
-                LavoroAdmin.query.filter(
-                    LavoroAdmin.id.in_(lavori_ids_in_lavorazione)
-                )
-                .order_by(LavoroAdmin.numero.asc())
-                .all()
-            )
-        else:
-            lavori = []
-    elif filtro_stato == 'da_incassare':
-        lavori_ids_da_incassare = [row[0] for row in db.session.query(LavoroAdmin.id).distinct().join(Bene, LavoroAdmin.id == Bene.lavoro_id).filter(
-            Bene.stato == 'da incassare'
-        ).all()]
-        if lavori_ids_da_incassare:
-            lavori = LavoroAdmin.query.filter(LavoroAdmin.id.in_(lavori_ids_da_incassare)).order_by(LavoroAdmin.numero.asc()).all()
-        else:
-            lavori = []
-    elif filtro_stato == 'completati':
-        lavori = LavoroAdmin.query.filter(LavoroAdmin.stato == 'chiusa').order_by(LavoroAdmin.id.asc()).all()
-    elif filtro_stato == 'abbandonati':
-        from sqlalchemy import func as sql_func
-
+        ids_in_lavorazione = select(Bene.lavoro_id).where(~Bene.stato.in_(_STATI_ESCLUSI_IN_LAVORAZIONE))
+        query = query_lavori_con_beni(
+            LavoroAdmin.stato != 'chiusa',
+            LavoroAdmin.id.in_(ids_in_lavorazione),
+        )
+        return query, per_numero
+    if filtro_stato == 'da_incassare':
+        ids_da_incassare = select(Bene.lavoro_id).where(Bene.stato == 'da incassare')
+        return query_lavori_con_beni(LavoroAdmin.id.in_(ids_da_incassare)), per_numero
+    if filtro_stato == 'completati':
+        return query_lavori_con_beni(LavoroAdmin.stato == 'chiusa'), (LavoroAdmin.id,)
+    if filtro_stato == 'abbandonati':
         subquery = (
             db.session.query(
                 Bene.lavoro_id,
-                sql_func.min(Bene.ordine_abbandono).label("min_ordine_abbandono"),
+                func.min(Bene.ordine_abbandono).label("min_ordine_abbandono"),
             )
             .filter(Bene.stato == "abbandonato")
             .group_by(Bene.lavoro_id)
             .subquery()
         )
-
-        lavori = (
-            db.session.query(LavoroAdmin)
+        query = (
+            with_beni(db.session.query(LavoroAdmin))
             .join(subquery, LavoroAdmin.id == subquery.c.lavoro_id)
-            .order_by(subquery.c.min_ordine_abbandono.asc().nulls_last())
-            .all()
         )
-    else:
-        # Mostra tutti i lavori ESCLUSI quelli chiusi e quelli con TUTTI i beni abbandonati.
-        # Lavori con solo alcuni beni abbandonati restano visibili (mostrando solo i beni attivi).
-        from sqlalchemy import func as sql_func
-        total_beni_sq = db.session.query(
-            Bene.lavoro_id,
-            sql_func.count(Bene.id).label('total')
-        ).group_by(Bene.lavoro_id).subquery()
-        abandoned_beni_sq = db.session.query(
-            Bene.lavoro_id,
-            sql_func.count(Bene.id).label('abandoned')
-        ).filter(Bene.stato == 'abbandonato').group_by(Bene.lavoro_id).subquery()
-        lavori_ids_fully_abbandonati = [row[0] for row in db.session.query(total_beni_sq.c.lavoro_id)
-            .join(abandoned_beni_sq, total_beni_sq.c.lavoro_id == abandoned_beni_sq.c.lavoro_id)
-            .filter(total_beni_sq.c.total == abandoned_beni_sq.c.abandoned)
-            .all()]
-        lavori = LavoroAdmin.query.filter(
-            LavoroAdmin.stato != 'chiusa',
-            ~LavoroAdmin.id.in_(lavori_ids_fully_abbandonati) if lavori_ids_fully_abbandonati else True
-        ).order_by(LavoroAdmin.numero.asc()).all()
-    
+        return query, (func.coalesce(subquery.c.min_ordine_abbandono, _ORDINE_ABBANDONO_NULL), LavoroAdmin.id)
+
+    # Mostra tutti i lavori ESCLUSI quelli chiusi e quelli con TUTTI i beni abbandonati.
+    # Lavori con solo alcuni beni abbandonati restano visibili (mostrando solo i beni attivi).
+    query = query_lavori_con_beni(
+        LavoroAdmin.stato != 'chiusa',
+        LavoroAdmin.is_fully_abbandonato == False
+    )
+    return query, per_numero
+
+
+def _build_lavori_admin_rows(lavori, filtro_stato, sequential_num=0):
     # Carica i beni per ogni lavoro e crea una lista di dizionari per il template.
     # Per la vista "abbandonati" mostra solo i beni abbandonati;
     # per tutte le altre viste (tranne completati) filtra via i beni abbandonati.
     # I compensi automatici (FE, AMIN, GALVAN, FH) vengono ricalcolati in proporzione
     # agli importi dei beni mostrati; revisore, caricamento ed esterno restano invariati.
     lavori_with_beni = []
-    sequential_num = 0
     for lavoro in lavori:
         all_beni_objs = sorted(lavoro.beni_list, key=lambda x: x.ordine) if lavoro.beni_list else []
         beni_list = []
@@ -1004,8 +823,203 @@ def lavori_admin():
             **compensi,
         })
     
-    return render_template('main/lavori_admin.html', lavori_with_beni=lavori_with_beni, view_mode=view_mode, filtro_stato=filtro_stato or '')
+    return lavori_with_beni, sequential_num
+
+
+def _lavori_admin_pagina(filtro_stato, cursore=None, per_pagina=PER_PAGINA_DEFAULT):
+    """
+    Una pagina di lavori_admin: righe nella struttura di lavori_with_beni e
+    cursore della pagina successiva (None se è l'ultima). Il cursore porta la
+    chiave keyset dell'ultimo lavoro e il contatore usato per la numerazione
+    progressiva delle viste completati/abbandonati.
+    """
+    query, chiavi = _lavori_admin_query(filtro_stato)
+    dati = decodifica_cursore(cursore)
+    dopo, sequential_num = None, 0
+    if dati is not None:
+        dopo, sequential_num = dati['k'], dati.get('s', 0)
+        if len(dopo) != len(chiavi) or not isinstance(sequential_num, int):
+            raise CursoreNonValido('cursore non compatibile con il filtro')
+
+    lavori, ultima, altre_pagine = pagina_keyset(query, chiavi, dopo, per_pagina)
+    lavori_with_beni, sequential_num = _build_lavori_admin_rows(lavori, filtro_stato, sequential_num)
+    next_cursor = codifica_cursore({'k': ultima, 's': sequential_num}) if altre_pagine else None
+    return lavori_with_beni, next_cursor
+
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d')
+    return value
+
+
+def _serialize_lavori_admin_row(item):
+    """Versione JSON di una riga di lavori_with_beni."""
+    lavoro = item['lavoro']
+    return {
+        **{k: v for k, v in item.items() if k not in ('lavoro', 'beni')},
+        'lavoro': {c.name: _json_value(getattr(lavoro, c.name)) for c in LavoroAdmin.__table__.columns},
+        'beni': [{k: _json_value(v) for k, v in bene.items()} for bene in item['beni']],
+    }
+
+
+@bp.route('/lavori_admin')
+@login_required
+def lavori_admin():
+    if current_user.role != 'admin':
+        return redirect(url_for('main.dashboard'))
+        
+    view_mode = current_user.admin_view_mode
+    if view_mode == 'extra2':
+        view_mode = 'standard'
     
+    # Filtro per stato (se passato come parametro)
+    filtro_stato = request.args.get('filtro_stato', '').lower()
+    per_pagina = leggi_per_pagina(request.args.get('per_pagina'))
+
+    # Solo la prima pagina: le successive arrivano da /api/lavori_admin/pagina durante lo scroll
+    lavori_with_beni, next_cursor = _lavori_admin_pagina(filtro_stato, per_pagina=per_pagina)
+
+    return render_template('main/lavori_admin.html', lavori_with_beni=lavori_with_beni, view_mode=view_mode, filtro_stato=filtro_stato or '',
+                           next_cursor=next_cursor, per_pagina=per_pagina)
+
+
+@bp.route('/api/lavori_admin/pagina')
+@login_required
+@con_etag('lavori', 'utenti')
+def api_lavori_admin_pagina():
+    """Pagina successiva di lavori_admin: righe in JSON e HTML da accodare a ogni tabella."""
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    view_mode = current_user.admin_view_mode
+    if view_mode == 'extra2':
+        view_mode = 'standard'
+    view_mode = request.args.get('view_mode', view_mode)
+
+    filtro_stato = request.args.get('filtro_stato', '').lower()
+    per_pagina = leggi_per_pagina(request.args.get('per_pagina'))
+    try:
+        lavori_with_beni, next_cursor = _lavori_admin_pagina(
+            filtro_stato, request.args.get('cursore'), per_pagina
+        )
+    except CursoreNonValido:
+        return jsonify({'error': 'Cursore non valido'}), 400
+
+    html = {
+        nome: str(get_template_attribute('main/_lavori_admin_righe.html', nome)(lavori_with_beni, filtro_stato))
+        for nome in _RIGHE_PER_VIEW_MODE.get(view_mode, ())
+    }
+    return jsonify({
+        'rows': [_serialize_lavori_admin_row(item) for item in lavori_with_beni],
+        'html': html,
+        'next_cursor': next_cursor,
+    })
+
+
+# Export: date filtrabili con ?campo_data=...&dal=AAAA-MM-GG&al=AAAA-MM-GG
+_CAMPI_DATA_EXPORT = {
+    'inserimento': LavoroAdmin.created_at,
+    'offerta': LavoroAdmin.data_offerta,
+    'firma': LavoroAdmin.data_firma,
+}
+_EXPORT_BLOCCO = 500  # Lavori letti per blocco
+
+
+def _criteri_export():
+    """Criteri di data dell'export dai parametri della richiesta (ValueError se non validi)."""
+    campo = _CAMPI_DATA_EXPORT.get(request.args.get('campo_data', 'inserimento'))
+    if campo is None:
+        raise ValueError('campo_data non valido')
+    criteri = []
+    dal, al = request.args.get('dal'), request.args.get('al')
+    if dal:
+        criteri.append(campo >= datetime.strptime(dal, '%Y-%m-%d').date())
+    if al:
+        # Fine giornata inclusa anche per created_at (DateTime)
+        criteri.append(campo < datetime.strptime(al, '%Y-%m-%d').date() + timedelta(days=1))
+    return criteri
+
+
+def _righe_lavori_admin_export(filtro_stato, criteri):
+    """
+    Tutte le righe di lavori_admin per filtro_stato, lette a blocchi con la
+    stessa paginazione keyset della pagina (ordine, numerazione e compensi
+    identici). Lavori e beni di ogni blocco escono dalla sessione appena
+    scritti: la memoria usata non dipende dal numero di lavori esportati.
+    """
+    from app.services.export import righe_export
+
+    query, chiavi = _lavori_admin_query(filtro_stato)
+    query = query.filter(*criteri)
+    dopo, sequential_num, altre_pagine = None, 0, True
+    while altre_pagine:
+        lavori, dopo, altre_pagine = pagina_keyset(query, chiavi, dopo, _EXPORT_BLOCCO)
+        lavori_with_beni, sequential_num = _build_lavori_admin_rows(lavori, filtro_stato, sequential_num)
+        yield from righe_export(lavori_with_beni)
+        for lavoro in lavori:
+            for bene in lavoro.beni_list:
+                db.session.expunge(bene)
+            db.session.expunge(lavoro)
+
+
+def _nome_export(filtro_stato, estensione):
+    return f"lavori_{filtro_stato or 'attivi'}_{date.today():%Y%m%d}.{estensione}"
+
+
+@bp.route('/export/lavori.csv')
+@login_required
+def export_lavori_csv():
+    """Lavori di lavori_admin in CSV, generato mentre viene inviato."""
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    from app.services.export import stream_csv
+
+    filtro_stato = request.args.get('filtro_stato', '').lower()
+    try:
+        criteri = _criteri_export()
+    except ValueError:
+        return jsonify({'error': 'Filtro data non valido'}), 400
+
+    resp = current_app.response_class(
+        stream_with_context(stream_csv(_righe_lavori_admin_export(filtro_stato, criteri))),
+        mimetype='text/csv',
+    )
+    resp.headers['Content-Disposition'] = f'attachment; filename="{_nome_export(filtro_stato, "csv")}"'
+    return resp
+
+
+@bp.route('/export/lavori.xlsx')
+@login_required
+def export_lavori_xlsx():
+    """Lavori di lavori_admin in Excel (openpyxl write-only, file temporaneo su disco)."""
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    from app.services.export import scrivi_xlsx
+
+    filtro_stato = request.args.get('filtro_stato', '').lower()
+    try:
+        criteri = _criteri_export()
+    except ValueError:
+        return jsonify({'error': 'Filtro data non valido'}), 400
+
+    # Un .xlsx è uno ZIP con l'indice in fondo: viene completato su un file
+    # temporaneo (eliminato alla chiusura) e poi inviato a blocchi
+    tmp = tempfile.TemporaryFile()
+    scrivi_xlsx(_righe_lavori_admin_export(filtro_stato, criteri), tmp)
+    tmp.seek(0)
+    return send_file(
+        tmp,
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        as_attachment=True,
+        download_name=_nome_export(filtro_stato, 'xlsx'),
+    )
+
+
 # NUOVA ROTTA SPECIALE (Sostituto Firma - Solo per Extra 2)
 @bp.route('/lavori_focus')
 @login_required
@@ -1016,31 +1030,16 @@ def lavori_focus():
     # Modalità visualizzazione: attivi (default) o chiusi
     show_mode = request.args.get('show', 'attivi')
     
-    # Escludi solo lavori con TUTTI i beni abbandonati dalla vista focus
-    from sqlalchemy import func as sql_func_focus
-    total_beni_fq = db.session.query(
-        Bene.lavoro_id,
-        sql_func_focus.count(Bene.id).label('total')
-    ).group_by(Bene.lavoro_id).subquery()
-    abandoned_beni_fq = db.session.query(
-        Bene.lavoro_id,
-        sql_func_focus.count(Bene.id).label('abandoned')
-    ).filter(Bene.stato == 'abbandonato').group_by(Bene.lavoro_id).subquery()
-    lavori_ids_fully_abbandonati = [row[0] for row in db.session.query(total_beni_fq.c.lavoro_id)
-        .join(abandoned_beni_fq, total_beni_fq.c.lavoro_id == abandoned_beni_fq.c.lavoro_id)
-        .filter(total_beni_fq.c.total == abandoned_beni_fq.c.abandoned)
-        .all()]
-    
     if show_mode == 'chiusi':
         query = LavoroAdmin.query.filter(LavoroAdmin.stato == 'chiusa')
     else:
         show_mode = 'attivi'
         query = LavoroAdmin.query.filter(LavoroAdmin.stato != 'chiusa')
     
-    if lavori_ids_fully_abbandonati:
-        query = query.filter(~LavoroAdmin.id.in_(lavori_ids_fully_abbandonati))
+    # Escludi solo lavori con TUTTI i beni abbandonati dalla vista focus
+    query = query.filter(LavoroAdmin.is_fully_abbandonato == False)
     
-    lavori = query.order_by(LavoroAdmin.numero.asc()).all()
+    lavori = with_beni(query).order_by(LavoroAdmin.numero.asc()).all()
     
     lavori_with_beni = []
     for lavoro in lavori:
@@ -1088,10 +1087,15 @@ def lavori_focus():
         lavori_with_beni=lavori_with_beni,
         view_mode='focus_special',
         focus_show_mode=show_mode,
+        # La vista focus carica tutti i lavori: nessuna pagina successiva
+        filtro_stato='',
+        next_cursor=None,
+        per_pagina=PER_PAGINA_DEFAULT,
     )
 
 @bp.route('/api/lavoro/<int:id>', methods=['GET'])
 @login_required
+@con_etag('lavori')
 def get_lavoro_admin(id):
     if current_user.role != 'admin':
         return jsonify({'error': 'Unauthorized'}), 403
@@ -1129,7 +1133,7 @@ def get_lavoro_admin(id):
         else:
             beni_list.append({'id': None, 'descrizione': lavoro.bene or '', 'valore': lavoro.valore_bene, 'importo_offerta': lavoro.importo_offerta, 'stato': lavoro.stato, 'data_pec': lavoro.data_pec.strftime('%Y-%m-%d') if lavoro.data_pec else None})
     
-    resp = make_response(jsonify({
+    return jsonify({
         'id': lavoro.id,
         'numero': lavoro.numero,
         'cliente': {
@@ -1195,9 +1199,7 @@ def get_lavoro_admin(id):
         'f_revisore': lavoro.f_revisore or '',
         'f_caricamento': lavoro.f_caricamento or '',
         'f_sabatini': getattr(lavoro, 'f_sabatini', '') or ''
-    }))
-    resp.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-    return resp
+    })
 
 
 @bp.route('/api/lavoro/<int:id>/genera_offerta', methods=['POST'])
@@ -1207,33 +1209,112 @@ def genera_offerta(id):
         return jsonify({'error': 'Unauthorized'}), 403
 
     lavoro = LavoroAdmin.query.get_or_404(id)
-    cliente = Cliente.query.get(lavoro.cliente_id) if lavoro.cliente_id else None
 
     payload = request.get_json(silent=True) or {}
-    tipo = (payload.get('tipo') or '').strip().lower()  # 'old' | 'iper' | 'rsid' | 'varie'
-    
-    # Se il tipo non è specificato, determinalo dalla categoria
+    # 'old' | 'iper' | 'rsid' | 'varie'; se non specificato lo determina dalla categoria
+    tipo = _resolve_tipo_offerta(lavoro, payload.get('tipo'))
     if not tipo:
-        # Prima prova con offerta_tipo esistente (per retrocompatibilità)
-        tipo = (getattr(lavoro, 'offerta_tipo', '') or '').strip().lower()
-        
-        # Se ancora non c'è, usa la categoria
-        if not tipo:
-            categoria = (getattr(lavoro, 'categoria', '') or '').strip().lower()
-            if categoria == 'old':
-                tipo = 'old'
-            elif categoria == 'iperamm':
-                tipo = 'iper'
-            elif categoria == 'rsid':
-                tipo = 'rsid'
-            elif categoria == 'varie':
-                tipo = 'varie'
-    
-    if tipo not in ('old', 'iper', 'rsid', 'varie'):
         return jsonify({'error': 'Tipo offerta non valido. Imposta una categoria al lavoro.'}), 400
 
     return _generate_offerta_response(lavoro=lavoro, tipo=tipo)
 
+
+_OFFERTE_BATCH_MAX = 200
+_FILTRI_OFFERTE_BATCH = {
+    'offerta_dirty': LavoroAdmin.offerta_dirty,
+    'categoria': LavoroAdmin.categoria,
+    'stato': LavoroAdmin.stato,
+}
+
+
+@bp.route('/api/offerte/batch', methods=['POST'])
+@login_required
+def genera_offerte_batch():
+    """
+    Genera più offerte in un'unica chiamata e le restituisce in uno ZIP.
+    Body JSON: {"ids": [1, 2, ...]} oppure {"filtro": {"offerta_dirty": true,
+    "categoria": ..., "stato": ...}}, opzionale "tipo" valido per tutti.
+    I documenti sono generati in parallelo; date, revisioni e stati di tutti i
+    lavori vengono salvati in un'unica transazione solo se la generazione di
+    tutte le offerte è riuscita.
+    """
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    payload = request.get_json(silent=True) or {}
+    ids = payload.get('ids')
+    filtro = payload.get('filtro')
+
+    query = with_beni(LavoroAdmin.query)
+    if ids is not None:
+        if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+            return jsonify({'error': 'ids deve essere una lista di interi'}), 400
+        ids = list(dict.fromkeys(ids))
+        if len(ids) > _OFFERTE_BATCH_MAX:
+            return jsonify({'error': f'Massimo {_OFFERTE_BATCH_MAX} offerte per richiesta'}), 400
+        per_id = {l.id: l for l in query.filter(LavoroAdmin.id.in_(ids)).all()}
+        lavori = [per_id[i] for i in ids if i in per_id]
+    elif isinstance(filtro, dict) and filtro:
+        sconosciuti = set(filtro) - set(_FILTRI_OFFERTE_BATCH)
+        if sconosciuti:
+            return jsonify({'error': f"Filtri non supportati: {', '.join(sorted(sconosciuti))}"}), 400
+        query = query.filter(LavoroAdmin.is_fully_abbandonato == False)
+        for campo, valore in filtro.items():
+            query = query.filter(_FILTRI_OFFERTE_BATCH[campo] == valore)
+        lavori = query.order_by(LavoroAdmin.id).limit(_OFFERTE_BATCH_MAX + 1).all()
+        if len(lavori) > _OFFERTE_BATCH_MAX:
+            return jsonify({'error': f'Il filtro seleziona più di {_OFFERTE_BATCH_MAX} offerte'}), 400
+    else:
+        return jsonify({'error': 'Specificare ids oppure filtro'}), 400
+
+    if not lavori:
+        return jsonify({'error': 'Nessun lavoro selezionato'}), 404
+
+    cliente_ids = {l.cliente_id for l in lavori if l.cliente_id}
+    clienti = {c.id: c for c in Cliente.query.filter(Cliente.id.in_(cliente_ids)).all()} if cliente_ids else {}
+    today = datetime.now().date()
+
+    da_generare = []
+    errori = {}
+    for lavoro in lavori:
+        tipo = _resolve_tipo_offerta(lavoro, payload.get('tipo'))
+        if not tipo:
+            errori[lavoro.id] = 'Tipo offerta non valido. Imposta una categoria al lavoro.'
+            continue
+        offerta = _prepara_offerta(lavoro, tipo, clienti.get(lavoro.cliente_id), today)
+        if not offerta['template_path'].exists():
+            errori[lavoro.id] = f"Template mancante: {offerta['template_name']}"
+            continue
+        da_generare.append((lavoro, tipo, offerta))
+
+    if not da_generare:
+        return jsonify({'error': 'Nessuna offerta generabile', 'errori': errori}), 400
+
+    from app.services.offerte_batch import numero_workers, render_offerte, nomi_univoci, stream_zip
+
+    workers = numero_workers(current_app.config.get('OFFERTE_BATCH_WORKERS'))
+    try:
+        documenti = render_offerte(
+            [(str(offerta['template_path']), offerta['dati']) for _, _, offerta in da_generare],
+            workers=workers,
+        )
+    except Exception as e:
+        current_app.logger.exception("Errore nella generazione massiva delle offerte")
+        return jsonify({'error': f'Errore nella generazione delle offerte: {e}'}), 500
+
+    # Tutte le offerte sono state generate: aggiorno i lavori in un'unica transazione
+    for lavoro, tipo, offerta in da_generare:
+        _applica_stato_offerta(lavoro, tipo, offerta, today)
+    db.session.commit()
+
+    nomi = nomi_univoci([offerta['download_name'] for _, _, offerta in da_generare])
+    resp = current_app.response_class(stream_zip(zip(nomi, documenti)), mimetype='application/zip')
+    resp.headers['Content-Disposition'] = f'attachment; filename="{today.strftime("%Y%m%d")}_Offerte.zip"'
+    resp.headers['X-Offerte-Generate'] = str(len(documenti))
+    if errori:
+        resp.headers['X-Offerte-Saltate'] = ','.join(str(i) for i in errori)
+    return resp
+
 @bp.route('/add_lavoro_admin', methods=['POST'])
 @login_required
 def add_lavoro_admin():
@@ -1268,16 +1349,12 @@ def add_lavoro_admin():
         new_num = lavoro.numero  # Mantieni lo stesso numero
         had_prev_offerta = bool(lavoro.data_offerta)
     else:
-        # NUOVO: calcola il nuovo numero escludendo lavori chiusi e abbandonati
-        # Ottieni i lavori che hanno almeno un bene con stato "abbandonato"
-        lavori_ids_abbandonati = [row[0] for row in db.session.query(LavoroAdmin.id).distinct().join(Bene, LavoroAdmin.id == Bene.lavoro_id).filter(
-            Bene.stato == 'abbandonato'
-        ).all()]
-        
-        # Query per trovare l'ultimo numero tra i lavori attivi (non chiusi e non abbandonati)
-        query = LavoroAdmin.query.filter(LavoroAdmin.stato != 'chiusa')
-        if lavori_ids_abbandonati:
-            query = query.filter(~LavoroAdmin.id.in_(lavori_ids_abbandonati))
+        # NUOVO: calcola il nuovo numero escludendo lavori chiusi e completamente abbandonati
+        # (stesso insieme della numerazione attiva, vedi app/services/numerazione.py)
+        query = LavoroAdmin.query.filter(
+            LavoroAdmin.stato != 'chiusa',
+            LavoroAdmin.is_fully_abbandonato == False
+        )
         
         last = query.order_by(LavoroAdmin.numero.desc()).first()
         new_num = (last.numero + 1) if (last and last.numero) else 1
@@ -1623,13 +1700,9 @@ def to_float_it(val):
     except:
         return 0.0
 
-@bp.route('/update_lavoro_field/<int:id>', methods=['POST'])
-@login_required
-def update_lavoro_field(id):
-    lavoro = LavoroAdmin.query.get_or_404(id)
-    data = request.json
-    field = data.get('field')
-    value = data.get('value')
+def _modifica_campo_lavoro(lavoro, dati):
+    field = dati.get('field')
+    value = dati.get('value')
 
     # Campi modificabili solo da admin
     admin_only_fields = ['stato', 'data_offerta_check', 'data_offerta', 'offerta_revision', 
@@ -1640,22 +1713,22 @@ def update_lavoro_field(id):
     
     if field in admin_only_fields:
         if current_user.role != 'admin':
-            return jsonify({'error': 'Unauthorized'}), 403
+            return 'Unauthorized', 403
     elif field in base_user_fields:
         # Verifica che l'utente base abbia accesso a questo lavoro
         if current_user.role == 'base':
             collaboratore = _get_collaboratore_for_user(current_user.username)
             if not collaboratore or lavoro.collaboratore != collaboratore:
-                return jsonify({'error': 'Unauthorized'}), 403
+                return 'Unauthorized', 403
     else:
         # Campo non riconosciuto
         if current_user.role != 'admin':
-            return jsonify({'error': 'Unauthorized'}), 403
+            return 'Unauthorized', 403
 
     if field == 'stato':
         # Impedisci l'impostazione manuale di "chiusa"
         if value == 'chiusa':
-            return jsonify({'error': 'Lo stato "chiusa" non può essere impostato manualmente. Viene impostato automaticamente quando tutti i compensi interni hanno la fattura.'}), 400
+            return 'Lo stato "chiusa" non può essere impostato manualmente. Viene impostato automaticamente quando tutti i compensi interni hanno la fattura.', 400
         lavoro.stato = value or 'vuoto'
     elif field == 'data_offerta_check':
         lavoro.data_offerta_check = value
@@ -1703,76 +1776,63 @@ def update_lavoro_field(id):
         lavoro.compenso = float(value) if value else 0.0
     
     # Eventuale gestione altri campi inline...
+    return None
 
-    db.session.commit()
-    return jsonify({'success': True})
+
+def _segna_offerta_da_revisionare(bene):
+    # Se l'offerta è già stata generata, qualsiasi modifica post-emissione rende l'offerta "da revisionare"
+    lavoro = bene.lavoro
+    if lavoro and getattr(lavoro, 'data_offerta', None):
+        lavoro.offerta_dirty = True
 
 
-@bp.route('/update_bene_field/<int:id>', methods=['POST'])
-@login_required
-def update_bene_field(id):
+def _modifica_campo_bene(bene, dati):
     if current_user.role != 'admin':
-        return jsonify({'error': 'Unauthorized'}), 403
+        return 'Unauthorized', 403
 
-    bene = Bene.query.get_or_404(id)
-    data = request.json or {}
-    field = data.get('field')
-    value = data.get('value')
+    field = dati.get('field')
+    value = dati.get('value')
 
     if field == 'stato':
         # Impedisci l'impostazione manuale di "chiusa"
         if value == 'chiusa':
-            return jsonify({'error': 'Lo stato "chiusa" non può essere impostato manualmente. Viene impostato automaticamente quando tutti i compensi interni hanno la fattura.'}), 400
+            return 'Lo stato "chiusa" non può essere impostato manualmente. Viene impostato automaticamente quando tutti i compensi interni hanno la fattura.', 400
         
-        stato_precedente = bene.stato
         bene.stato = value or 'vuoto'
         
-        # Se lo stato viene cambiato a "abbandonato", imposta la data_abbandono se non è già impostata
-        if value == 'abbandonato':
-            if not getattr(bene, 'data_abbandono', None):
-                bene.data_abbandono = datetime.now().date()
-                # Commit immediato per assicurarsi che la data sia salvata
-                db.session.flush()
+        # Se lo stato viene cambiato a "abbandonato", imposta la data_abbandono se non è già impostata.
+        # L'uscita / il rientro del lavoro nella numerazione li gestisce _applica_modifiche
+        if value == 'abbandonato' and not getattr(bene, 'data_abbandono', None):
+            bene.data_abbandono = datetime.now().date()
     elif field == 'data_pec':
         if value:
             bene.data_pec = datetime.strptime(value, '%Y-%m-%d').date()
         else:
             bene.data_pec = None
     else:
-        return jsonify({'error': 'Campo non supportato'}), 400
+        return 'Campo non supportato', 400
 
-    # Se l'offerta è già stata generata, qualsiasi modifica post-emissione rende l'offerta "da revisionare"
-    try:
-        lavoro = bene.lavoro
-        if lavoro and getattr(lavoro, 'data_offerta', None):
-            lavoro.offerta_dirty = True
-    except Exception:
-        pass
+    _segna_offerta_da_revisionare(bene)
+    return None
 
-    db.session.commit()
-    return jsonify({'success': True})
 
-@bp.route('/update_bene_abbandono/<int:id>', methods=['POST'])
-@login_required
-def update_bene_abbandono(id):
+def _modifica_abbandono_bene(bene, dati):
     if current_user.role != 'admin':
-        return jsonify({'error': 'Unauthorized'}), 403
+        return 'Unauthorized', 403
 
-    bene = Bene.query.get_or_404(id)
-    data = request.json or {}
-    motivo = data.get('motivo')
-    commento = data.get('commento')
+    motivo = dati.get('motivo')
+    commento = dati.get('commento')
 
     if not motivo:
-        return jsonify({'error': 'Motivo abbandono richiesto'}), 400
+        return 'Motivo abbandono richiesto', 400
 
     # Valida i valori del motivo
     motivi_validi = ['assegnato_altro_studio', 'abbandonato_cliente', 'altro']
     if motivo not in motivi_validi:
-        return jsonify({'error': 'Motivo non valido'}), 400
+        return 'Motivo non valido', 400
 
     if motivo == 'altro' and not commento:
-        return jsonify({'error': 'Commento richiesto per motivo "altro"'}), 400
+        return 'Commento richiesto per motivo "altro"', 400
 
     bene.motivo_abbandono = motivo
     bene.commento_abbandono = commento if motivo == 'altro' else None
@@ -1787,65 +1847,164 @@ def update_bene_abbandono(id):
         max_ordine = db.session.query(sql_func.max(Bene.ordine_abbandono)).scalar() or 0
         bene.ordine_abbandono = max_ordine + 1
 
-    # Se l'offerta è già stata generata, qualsiasi modifica post-emissione rende l'offerta "da revisionare"
-    try:
-        lavoro = bene.lavoro
-        if lavoro and getattr(lavoro, 'data_offerta', None):
-            lavoro.offerta_dirty = True
-    except Exception:
-        pass
-
-    # Salva prima il motivo e commento
-    db.session.flush()  # Flush per assicurarsi che i cambiamenti siano visibili
-    db.session.commit()
-    
-    # Ricalcola i numeri sequenziali dopo che un lavoro è stato abbandonato
-    # (escludendo i lavori abbandonati e chiusi)
-    # Nota: il commit precedente assicura che lo stato "abbandonato" del bene sia già salvato
-    ricalcola_numeri_sequenziali()
-    
-    # Salva i numeri ricalcolati
+    _segna_offerta_da_revisionare(bene)
+    return None
+
+
+# Mappa il tipo di fattura al campo del modello
+_FATTURA_FIELD_MAP = {
+    'fe': 'f_fe',
+    'amin': 'f_amin',
+    'galvan': 'f_galvan',
+    'fh': 'f_fh',
+    'bianc': 'f_bianc',
+    'deloitte': 'f_deloitte',
+    'ext': 'f_ext',
+    'revisore': 'f_revisore',
+    'caricamento': 'f_caricamento'
+}
+
+# Fatture interne: quando cambiano va verificata la chiusura automatica del lavoro
+_FATTURE_INTERNE = ('fe', 'amin', 'galvan', 'fh')
+
+
+def _modifica_fattura(lavoro, dati):
+    if current_user.role != 'admin':
+        return 'Unauthorized', 403
+
+    fattura_type = dati.get('fattura_type')
+    if fattura_type not in _FATTURA_FIELD_MAP:
+        return 'Tipo fattura non supportato', 400
+
+    setattr(lavoro, _FATTURA_FIELD_MAP[fattura_type], dati.get('value'))
+    return None
+
+
+# Modifiche inline: nome della rotta -> (modello, funzione che applica il suo payload).
+# Le funzioni non fanno commit; ritornano None o (messaggio di errore, status HTTP).
+_MODIFICHE_INLINE = {
+    'update_lavoro_field': (LavoroAdmin, _modifica_campo_lavoro),
+    'update_bene_field': (Bene, _modifica_campo_bene),
+    'update_bene_abbandono': (Bene, _modifica_abbandono_bene),
+    'update_fattura': (LavoroAdmin, _modifica_fattura),
+}
+
+_MAX_OPERAZIONI_BATCH = 100
+
+
+def _applica_modifiche(operazioni):
+    """
+    Applica le modifiche inline (azione, id, payload) in un'unica transazione.
+    Se una fallisce annulla tutto e ritorna (indice, messaggio, status),
+    altrimenti fa commit e ritorna None.
+
+    Chiusura automatica e numerazione vengono aggiornate una volta sola, alla
+    fine: la chiusura per i lavori con fatture interne modificate, la
+    numerazione per i lavori che sono entrati o usciti da quella attiva.
+    """
+    lavori = {}  # id -> (lavoro, era nella numerazione attiva)
+    da_verificare = {}
+    for indice, (azione, id_, dati) in enumerate(operazioni):
+        modello, applica = _MODIFICHE_INLINE[azione]
+        obj = db.session.get(modello, id_)
+        if obj is None:
+            db.session.rollback()
+            return indice, 'Non trovato', 404
+        lavoro = obj if modello is LavoroAdmin else obj.lavoro
+        if lavoro.id not in lavori:
+            lavori[lavoro.id] = (lavoro, in_numerazione(lavoro))
+        try:
+            errore = applica(obj, dati)
+        except (TypeError, ValueError):
+            errore = ('Valore non valido', 400)
+        if errore:
+            db.session.rollback()
+            return (indice, *errore)
+        if azione == 'update_fattura' and dati.get('fattura_type') in _FATTURE_INTERNE:
+            da_verificare[lavoro.id] = lavoro
+
+    for lavoro in da_verificare.values():
+        verifica_e_chiudi_lavoro(lavoro, ricalcola_numeri=False)
+
+    # Il flush aggiorna is_fully_abbandonato in SQL (contatori dei beni): va riletto
+    db.session.flush()
+    usciti, entrati = [], []
+    for lavoro, attivo_prima in lavori.values():
+        db.session.expire(lavoro, ['is_fully_abbandonato'])
+        attivo = in_numerazione(lavoro)
+        if attivo != attivo_prima:
+            (entrati if attivo else usciti).append(lavoro)
+    riallinea_numerazione(usciti, entrati)
+
     db.session.commit()
-    
+    return None
+
+
+def _risposta_modifica(azione, id, dati):
+    errore = _applica_modifiche([(azione, id, dati)])
+    if errore:
+        _, messaggio, status = errore
+        return jsonify({'error': messaggio}), status
     return jsonify({'success': True})
+
+
+@bp.route('/update_lavoro_field/<int:id>', methods=['POST'])
+@login_required
+def update_lavoro_field(id):
+    return _risposta_modifica('update_lavoro_field', id, request.json or {})
+
+
+@bp.route('/update_bene_field/<int:id>', methods=['POST'])
+@login_required
+def update_bene_field(id):
+    return _risposta_modifica('update_bene_field', id, request.json or {})
+
+@bp.route('/update_bene_abbandono/<int:id>', methods=['POST'])
+@login_required
+def update_bene_abbandono(id):
+    return _risposta_modifica('update_bene_abbandono', id, request.json or {})
     
 
 @bp.route('/update_fattura/<int:id>', methods=['POST'])
 @login_required
 def update_fattura(id):
-    if current_user.role != 'admin':
-        return jsonify({'error': 'Unauthorized'}), 403
-    
-    lavoro = LavoroAdmin.query.get_or_404(id)
-    data = request.json
-    fattura_type = data.get('fattura_type')
-    value = data.get('value')
-    
-    # Mappa il tipo di fattura al campo del modello
-    fattura_field_map = {
-        'fe': 'f_fe',
-        'amin': 'f_amin',
-        'galvan': 'f_galvan',
-        'fh': 'f_fh',
-        'bianc': 'f_bianc',
-        'deloitte': 'f_deloitte',
-        'ext': 'f_ext',
-        'revisore': 'f_revisore',
-        'caricamento': 'f_caricamento'
-    }
-    
-    if fattura_type not in fattura_field_map:
-        return jsonify({'error': 'Tipo fattura non supportato'}), 400
-    
-    field_name = fattura_field_map[fattura_type]
-    setattr(lavoro, field_name, value)
-    
-    # Se è una fattura interna (FE, AMIN, GALVAN, FH), verifica se il lavoro può essere chiuso
-    if fattura_type in ['fe', 'amin', 'galvan', 'fh']:
-        verifica_e_chiudi_lavoro(lavoro)
-    
-    db.session.commit()
-    return jsonify({'success': True})
+    return _risposta_modifica('update_fattura', id, request.json or {})
+
+
+@bp.route('/api/batch', methods=['POST'])
+@login_required
+def api_batch():
+    """
+    Più modifiche inline in una sola richiesta e una sola transazione:
+    {"operazioni": [{"azione": "update_bene_field", "id": 12,
+                     "dati": {"field": "stato", "value": "abbandonato"}}, ...]}
+    `azione` è una delle rotte update_lavoro_field / update_bene_field /
+    update_bene_abbandono / update_fattura e `dati` il suo payload, con gli
+    stessi controlli. Le operazioni sono applicate in ordine; se una fallisce
+    non viene salvato nulla e la risposta indica quale ('operazione': indice).
+    """
+    operazioni = (request.get_json(silent=True) or {}).get('operazioni')
+    if not isinstance(operazioni, list) or not operazioni:
+        return jsonify({'error': 'Nessuna operazione'}), 400
+    if len(operazioni) > _MAX_OPERAZIONI_BATCH:
+        return jsonify({'error': f'Al massimo {_MAX_OPERAZIONI_BATCH} operazioni per richiesta'}), 400
+
+    richieste = []
+    for indice, op in enumerate(operazioni):
+        if (
+            not isinstance(op, dict)
+            or op.get('azione') not in _MODIFICHE_INLINE
+            or not isinstance(op.get('id'), int)
+            or not isinstance(op.get('dati', {}), dict)
+        ):
+            return jsonify({'error': 'Operazione non valida', 'operazione': indice}), 400
+        richieste.append((op['azione'], op['id'], op.get('dati', {})))
+
+    errore = _applica_modifiche(richieste)
+    if errore:
+        indice, messaggio, status = errore
+        return jsonify({'error': messaggio, 'operazione': indice}), status
+    return jsonify({'success': True, 'operazioni': len(richieste)})
     
 @bp.route('/delete_lavoro_admin/<int:id>', methods=['POST'])
 @login_required
@@ -1855,6 +2014,7 @@ def delete_lavoro_admin(id):
         return redirect(url_for('main.dashboard'))
     
     lavoro = LavoroAdmin.query.get_or_404(id)
+    numero_eliminato = lavoro.numero
     
     # Elimina i beni associati al lavoro
     for bene in lavoro.beni_list:
@@ -1864,8 +2024,8 @@ def delete_lavoro_admin(id):
     db.session.delete(lavoro)
     db.session.commit()
     
-    # Ricalcola i numeri sequenziali escludendo i lavori chiusi e abbandonati
-    ricalcola_numeri_sequenziali()
+    # Compatta la numerazione dei lavori attivi successivi a quello eliminato
+    esci_da_numerazione(numero_eliminato)
     db.session.commit()
     
     flash(f'Lavoro #{id} eliminato con successo. Numerazione aggiornata.', 'success')
@@ -1910,7 +2070,7 @@ def lavori():
         return render_template('main/lavori_base.html', lavori_with_beni=[], username=current_user.username)
     
     # Cerca i lavori assegnati a questo collaboratore
-    lavori_assegnati = LavoroAdmin.query.filter(
+    lavori_assegnati = query_lavori_con_beni(
         LavoroAdmin.collaboratore == collaboratore
     ).order_by(LavoroAdmin.numero.asc()).all()
     
@@ -2159,16 +2319,9 @@ def api_esterni():
     if len(query) < 1:
         return jsonify([])
     
-    # Cerca i nomi univoci nella colonna nome_esterno
-    nomi = db.session.query(LavoroAdmin.nome_esterno)\
-        .filter(LavoroAdmin.nome_esterno.ilike(f'%{query}%'))\
-        .filter(LavoroAdmin.nome_esterno != None)\
-        .filter(LavoroAdmin.nome_esterno != '')\
-        .distinct().limit(10).all()
-    
+    # Nomi distinti di nome_esterno, prima quelli che iniziano per q e i più usati
     # Restituisce una lista semplice di stringhe ['Nome1', 'Nome2']
-    results = [n[0] for n in nomi]
-    return jsonify(results)
+    return jsonify(suggerimenti('esterni', query))
 
 @bp.route('/api/revisori')
 @login_required
@@ -2177,15 +2330,7 @@ def api_revisori():
     if len(query) < 1:
         return jsonify([])
     
-    # Cerca i nomi univoci nella colonna nome_revisore
-    nomi = db.session.query(LavoroAdmin.nome_revisore)\
-        .filter(LavoroAdmin.nome_revisore.ilike(f'%{query}%'))\
-        .filter(LavoroAdmin.nome_revisore != None)\
-        .filter(LavoroAdmin.nome_revisore != '')\
-        .distinct().limit(10).all()
-    
-    results = [n[0] for n in nomi]
-    return jsonify(results)
+    return jsonify(suggerimenti('revisori', query))
 
 @bp.route('/api/caricamenti')
 @login_required
@@ -2194,14 +2339,7 @@ def api_caricamenti():
     if len(query) < 1:
         return jsonify([])
     
-    nomi = db.session.query(LavoroAdmin.nome_caricamento)\
-        .filter(LavoroAdmin.nome_caricamento.ilike(f'%{query}%'))\
-        .filter(LavoroAdmin.nome_caricamento != None)\
-        .filter(LavoroAdmin.nome_caricamento != '')\
-        .distinct().limit(10).all()
-    
-    results = [n[0] for n in nomi]
-    return jsonify(results)
+    return jsonify(suggerimenti('caricamenti', query))
 
 @bp.route('/api/sabatini')
 @login_required
@@ -2210,50 +2348,10 @@ def api_sabatini():
     if len(query) < 1:
         return jsonify([])
     
-    nomi = db.session.query(LavoroAdmin.nome_sabatini)\
-        .filter(LavoroAdmin.nome_sabatini.ilike(f'%{query}%'))\
-        .filter(LavoroAdmin.nome_sabatini != None)\
-        .filter(LavoroAdmin.nome_sabatini != '')\
-        .distinct().limit(10).all()
-    
-    results = [n[0] for n in nomi]
-    return jsonify(results)
+    return jsonify(suggerimenti('sabatini', query))
 
 # --- ROTTE FATTURAZIONE ---
 
-def ricalcola_numeri_sequenziali():
-    """
-    Ricalcola i numeri sequenziali dei lavori escludendo quelli con stato 'chiusa'
-    e quelli con TUTTI i beni abbandonati. Lavori con solo alcuni beni abbandonati
-    restano nella numerazione attiva.
-    """
-    db.session.flush()
-    db.session.expire_all()
-    
-    # Trova i lavori dove TUTTI i beni sono abbandonati
-    from sqlalchemy import func as sql_func
-    total_beni_sq = db.session.query(
-        Bene.lavoro_id,
-        sql_func.count(Bene.id).label('total')
-    ).group_by(Bene.lavoro_id).subquery()
-    abandoned_beni_sq = db.session.query(
-        Bene.lavoro_id,
-        sql_func.count(Bene.id).label('abandoned')
-    ).filter(Bene.stato == 'abbandonato').group_by(Bene.lavoro_id).subquery()
-    lavori_ids_fully_abbandonati = [row[0] for row in db.session.query(total_beni_sq.c.lavoro_id)
-        .join(abandoned_beni_sq, total_beni_sq.c.lavoro_id == abandoned_beni_sq.c.lavoro_id)
-        .filter(total_beni_sq.c.total == abandoned_beni_sq.c.abandoned)
-        .all()]
-    
-    query = LavoroAdmin.query.filter(LavoroAdmin.stato != 'chiusa')
-    if lavori_ids_fully_abbandonati:
-        query = query.filter(~LavoroAdmin.id.in_(lavori_ids_fully_abbandonati))
-    
-    lavori_attivi = query.order_by(LavoroAdmin.numero.asc(), LavoroAdmin.id.asc()).all()
-    
-    for idx, lav in enumerate(lavori_attivi, start=1):
-        lav.numero = idx
-
 def verifica_e_chiudi_lavoro(lavoro, ricalcola_numeri=True):
     """
     Verifica se un lavoro può essere chiuso automaticamente.
@@ -2263,8 +2361,8 @@ def verifica_e_chiudi_lavoro(lavoro, ricalcola_numeri=True):
     
     Args:
         lavoro: Il lavoro da verificare
-        ricalcola_numeri: Se True, ricalcola i numeri sequenziali dopo il cambio di stato.
-                         Impostare a False quando si processano più lavori in batch.
+        ricalcola_numeri: Se True, aggiorna la numerazione (in modo incrementale)
+                         quando il lavoro viene chiuso o riaperto.
     """
     stato_precedente = lavoro.stato
     
@@ -2286,7 +2384,7 @@ def verifica_e_chiudi_lavoro(lavoro, ricalcola_numeri=True):
                         if bene.stato == 'chiusa':
                             bene.stato = 'incassata'
                 if ricalcola_numeri:
-                    ricalcola_numeri_sequenziali()
+                    entra_in_numerazione(lavoro)
             return False
     
     # Verifica AMIN
@@ -2299,7 +2397,7 @@ def verifica_e_chiudi_lavoro(lavoro, ricalcola_numeri=True):
                         if bene.stato == 'chiusa':
                             bene.stato = 'incassata'
                 if ricalcola_numeri:
-                    ricalcola_numeri_sequenziali()
+                    entra_in_numerazione(lavoro)
             return False
     
     # Verifica GALVAN
@@ -2312,7 +2410,7 @@ def verifica_e_chiudi_lavoro(lavoro, ricalcola_numeri=True):
                         if bene.stato == 'chiusa':
                             bene.stato = 'incassata'
                 if ricalcola_numeri:
-                    ricalcola_numeri_sequenziali()
+                    entra_in_numerazione(lavoro)
             return False
     
     # Verifica FH
@@ -2325,7 +2423,7 @@ def verifica_e_chiudi_lavoro(lavoro, ricalcola_numeri=True):
                         if bene.stato == 'chiusa':
                             bene.stato = 'incassata'
                 if ricalcola_numeri:
-                    ricalcola_numeri_sequenziali()
+                    entra_in_numerazione(lavoro)
             return False
     
     if lavoro.stato != 'chiusa':
@@ -2335,10 +2433,72 @@ def verifica_e_chiudi_lavoro(lavoro, ricalcola_numeri=True):
                 if bene.stato != 'chiusa' and bene.stato != 'abbandonato':
                     bene.stato = 'chiusa'
         if ricalcola_numeri:
-            ricalcola_numeri_sequenziali()
+            esci_da_numerazione(lavoro.numero)
     
     return True
 
+def _lavoro_fattura_json(riga):
+    """Un lavoro di una fattura: beni attivi, compenso fatturato e importo mostrato."""
+    lavoro = riga.lavoro
+    beni_list = []
+    if lavoro.beni_list:
+        for bene in sorted(lavoro.beni_list, key=lambda x: x.ordine):
+            if bene.stato != 'abbandonato':
+                beni_list.append(bene.descrizione)
+    else:
+        if lavoro.bene:
+            beni_list = [b.strip() for b in lavoro.bene.split(' | ')]
+
+    active_beni = [b for b in (lavoro.beni_list or []) if b.stato != 'abbandonato']
+    shown_importo = sum((b.importo_offerta or 0) for b in active_beni) if active_beni else (lavoro.importo_offerta or 0)
+
+    return {
+        'id': lavoro.id,
+        'numero': lavoro.numero,
+        'cliente': lavoro.cliente_nome or '',
+        'beni': beni_list,
+        'compenso': riga.compenso or 0.0,
+        'importo': shown_importo
+    }
+
+
+def _lista_fatture_json(soggetto, *criteria, con_lavori=True):
+    """
+    Una pagina dell'elenco fatture del soggetto (più recenti prima), con
+    ?cursore= e ?per_pagina=. Senza `con_lavori` restituisce solo le
+    intestazioni: i lavori di ogni fattura si caricano da dettaglio_fattura.
+    """
+    try:
+        dati = decodifica_cursore(request.args.get('cursore'))
+        dopo = dati['k'] if dati is not None else None
+        if dopo is not None and len(dopo) != 2:
+            raise CursoreNonValido('cursore non compatibile')
+    except CursoreNonValido:
+        return jsonify({'error': 'Cursore non valido'}), 400
+    per_pagina = leggi_per_pagina(request.args.get('per_pagina'))
+
+    fatture, ultima, altre_pagine = pagina_fatture(soggetto, *criteria, dopo=dopo, per_pagina=per_pagina)
+    fatture_dict = {
+        fattura.id: {
+            'numero': fattura.numero,
+            'data': fattura.data.strftime('%Y-%m-%d') if fattura.data else None,
+            'n_lavori': n_lavori,
+            'totale_compensi': totale or 0.0
+        }
+        for fattura, totale, n_lavori in fatture
+    }
+
+    if con_lavori:
+        for item in fatture_dict.values():
+            item['lavori'] = []
+        for riga in righe_fatture(list(fatture_dict), *criteria):
+            fatture_dict[riga.fattura_id]['lavori'].append(_lavoro_fattura_json(riga))
+
+    return jsonify({
+        'fatture': list(fatture_dict.values()),
+        'next_cursor': codifica_cursore({'k': ultima}) if altre_pagine else None,
+    })
+
 @bp.route('/fatturazione/<tipo>')
 @login_required
 def fatturazione(tipo):
@@ -2366,31 +2526,14 @@ def fatturazione(tipo):
     else:
         stato_richiesto = 'incassata'
     
-    # Trova lavori dove TUTTI i beni hanno lo stato richiesto
-    # (un lavoro compare solo se nessun bene ha uno stato diverso)
-    tutti_lavori_con_beni = db.session.query(LavoroAdmin).join(Bene, LavoroAdmin.id == Bene.lavoro_id).all()
-    lavori_ids_validi = []
-    
-    for lavoro in tutti_lavori_con_beni:
-        if lavoro.beni_list and len(lavoro.beni_list) > 0:
-            # Escludi beni abbandonati dal conteggio
-            beni_attivi = [b for b in lavoro.beni_list if b.stato != 'abbandonato']
-            if beni_attivi and all(b.stato == stato_richiesto for b in beni_attivi):
-                lavori_ids_validi.append(lavoro.id)
-    
-    # Rimuovi duplicati
-    lavori_ids_validi = list(set(lavori_ids_validi))
-    
-    if not lavori_ids_validi:
-        lavori = []
-    else:
-        # Filtra per compenso > 0 E che NON hanno ancora un numero di fattura
-        campo_fattura_obj = getattr(LavoroAdmin, campo_fattura)
-        lavori = LavoroAdmin.query.filter(
-            LavoroAdmin.id.in_(lavori_ids_validi),
-            getattr(LavoroAdmin, campo_compenso) > 0,
-            (campo_fattura_obj == None) | (campo_fattura_obj == '')
-        ).order_by(LavoroAdmin.numero.asc()).all()
+    # Lavori dove TUTTI i beni attivi hanno lo stato richiesto (una sola query),
+    # con compenso > 0 e che NON hanno ancora un numero di fattura
+    campo_fattura_obj = getattr(LavoroAdmin, campo_fattura)
+    lavori = query_lavori_con_beni(
+        criterio_beni_in_stato(stato_richiesto),
+        getattr(LavoroAdmin, campo_compenso) > 0,
+        (campo_fattura_obj == None) | (campo_fattura_obj == '')
+    ).order_by(LavoroAdmin.numero.asc()).all()
     
     lavori_data = []
     totale_compensi = 0.0
@@ -2455,7 +2598,7 @@ def salva_fatturazione():
     data_fattura = datetime.now().date()
     
     # Aggiorna tutti i lavori selezionati
-    lavori_aggiornati = LavoroAdmin.query.filter(LavoroAdmin.id.in_(lavori_ids)).all()
+    lavori_aggiornati = query_lavori_con_beni(LavoroAdmin.id.in_(lavori_ids)).all()
     
     for lavoro in lavori_aggiornati:
         setattr(lavoro, campo_fattura, numero_fattura)
@@ -2470,10 +2613,9 @@ def salva_fatturazione():
                         bene.stato = 'da incassare'
         else:
             # Per gli altri (AMIN, GALVAN, FH): verifica se il lavoro può essere chiuso
-            verifica_e_chiudi_lavoro(lavoro, ricalcola_numeri=False)
+            # (la numerazione viene aggiornata in modo incrementale per ogni lavoro chiuso)
+            verifica_e_chiudi_lavoro(lavoro)
     
-    # Ricalcola i numeri sequenziali una sola volta dopo tutte le modifiche
-    ricalcola_numeri_sequenziali()
     db.session.commit()
     
     return jsonify({
@@ -2484,6 +2626,7 @@ def salva_fatturazione():
 
 @bp.route('/api/fatturazione/lista/<tipo>')
 @login_required
+@con_etag('lavori')
 def lista_fatture(tipo):
     if current_user.role != 'admin':
         return jsonify({'error': 'Unauthorized'}), 403
@@ -2498,58 +2641,9 @@ def lista_fatture(tipo):
     if tipo not in tipo_map:
         return jsonify({'error': 'Tipo non valido'}), 400
     
-    campo_fattura, campo_data, campo_compenso = tipo_map[tipo]
-    
-    # Raggruppa per numero fattura
-    fatture_dict = {}
-    
-    lavori = LavoroAdmin.query.filter(
-        getattr(LavoroAdmin, campo_fattura) != None,
-        getattr(LavoroAdmin, campo_fattura) != ''
-    ).all()
-    
-    for lavoro in lavori:
-        num_fattura = getattr(lavoro, campo_fattura)
-        data_fattura = getattr(lavoro, campo_data)
-        comp = _active_compensi(lavoro)
-        compenso = comp.get(campo_compenso, 0.0)
-        
-        if num_fattura not in fatture_dict:
-            fatture_dict[num_fattura] = {
-                'numero': num_fattura,
-                'data': data_fattura.strftime('%Y-%m-%d') if data_fattura else None,
-                'lavori': [],
-                'totale_compensi': 0.0
-            }
-        
-        beni_list = []
-        if lavoro.beni_list:
-            for bene in sorted(lavoro.beni_list, key=lambda x: x.ordine):
-                if bene.stato != 'abbandonato':
-                    beni_list.append(bene.descrizione)
-        else:
-            if lavoro.bene:
-                beni_list = [b.strip() for b in lavoro.bene.split(' | ')]
-        
-        active_beni = [b for b in (lavoro.beni_list or []) if b.stato != 'abbandonato']
-        shown_importo = sum((b.importo_offerta or 0) for b in active_beni) if active_beni else (lavoro.importo_offerta or 0)
-        
-        fatture_dict[num_fattura]['lavori'].append({
-            'id': lavoro.id,
-            'numero': lavoro.numero,
-            'cliente': lavoro.cliente_nome or '',
-            'beni': beni_list,
-            'compenso': compenso,
-            'importo': shown_importo
-        })
-        
-        fatture_dict[num_fattura]['totale_compensi'] += compenso
-    
-    # Converti in lista e ordina per data (più recente prima)
-    fatture_list = list(fatture_dict.values())
-    fatture_list.sort(key=lambda x: x['data'] or '', reverse=True)
-    
-    return jsonify({'fatture': fatture_list})
+    # Intestazioni paginate lette dalla tabella fattura; i lavori di ogni
+    # fattura vengono caricati all'apertura tramite dettaglio_fattura
+    return _lista_fatture_json(tipo, con_lavori=False)
 
 # --- ROTTE FATTURAZIONE ESTERNI ---
 
@@ -2578,37 +2672,22 @@ def fatturazione_esterni(tipo):
     # Filtro per nome (solo per revisore, caricamento, ext)
     filtro_nome = request.args.get('nome', '').strip()
     
-    # Trova lavori dove TUTTI i beni attivi hanno stato "incassata"
+    # Lavori dove TUTTI i beni attivi hanno stato "incassata" o "chiusa"
     # (gli esterni fatturano dopo che FE ha incassato)
-    tutti_lavori_con_beni = db.session.query(LavoroAdmin).join(Bene, LavoroAdmin.id == Bene.lavoro_id).all()
-    lavori_ids_validi = []
+    query = query_lavori_con_beni(
+        criterio_beni_in_stato('incassata', 'chiusa'),
+        getattr(LavoroAdmin, campo_compenso) > 0
+    )
     
-    for lavoro in tutti_lavori_con_beni:
-        if lavoro.beni_list and len(lavoro.beni_list) > 0:
-            beni_attivi = [b for b in lavoro.beni_list if b.stato != 'abbandonato']
-            if beni_attivi and all(b.stato in ['incassata', 'chiusa'] for b in beni_attivi):
-                lavori_ids_validi.append(lavoro.id)
+    # Filtro per nome se necessario
+    if campo_nome and filtro_nome:
+        query = query.filter(getattr(LavoroAdmin, campo_nome) == filtro_nome)
     
-    lavori_ids_validi = list(set(lavori_ids_validi))
+    # Escludi lavori già fatturati
+    campo_fattura_obj = getattr(LavoroAdmin, campo_fattura)
+    query = query.filter((campo_fattura_obj == None) | (campo_fattura_obj == ''))
     
-    if not lavori_ids_validi:
-        lavori = []
-    else:
-        # Query base
-        query = LavoroAdmin.query.filter(
-            LavoroAdmin.id.in_(lavori_ids_validi),
-            getattr(LavoroAdmin, campo_compenso) > 0
-        )
-        
-        # Filtro per nome se necessario
-        if campo_nome and filtro_nome:
-            query = query.filter(getattr(LavoroAdmin, campo_nome) == filtro_nome)
-        
-        # Escludi lavori già fatturati
-        campo_fattura_obj = getattr(LavoroAdmin, campo_fattura)
-        query = query.filter((campo_fattura_obj == None) | (campo_fattura_obj == ''))
-        
-        lavori = query.order_by(LavoroAdmin.numero.asc()).all()
+    lavori = query.order_by(LavoroAdmin.numero.asc()).all()
     
     # Prepara dati per template - un elemento per lavoro, con lista beni inclusi
     lavori_data = []
@@ -2702,6 +2781,7 @@ def salva_fatturazione_esterni():
 
 @bp.route('/api/fatturazione_esterni/lista/<tipo>')
 @login_required
+@con_etag('lavori')
 def lista_fatture_esterni(tipo):
     if current_user.role != 'admin':
         return jsonify({'error': 'Unauthorized'}), 403
@@ -2718,8 +2798,6 @@ def lista_fatture_esterni(tipo):
     if tipo not in tipo_map:
         return jsonify({'error': 'Tipo non valido'}), 400
     
-    campo_fattura, campo_data, campo_compenso = tipo_map[tipo]
-    
     # Filtro per nome (se necessario)
     filtro_nome = request.args.get('nome', '').strip()
     campo_nome_map = {
@@ -2730,62 +2808,15 @@ def lista_fatture_esterni(tipo):
     }
     campo_nome = campo_nome_map.get(tipo)
     
-    fatture_dict = {}
-    
-    query = LavoroAdmin.query.filter(
-        getattr(LavoroAdmin, campo_fattura) != None,
-        getattr(LavoroAdmin, campo_fattura) != ''
-    )
-    
+    criteri = []
     if campo_nome and filtro_nome:
-        query = query.filter(getattr(LavoroAdmin, campo_nome) == filtro_nome)
-    
-    lavori = query.all()
+        criteri.append(getattr(LavoroAdmin, campo_nome) == filtro_nome)
     
-    for lavoro in lavori:
-        num_fattura = getattr(lavoro, campo_fattura)
-        data_fattura = getattr(lavoro, campo_data)
-        comp = _active_compensi(lavoro)
-        compenso = comp.get(campo_compenso, 0.0)
-        
-        if num_fattura not in fatture_dict:
-            fatture_dict[num_fattura] = {
-                'numero': num_fattura,
-                'data': data_fattura.strftime('%Y-%m-%d') if data_fattura else None,
-                'lavori': [],
-                'totale_compensi': 0.0
-            }
-        
-        beni_list = []
-        if lavoro.beni_list:
-            for bene in sorted(lavoro.beni_list, key=lambda x: x.ordine):
-                if bene.stato != 'abbandonato':
-                    beni_list.append(bene.descrizione)
-        else:
-            if lavoro.bene:
-                beni_list = [b.strip() for b in lavoro.bene.split(' | ')]
-        
-        active_beni = [b for b in (lavoro.beni_list or []) if b.stato != 'abbandonato']
-        shown_importo = sum((b.importo_offerta or 0) for b in active_beni) if active_beni else (lavoro.importo_offerta or 0)
-        
-        fatture_dict[num_fattura]['lavori'].append({
-            'id': lavoro.id,
-            'numero': lavoro.numero,
-            'cliente': lavoro.cliente_nome or '',
-            'beni': beni_list,
-            'compenso': compenso,
-            'importo': shown_importo
-        })
-        
-        fatture_dict[num_fattura]['totale_compensi'] += compenso
-    
-    fatture_list = list(fatture_dict.values())
-    fatture_list.sort(key=lambda x: x['data'] or '', reverse=True)
-    
-    return jsonify({'fatture': fatture_list})
+    return _lista_fatture_json(tipo, *criteri)
 
 @bp.route('/api/fatturazione_esterni/lavori-disponibili/<tipo>')
 @login_required
+@con_etag('lavori')
 def lavori_disponibili_fatturazione_esterni(tipo):
     if current_user.role != 'admin':
         return jsonify({'error': 'Unauthorized'}), 403
@@ -2811,38 +2842,14 @@ def lavori_disponibili_fatturazione_esterni(tipo):
     # Parametro opzionale: numero fattura per includere anche i lavori già fatturati con quella fattura
     numero_fattura_filtro = request.args.get('fattura', '').strip()
     
-    # Trova lavori dove TUTTI i beni attivi hanno stato "incassata" o "chiusa"
-    tutti_lavori = db.session.query(LavoroAdmin).join(Bene, LavoroAdmin.id == Bene.lavoro_id).all()
-    lavori_ids_validi = []
-    
-    for lavoro in tutti_lavori:
-        if lavoro.beni_list and len(lavoro.beni_list) > 0:
-            beni_attivi = [b for b in lavoro.beni_list if b.stato != 'abbandonato']
-            if beni_attivi and all(b.stato in ['incassata', 'chiusa'] for b in beni_attivi):
-                lavori_ids_validi.append(lavoro.id)
-    
-    lavori_ids_validi = list(set(lavori_ids_validi))
-    
-    # Se è specificato un numero fattura, includi anche i lavori con quella fattura (anche se già fatturati)
-    lavori_ids_fatturati = []
+    # Lavori dove TUTTI i beni attivi hanno stato "incassata" o "chiusa";
+    # se è specificato un numero fattura, anche i lavori con quella fattura (anche se già fatturati)
+    disponibili = criterio_beni_in_stato('incassata', 'chiusa')
     if numero_fattura_filtro:
-        campo_fattura_obj = getattr(LavoroAdmin, campo_fattura)
-        query_fatturati = db.session.query(LavoroAdmin.id).filter(
-            campo_fattura_obj == numero_fattura_filtro,
-            getattr(LavoroAdmin, campo_compenso) > 0
-        )
-        if campo_nome and filtro_nome:
-            query_fatturati = query_fatturati.filter(getattr(LavoroAdmin, campo_nome) == filtro_nome)
-        lavori_ids_fatturati = [row[0] for row in query_fatturati.all()]
-    
-    # Unisci le due liste
-    tutti_ids = list(set(lavori_ids_validi + lavori_ids_fatturati))
+        disponibili = or_(disponibili, criterio_fattura(tipo, numero_fattura_filtro))
     
-    if not tutti_ids:
-        return jsonify({'lavori': []})
-    
-    query = LavoroAdmin.query.filter(
-        LavoroAdmin.id.in_(tutti_ids),
+    query = query_lavori_con_beni(
+        disponibili,
         getattr(LavoroAdmin, campo_compenso) > 0
     )
     
@@ -2914,7 +2921,7 @@ def aggiorna_fatturazione_esterni():
     campo_fattura, campo_data = tipo_map[tipo]
     
     lavori_con_vecchia_fattura = LavoroAdmin.query.filter(
-        getattr(LavoroAdmin, campo_fattura) == vecchio_numero
+        criterio_fattura(tipo, vecchio_numero)
     ).all()
     
     for lavoro in lavori_con_vecchia_fattura:
@@ -2991,6 +2998,7 @@ def rimuovi_lavoro_da_fattura_esterni():
             for bene in lavoro.beni_list:
                 if bene.stato == 'chiusa':
                     bene.stato = 'incassata'
+        entra_in_numerazione(lavoro)
     
     db.session.commit()
     
@@ -3028,8 +3036,8 @@ def elimina_fattura_esterni():
     campo_fattura, campo_data = tipo_map[tipo]
     
     # Trova tutti i lavori con questa fattura
-    lavori_con_fattura = LavoroAdmin.query.filter(
-        getattr(LavoroAdmin, campo_fattura) == numero_fattura
+    lavori_con_fattura = query_lavori_con_beni(
+        criterio_fattura(tipo, numero_fattura)
     ).all()
     
     if not lavori_con_fattura:
@@ -3049,6 +3057,7 @@ def elimina_fattura_esterni():
                 for bene in lavoro.beni_list:
                     if bene.stato == 'chiusa':
                         bene.stato = 'incassata'
+            entra_in_numerazione(lavoro)
         
         # Verifica se il lavoro deve essere riaperto
         verifica_e_chiudi_lavoro(lavoro)
@@ -3089,8 +3098,8 @@ def elimina_fattura():
     campo_fattura, campo_data = tipo_map[tipo]
     
     # Trova tutti i lavori con questa fattura
-    lavori_con_fattura = LavoroAdmin.query.filter(
-        getattr(LavoroAdmin, campo_fattura) == numero_fattura
+    lavori_con_fattura = query_lavori_con_beni(
+        criterio_fattura(tipo, numero_fattura)
     ).all()
     
     if not lavori_con_fattura:
@@ -3118,12 +3127,11 @@ def elimina_fattura():
                     for bene in lavoro.beni_list:
                         if bene.stato == 'chiusa':
                             bene.stato = 'incassata'
+                entra_in_numerazione(lavoro)
             
-            verifica_e_chiudi_lavoro(lavoro, ricalcola_numeri=False)
+            verifica_e_chiudi_lavoro(lavoro)
         lavori_aggiornati += 1
     
-    # Ricalcola i numeri sequenziali una sola volta dopo tutte le modifiche
-    ricalcola_numeri_sequenziali()
     db.session.commit()
     
     return jsonify({
@@ -3134,6 +3142,7 @@ def elimina_fattura():
 
 @bp.route('/api/fatturazione/lavori-disponibili/<tipo>')
 @login_required
+@con_etag('lavori')
 def lavori_disponibili_fatturazione(tipo):
     """Restituisce tutti i lavori disponibili per la fatturazione (inclusi quelli già fatturati)"""
     if current_user.role != 'admin':
@@ -3160,35 +3169,14 @@ def lavori_disponibili_fatturazione(tipo):
     else:
         stato_richiesto = 'incassata'
     
-    # Trova lavori dove TUTTI i beni attivi hanno lo stato richiesto
-    tutti_lavori = db.session.query(LavoroAdmin).join(Bene, LavoroAdmin.id == Bene.lavoro_id).all()
-    lavori_ids_validi = []
-    
-    for lavoro in tutti_lavori:
-        if lavoro.beni_list and len(lavoro.beni_list) > 0:
-            beni_attivi = [b for b in lavoro.beni_list if b.stato != 'abbandonato']
-            if beni_attivi and all(b.stato == stato_richiesto for b in beni_attivi):
-                lavori_ids_validi.append(lavoro.id)
-    
-    lavori_ids_validi = list(set(lavori_ids_validi))
-    
-    # Se è specificato un numero fattura, includi anche i lavori già fatturati con quella fattura
-    lavori_ids_fatturati = []
+    # Lavori dove TUTTI i beni attivi hanno lo stato richiesto; se è specificato
+    # un numero fattura, anche i lavori già fatturati con quella fattura
+    disponibili = criterio_beni_in_stato(stato_richiesto)
     if numero_fattura_filtro:
-        campo_fattura_obj = getattr(LavoroAdmin, campo_fattura)
-        lavori_ids_fatturati = [row[0] for row in db.session.query(LavoroAdmin.id).filter(
-            campo_fattura_obj == numero_fattura_filtro,
-            getattr(LavoroAdmin, campo_compenso) > 0
-        ).all()]
+        disponibili = or_(disponibili, criterio_fattura(tipo, numero_fattura_filtro))
     
-    # Unisci le due liste
-    tutti_ids = list(set(lavori_ids_validi + lavori_ids_fatturati))
-    
-    if not tutti_ids:
-        return jsonify({'lavori': []})
-    
-    lavori = LavoroAdmin.query.filter(
-        LavoroAdmin.id.in_(tutti_ids),
+    lavori = query_lavori_con_beni(
+        disponibili,
         getattr(LavoroAdmin, campo_compenso) > 0
     ).order_by(LavoroAdmin.numero.asc()).all()
     
@@ -3225,8 +3213,9 @@ def lavori_disponibili_fatturazione(tipo):
     
     return jsonify({'lavori': lavori_data})
 
-@bp.route('/api/fatturazione/dettaglio/<tipo>/<numero_fattura>')
+@bp.route('/api/fatturazione/dettaglio/<tipo>/<path:numero_fattura>')
 @login_required
+@con_etag('lavori')
 def dettaglio_fattura(tipo, numero_fattura):
     if current_user.role != 'admin':
         return jsonify({'error': 'Unauthorized'}), 403
@@ -3243,13 +3232,14 @@ def dettaglio_fattura(tipo, numero_fattura):
     
     campo_fattura, campo_data, campo_compenso = tipo_map[tipo]
     
-    # Trova tutti i lavori con questa fattura
-    lavori = LavoroAdmin.query.filter(
-        getattr(LavoroAdmin, campo_fattura) == numero_fattura
-    ).all()
+    # Trova tutti i lavori con questa fattura (righe in ordine di lavoro)
+    fattura = Fattura.query.filter_by(soggetto=tipo, numero=numero_fattura).first()
+    righe = righe_fatture([fattura.id]) if fattura else []
+    lavori = [riga.lavoro for riga in righe]
     
     lavori_list = []
-    for lavoro in lavori:
+    for riga in righe:
+        lavoro = riga.lavoro
         # Recupera beni
         beni_list = []
         if lavoro.beni_list:
@@ -3267,6 +3257,13 @@ def dettaglio_fattura(tipo, numero_fattura):
             'compenso': getattr(lavoro, campo_compenso) or 0.0,
             'importo': lavoro.importo_offerta or 0.0
         })
+        # Valori mostrati nell'elenco fatture (beni attivi e compenso fatturato)
+        attivo = _lavoro_fattura_json(riga)
+        lavori_list[-1].update(
+            beni_attivi=attivo['beni'],
+            compenso_fatturato=attivo['compenso'],
+            importo_attivo=attivo['importo'],
+        )
     
     # Recupera la data della fattura dal primo lavoro
     data_fattura = None
@@ -3278,6 +3275,7 @@ def dettaglio_fattura(tipo, numero_fattura):
     return jsonify({
         'numero': numero_fattura,
         'data': data_fattura,
+        'totale_compensi': (fattura.totale_compensi or 0.0) if fattura else 0.0,
         'lavori': lavori_list
     })
 
@@ -3310,7 +3308,7 @@ def aggiorna_fatturazione():
     
     # 1. Rimuovi la fattura da tutti i lavori che avevano il vecchio numero
     lavori_con_vecchia_fattura = LavoroAdmin.query.filter(
-        getattr(LavoroAdmin, campo_fattura) == vecchio_numero
+        criterio_fattura(tipo, vecchio_numero)
     ).all()
     
     lavori_modificati_ids = set()
@@ -3353,14 +3351,13 @@ def aggiorna_fatturazione():
                             if bene.stato == 'da fatturare':
                                 bene.stato = 'da incassare'
     
-    # 3. Gestione chiusura/ricalcolo
-    if tipo == 'fe':
-        ricalcola_numeri_sequenziali()
-    else:
-        lavori_modificati = LavoroAdmin.query.filter(LavoroAdmin.id.in_(list(lavori_modificati_ids))).all()
+    # 3. Gestione chiusura/riapertura
+    # Per FE le transizioni "da fatturare" <-> "da incassare" non cambiano la numerazione;
+    # per gli altri verifica_e_chiudi_lavoro aggiorna la numerazione solo dei lavori chiusi/riaperti.
+    if tipo != 'fe':
+        lavori_modificati = query_lavori_con_beni(LavoroAdmin.id.in_(list(lavori_modificati_ids))).all()
         for lavoro in lavori_modificati:
-            verifica_e_chiudi_lavoro(lavoro, ricalcola_numeri=False)
-        ricalcola_numeri_sequenziali()
+            verifica_e_chiudi_lavoro(lavoro)
     
     db.session.commit()
     
@@ -3427,11 +3424,39 @@ def rimuovi_lavoro_da_fattura():
                 for bene in lavoro.beni_list:
                     if bene.stato == 'chiusa':
                         bene.stato = 'incassata'
+            entra_in_numerazione(lavoro)
     
-    ricalcola_numeri_sequenziali()
     db.session.commit()
     
     return jsonify({
         'success': True,
         'messaggio': f'Lavoro rimosso dalla fattura {numero_fattura}.'
-    })
\ No newline at end of file
+    })
+
+
+@bp.route('/api/search')
+@login_required
+@con_etag('lavori', 'note')
+def api_search():
+    """
+    Ricerca full-text su lavori, beni, clienti e note admin (?q=...&limite=...).
+    Ogni parola è un prefisso e deve comparire; risultati dal più pertinente,
+    con i termini trovati evidenziati in <mark>. Un q di sole cifre trova
+    prima i lavori con quel numero.
+    """
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Accesso negato'}), 403
+
+    q = request.args.get('q', '').strip()
+    limite = min(max(request.args.get('limite', 20, type=int), 1), 100)
+    return jsonify({'q': q, 'risultati': cerca_full_text(q, limite)})
+
+
+@bp.route('/api/diagnostica/endpoint')
+@login_required
+def diagnostica_endpoint():
+    """Tempi e query per endpoint registrati da questo worker dall'avvio (solo admin)"""
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Accesso negato'}), 403
+    
+    return jsonify({'endpoint': statistiche_endpoint()})
@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import heapq
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Cliente, LavoroAdmin
+from app.utils.modifiche import colonne_aggiornate
+
+
+# Suggerimenti dei campi con autocompletamento di lavori_admin (clienti, esterni,
+# revisori, caricamenti, sabatini). Invece di un ILIKE '%q%' (scansione completa
+# della tabella) a ogni tasto, ogni dominio tiene in memoria i nomi distinti con
+# la loro frequenza d'uso e un array ordinato degli inizi di parola (minuscoli e
+# senza accenti) su cui cercare con bisect. Risultati: prima i nomi che iniziano
+# con il testo digitato, poi quelli con una parola che inizia così, poi le altre
+# sottostringhe; a parità, i più usati.
+# L'indice di un dominio viene scartato al commit di una modifica che lo tocca e
+# ricostruito alla richiesta successiva. Gli altri processi (più worker) non
+# ricevono l'invalidazione: il loro indice scade comunque dopo _DURATA_MAX.
+
+_DURATA_MAX = 300  # Secondi
+_RISULTATI_MAX = 2048  # Ricerche memorizzate per indice
+_FLAG = 'autocomplete_da_invalidare'
+
+# Dominio -> colonna di LavoroAdmin con il nome
+COLONNE_NOMI = {
+    'esterni': LavoroAdmin.nome_esterno,
+    'revisori': LavoroAdmin.nome_revisore,
+    'caricamenti': LavoroAdmin.nome_caricamento,
+    'sabatini': LavoroAdmin.nome_sabatini,
+}
+DOMINI = ('clienti', *COLONNE_NOMI)
+
+_CAMPI_CLIENTE = ('nome', 'p_iva', 'indirizzo', 'civico', 'cap', 'comune', 'provincia', 'pec')
+
+
+def normalizza(testo):
+    """Minuscolo, senza accenti e con gli spazi compattati."""
+    decomposto = unicodedata.normalize('NFKD', testo or '')
+    senza_accenti = ''.join(c for c in decomposto if not unicodedata.combining(c))
+    return ' '.join(senza_accenti.casefold().split())
+
+
+class _Indice:
+    def __init__(self, voci):
+        # voci: (nome, frequenza, valore restituito)
+        self.voci = voci
+        self.chiavi = [normalizza(nome) for nome, _, _ in voci]
+        # Posizione di ogni voce nell'ordine (più usate, alfabetico): spareggio dei risultati
+        self.ordine = [0] * len(voci)
+        for pos, i in enumerate(sorted(range(len(voci)), key=lambda i: (-voci[i][1], self.chiavi[i]))):
+            self.ordine[i] = pos
+        inizi = []
+        for i, chiave in enumerate(self.chiavi):
+            for pos, c in enumerate(chiave):
+                if pos == 0 or (not chiave[pos - 1].isalnum() and c.isalnum()):
+                    inizi.append((chiave[pos:], i))
+        inizi.sort()
+        self.inizi = inizi
+        # I risultati non cambiano finché l'indice vive: i tasti ripetuti
+        # (e i prefissi corti, i più costosi) vengono serviti da qui
+        self.risultati = {}
+        self.creato = time.monotonic()
+
+    def cerca(self, testo, limite):
+        q = normalizza(testo)
+        if not q:
+            return []
+        risultato = self.risultati.get((q, limite))
+        if risultato is None:
+            if len(self.risultati) >= _RISULTATI_MAX:
+                self.risultati.clear()
+            risultato = self.risultati[(q, limite)] = self._cerca(q, limite)
+        return risultato
+
+    def _cerca(self, q, limite):
+        # rango: 0 = il nome inizia con q, 1 = una parola inizia con q, 2 = sottostringa
+        rango = {}
+        da = bisect_left(self.inizi, (q,))
+        a = bisect_left(self.inizi, (q + '\U0010ffff',), da)
+        for suffisso, i in self.inizi[da:a]:
+            r = 0 if len(suffisso) == len(self.chiavi[i]) else 1
+            if r < rango.get(i, 2):
+                rango[i] = r
+        if len(rango) < limite:
+            for i, chiave in enumerate(self.chiavi):
+                if i not in rango and q in chiave:
+                    rango[i] = 2
+        migliori = heapq.nsmallest(limite, rango, key=lambda i: (rango[i], self.ordine[i]))
+        return [self.voci[i][2] for i in migliori]
+
+
+def _voci_clienti():
+    uso = (
+        select(LavoroAdmin.cliente_id, func.count().label('n'))
+        .group_by(LavoroAdmin.cliente_id)
+        .subquery()
+    )
+    righe = db.session.execute(
+        select(*[getattr(Cliente, campo) for campo in _CAMPI_CLIENTE], func.coalesce(uso.c.n, 0))
+        .outerjoin(uso, uso.c.cliente_id == Cliente.id)
+        .where(Cliente.nome.is_not(None), Cliente.nome != '')
+    )
+    return [(r.nome, r[-1], dict(zip(_CAMPI_CLIENTE, r[:-1]))) for r in righe]
+
+
+def _voci_nomi(colonna):
+    righe = db.session.execute(
+        select(colonna, func.count())
+        .where(colonna.is_not(None), colonna != '')
+        .group_by(colonna)
+    )
+    return [(nome, n, nome) for nome, n in righe]
+
+
+_indici = {}
+_generazioni = {}  # Dominio -> numero di invalidazioni
+_lock = threading.Lock()
+
+
+def _indice(dominio):
+    indice = _indici.get(dominio)
+    if indice is not None and time.monotonic() - indice.creato <= _DURATA_MAX:
+        return indice
+    generazione = _generazioni.get(dominio, 0)
+    voci = _voci_clienti() if dominio == 'clienti' else _voci_nomi(COLONNE_NOMI[dominio])
+    indice = _Indice(voci)
+    with _lock:
+        # Se nel frattempo è arrivata un'invalidazione l'indice vale solo per questa richiesta
+        if _generazioni.get(dominio, 0) == generazione:
+            _indici[dominio] = indice
+    return indice
+
+
+def suggerimenti(dominio, testo, limite=10):
+    """
+    Fino a `limite` suggerimenti per `testo` nel dominio: dict con i dati del
+    cliente per 'clienti', altrimenti i nomi.
+    """
+    return _indice(dominio).cerca(testo, limite)
+
+
+def invalida(*domini):
+    """Scarta gli indici indicati (tutti se non specificati)."""
+    with _lock:
+        for dominio in domini or DOMINI:
+            _indici.pop(dominio, None)
+            _generazioni[dominio] = _generazioni.get(dominio, 0) + 1
+
+
+# --- INVALIDAZIONE AL COMMIT ---
+
+def _domini_toccati(session):
+    domini = set()
+    for obj in session.new | session.deleted:
+        if isinstance(obj, Cliente):
+            domini.add('clienti')
+        elif isinstance(obj, LavoroAdmin):
+            domini.add('clienti')
+            domini.update(d for d, col in COLONNE_NOMI.items() if getattr(obj, col.key))
+    for obj in session.dirty:
+        if isinstance(obj, Cliente):
+            domini.add('clienti')
+        elif isinstance(obj, LavoroAdmin):
+            attrs = inspect(obj).attrs
+            if attrs.cliente_id.history.has_changes():
+                domini.add('clienti')
+            domini.update(d for d, col in COLONNE_NOMI.items() if attrs[col.key].history.has_changes())
+    return domini
+
+
+@event.listens_for(Session, 'after_flush')
+def _segna_modifiche(session, flush_context):
+    domini = _domini_toccati(session)
+    if domini:
+        session.info.setdefault(_FLAG, set()).update(domini)
+
+
+def _domini_aggiornati(classe, aggiornate):
+    # aggiornate None (DELETE o colonne non note): tutti i domini del modello
+    if classe is Cliente:
+        return {'clienti'} if aggiornate is None or aggiornate & set(_CAMPI_CLIENTE) else set()
+    if classe is LavoroAdmin:
+        if aggiornate is None:
+            return set(DOMINI)
+        domini = {d for d, col in COLONNE_NOMI.items() if col.key in aggiornate}
+        if 'cliente_id' in aggiornate:
+            domini.add('clienti')
+        return domini
+    return set()
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _segna_modifiche_bulk(orm_execute_state):
+    # Solo i domini delle colonne assegnate: la rinumerazione
+    # (SET numero = numero ± 1) non invalida nulla
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    aggiornate = colonne_aggiornate(orm_execute_state)
+    domini = set()
+    for mapper in orm_execute_state.all_mappers:
+        domini |= _domini_aggiornati(mapper.class_, aggiornate)
+    if domini:
+        orm_execute_state.session.info.setdefault(_FLAG, set()).update(domini)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalida_al_commit(session):
+    domini = session.info.pop(_FLAG, None)
+    if domini:
+        invalida(*domini)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _annulla_flag(session):
+    session.info.pop(_FLAG, None)
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# numpy viene importato al primo calcolo (dentro le funzioni), non all'avvio
+# dell'app: il modulo è importato all'avvio dal sync delle fatture.
+
+
+COMPENSI_KEYS = (
+    'c_fe', 'c_amin', 'c_galvan', 'c_fh', 'c_bianc',
+    'c_deloitte', 'c_ext', 'c_revisore', 'c_caricamento', 'c_sabatini',
+)
+
+# Colonne numeriche di LavoroAdmin usate dal calcolo (None -> 0)
+_COLONNE_FLOAT = COMPENSI_KEYS + ('importo_revisione', 'importo_caricamento', 'importo_sabatini')
+_COLONNE_FLAG = ('has_revisore', 'has_caricamento', 'has_sabatini', 'spese_amministrative')
+# Tutte le colonne di LavoroAdmin lette da colonne_lavori
+COLONNE_LAVORO = ('importo_offerta', 'origine', 'redattore') + _COLONNE_FLOAT + _COLONNE_FLAG
+
+
+def _upper(values) -> np.ndarray:
+    import numpy as np
+
+    arr = np.asarray(values, dtype=object)
+    arr = np.where(arr == None, '', arr).astype(str)  # noqa: E711
+    return np.char.upper(arr)
+
+
+def recalc_compensi_batch(*, shown_importo, total_importo, origine, redattore,
+                          c_fe, c_amin, c_galvan, c_fh, c_bianc, c_deloitte,
+                          c_ext, c_revisore, c_caricamento, c_sabatini,
+                          importo_revisione, importo_caricamento, importo_sabatini,
+                          has_revisore, has_caricamento, has_sabatini,
+                          spese_amministrative, calcolo_automatico=False) -> dict[str, np.ndarray]:
+    """
+    Versione vettoriale di _recalc_compensi (app/routes/main_routes.py): riceve
+    le colonne di N lavori come array e restituisce i dieci array dei compensi.
+    Replica le stesse operazioni in virgola mobile nello stesso ordine, quindi i
+    risultati coincidono con quelli calcolati lavoro per lavoro.
+
+    Con calcolo_automatico=True restituisce i compensi che il form calcola alla
+    creazione (calcolaCompensi): calcolo automatico sui lavori non manuali
+    anche con ratio 1, valori ricevuti invariati su quelli manuali.
+    """
+    import numpy as np
+
+    f = lambda a: np.asarray(a, dtype=np.float64)
+    b = lambda a: np.asarray(a, dtype=bool)
+
+    shown = f(shown_importo)
+    total = f(total_importo)
+    c_fe, c_amin, c_galvan, c_fh, c_bianc, c_deloitte = map(f, (c_fe, c_amin, c_galvan, c_fh, c_bianc, c_deloitte))
+    c_ext, c_revisore, c_caricamento, c_sabatini = map(f, (c_ext, c_revisore, c_caricamento, c_sabatini))
+    importo_rev, importo_car, importo_sab = map(f, (importo_revisione, importo_caricamento, importo_sabatini))
+    has_rev, has_car, has_sab, spese_flag = map(b, (has_revisore, has_caricamento, has_sabatini, spese_amministrative))
+
+    origine = _upper(origine)
+    redattore = _upper(redattore)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(total > 0, shown / np.where(total > 0, total, 1.0), 1.0)
+    invariato = ratio == 1.0
+
+    is_manual = (np.isin(origine, ('BIANC', 'DELOITTE')) | np.isin(redattore, ('BIANC', 'DELOITTE'))
+                 | (origine == '') | (redattore == ''))
+
+    # Calcolo automatico (lavori non manuali)
+    diff_rev = np.where(has_rev, np.maximum(0, importo_rev - c_revisore), 0.0)
+    diff_car = np.where(has_car, np.maximum(0, importo_car - c_caricamento), 0.0)
+    diff_sab = np.where(has_sab, np.maximum(0, importo_sab - c_sabatini), 0.0)
+
+    totale_lavoro = shown + importo_rev + importo_car + importo_sab
+    spese_amm = np.where(spese_flag, totale_lavoro * 0.06, 0.0)
+
+    base_per_15 = np.maximum(0, shown - c_ext)
+    fe15 = base_per_15 * 0.15
+    auto_fe = diff_rev + diff_car + diff_sab + spese_amm + fe15
+    resto = base_per_15 - fe15
+
+    is_ext = origine == 'EXT'
+    is_fh = origine == 'FH'
+    red_amin = redattore == 'AMIN'
+    red_galvan = redattore == 'GALVAN'
+    red_fh = redattore == 'FH'
+
+    auto_amin = np.select(
+        [is_ext & red_amin, (origine == 'AMIN') & red_amin, is_fh & red_amin],
+        [resto * 0.70, resto * 0.70, resto * 0.50], 0.0)
+    auto_galvan = np.select(
+        [is_ext & red_galvan, (origine == 'GALVAN') & red_galvan, is_fh & red_galvan],
+        [resto * 0.70, resto * 0.70, resto * 0.50], 0.0)
+    auto_fh = np.select(
+        [is_ext & red_fh, is_ext, (origine == 'AMIN') & red_amin, (origine == 'GALVAN') & red_galvan,
+         is_fh & red_fh, is_fh],
+        [resto * 0.30 + resto * 0.70, resto * 0.30, resto * 0.30, resto * 0.30, resto, resto * 0.50], 0.0)
+    auto_bianc = np.where(is_ext & (redattore == 'BIANC'), resto * 0.70, 0.0)
+    auto_deloitte = np.where(is_ext & (redattore == 'DELOITTE'), resto * 0.70, 0.0)
+
+    def scegli(originale, automatico):
+        if calcolo_automatico:
+            return np.where(is_manual, originale, automatico)
+        # ratio == 1 -> valore salvato; manuale -> proporzionale; altrimenti calcolo automatico
+        return np.where(invariato, originale, np.where(is_manual, originale * ratio, automatico))
+
+    return {
+        'c_fe': scegli(c_fe, auto_fe),
+        'c_amin': scegli(c_amin, auto_amin),
+        'c_galvan': scegli(c_galvan, auto_galvan),
+        'c_fh': scegli(c_fh, auto_fh),
+        'c_bianc': scegli(c_bianc, auto_bianc),
+        'c_deloitte': scegli(c_deloitte, auto_deloitte),
+        'c_ext': c_ext,
+        'c_revisore': c_revisore,
+        'c_caricamento': c_caricamento,
+        'c_sabatini': c_sabatini,
+    }
+
+
+def colonne_lavori(lavori) -> dict[str, np.ndarray]:
+    """
+    Estrae da una lista di LavoroAdmin (con beni precaricati) le colonne usate da
+    recalc_compensi_batch, con shown/total importo calcolati come _active_compensi
+    (beni abbandonati esclusi dal mostrato).
+    """
+    import numpy as np
+
+    shown, total = [], []
+    for lavoro in lavori:
+        all_beni = lavoro.beni_list or []
+        if all_beni:
+            total.append(sum((b.importo_offerta or 0) for b in all_beni))
+            shown.append(sum((b.importo_offerta or 0) for b in all_beni if b.stato != 'abbandonato'))
+        else:
+            importo = lavoro.importo_offerta or 0
+            total.append(importo)
+            shown.append(importo)
+
+    colonne = {
+        'shown_importo': np.asarray(shown, dtype=np.float64),
+        'total_importo': np.asarray(total, dtype=np.float64),
+        'origine': np.asarray([l.origine for l in lavori], dtype=object),
+        'redattore': np.asarray([l.redattore for l in lavori], dtype=object),
+    }
+    for col in _COLONNE_FLOAT:
+        colonne[col] = np.asarray([getattr(l, col, 0) or 0 for l in lavori], dtype=np.float64)
+    for col in _COLONNE_FLAG:
+        colonne[col] = np.asarray([bool(getattr(l, col, False)) for l in lavori], dtype=bool)
+    return colonne
+
+
+def active_compensi_batch(lavori) -> dict[str, np.ndarray]:
+    """Equivalente vettoriale di [_active_compensi(l) for l in lavori]."""
+    return recalc_compensi_batch(**colonne_lavori(lavori))
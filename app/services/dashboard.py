@@ -0,0 +1,299 @@
+from __future__ import annotations
+
+from datetime import date, datetime
+
+from sqlalchemy import delete, event, inspect, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Bene, DashboardContributo, DashboardSummary, LavoroAdmin
+from app.services.compensi import COLONNE_LAVORO, colonne_lavori, recalc_compensi_batch
+from app.services.lavori import with_beni
+from app.utils.modifiche import colonne_aggiornate, colonne_modificate
+
+
+# I totali della dashboard admin sono la somma dei contributi dei singoli
+# lavori. DashboardContributo conserva il contributo di ogni lavoro e la riga
+# di DashboardSummary la loro somma.
+# In before_commit, nella stessa transazione, vengono ricalcolati solo i
+# contributi dei lavori toccati dal flush (o dei lavori dei beni toccati) e la
+# riga riceve la differenza tra nuovi e vecchi: il costo dipende dai lavori
+# modificati, non da quanti sono in tutto. La vista della dashboard legge solo
+# la riga, senza scrivere nulla.
+# I ritardi "da incassare" dipendono dalla data odierna: la riga conserva
+# quanti lavori da incassare hanno ogni data fattura FE e le settimane di
+# ritardo vengono contate alla lettura.
+# Un UPDATE massivo su colonne usate dal calcolo (righe non note) ricalcola
+# tutto, come ricostruisci_dashboard_summary.
+
+_SUMMARY_ID = 1
+_FLAG = 'dashboard_lavori_da_aggiornare'
+_TUTTI = 'tutti'
+_DATE_FATTURA = 'date_fattura_da_incassare'  # Data fattura FE -> lavori da incassare
+
+# Colonne usate dal calcolo: le modifiche ad altre colonne (note, date,
+# numero, ...) non toccano i contributi
+_COLONNE = {
+    LavoroAdmin: frozenset({
+        'stato', 'is_fully_abbandonato', 'data_fattura_fe',
+        'f_fe', 'f_amin', 'f_galvan', 'f_fh', *COLONNE_LAVORO,
+    }),
+    Bene: frozenset({'stato', 'importo_offerta', 'lavoro_id'}),
+}
+
+_STATI_ESCLUSI_IN_LAVORAZIONE = {
+    'abbandonato',
+    'chiusa',
+    'da firmare',
+    'da fatturare',
+    'da incassare',
+    'incassata',
+}
+
+
+def contributi_lavori(session, ids=None):
+    """
+    Contributo ai totali della dashboard dei lavori indicati (tutti se None):
+    {lavoro_id: {chiave: valore}}, con le sole voci diverse da zero.
+    """
+    query = with_beni(session.query(LavoroAdmin)).execution_options(populate_existing=True)
+    if ids is not None:
+        query = query.filter(LavoroAdmin.id.in_(ids))
+    lavori = query.all()
+    if not lavori:
+        return {}
+
+    # ESCLUDI solo i lavori con TUTTI i beni abbandonati dai totali.
+    # Lavori parzialmente abbandonati restano inclusi.
+    inclusi = [lavoro for lavoro in lavori if not lavoro.is_fully_abbandonato]
+    colonne = colonne_lavori(inclusi)
+    comp = recalc_compensi_batch(**colonne) if inclusi else {}
+    riga = {lavoro.id: i for i, lavoro in enumerate(inclusi)}
+
+    contributi = {}
+    for lavoro in lavori:
+        beni = lavoro.beni_list or []
+        beni_attivi = [b for b in beni if b.stato != 'abbandonato']
+        chiusa = lavoro.stato == 'chiusa'
+        c = {
+            'completati': int(chiusa),
+            # Abbandonati: conta i singoli beni con stato "abbandonato"
+            'abbandonati': len(beni) - len(beni_attivi),
+        }
+
+        i = riga.get(lavoro.id)
+        if i is not None:
+            all_da_fatturare = bool(beni_attivi) and all(b.stato == 'da fatturare' for b in beni_attivi)
+            incassato = not chiusa and bool(beni_attivi) and all(b.stato == 'incassata' for b in beni_attivi)
+            has_f = {k: bool(getattr(lavoro, k) and str(getattr(lavoro, k)).strip())
+                     for k in ('f_fe', 'f_amin', 'f_galvan', 'f_fh')}
+            shown = float(colonne['shown_importo'][i])
+            compenso = {k: float(comp[f'c_{k}'][i]) for k in ('fe', 'amin', 'galvan', 'fh')}
+            c.update({
+                'tot_importo': shown,
+                'tot_importo_da_fatturare': shown if not chiusa and all_da_fatturare else 0,
+                'tot_importo_incassata': shown if chiusa or incassato else 0,
+                'total_lavori': int(not chiusa),
+                'in_corso': int(not chiusa and any(b.stato is not None and b.stato not in _STATI_ESCLUSI_IN_LAVORAZIONE for b in beni)),
+            })
+            for k, valore in compenso.items():
+                c[f'tot_{k}'] = valore
+                c[f'tot_{k}_fatturato'] = valore if has_f[f'f_{k}'] or chiusa else 0
+                if k != 'fe':
+                    c[f'tot_{k}_incassata'] = valore if incassato and not has_f[f'f_{k}'] else 0
+
+        # --- LAVORI DA INCASSARE (Fatturati FE ma non ancora incassati) ---
+        # Lavori con almeno un bene con stato "da incassare"
+        if any(b.stato == 'da incassare' for b in beni):
+            c['da_incassare_totale'] = 1
+            if beni_attivi:
+                c['importo_da_incassare'] = sum((b.importo_offerta or 0) for b in beni_attivi)
+            else:
+                c['importo_da_incassare'] = lavoro.importo_offerta or 0
+            if lavoro.data_fattura_fe:
+                c['data_fattura_fe'] = lavoro.data_fattura_fe.isoformat()
+
+        contributi[lavoro.id] = {k: v for k, v in c.items() if v}
+    return contributi
+
+
+def _applica(totali, contributo, segno):
+    for chiave, valore in contributo.items():
+        if chiave == 'data_fattura_fe':
+            date_fattura = totali.setdefault(_DATE_FATTURA, {})
+            n = date_fattura.get(valore, 0) + segno
+            if n:
+                date_fattura[valore] = n
+            else:
+                date_fattura.pop(valore, None)
+        else:
+            totali[chiave] = totali.get(chiave, 0) + segno * valore
+
+
+def somma_contributi(contributi):
+    """Totali salvati in DashboardSummary.dati a partire dai contributi dei lavori."""
+    totali = {}
+    for contributo in contributi:
+        _applica(totali, contributo, 1)
+    return totali
+
+
+def dati_dashboard(totali, oggi):
+    """Dati mostrati in dashboard: totali salvati più i ritardi "da incassare" a `oggi`."""
+    dati = {
+        chiave: totali.get(chiave, 0)
+        for chiave in (
+            'tot_importo', 'tot_importo_da_fatturare', 'tot_importo_incassata',
+            'tot_fe', 'tot_amin', 'tot_galvan', 'tot_fh',
+            'tot_fe_incassata', 'tot_amin_incassata', 'tot_galvan_incassata', 'tot_fh_incassata',
+            'tot_fe_fatturato', 'tot_amin_fatturato', 'tot_galvan_fatturato', 'tot_fh_fatturato',
+            'total_lavori', 'in_corso', 'completati', 'abbandonati',
+            'da_incassare_totale', 'importo_da_incassare',
+        )
+    }
+
+    # Conteggio per settimane di ritardo (dalla data fattura FE)
+    da_incassare_2w = 0
+    da_incassare_3w = 0
+    da_incassare_4w = 0
+    for data_fattura, n in totali.get(_DATE_FATTURA, {}).items():
+        giorni = (oggi - date.fromisoformat(data_fattura)).days
+        if giorni >= 28:  # 4+ settimane
+            da_incassare_4w += n
+        elif giorni >= 21:  # 3+ settimane
+            da_incassare_3w += n
+        elif giorni >= 14:  # 2+ settimane
+            da_incassare_2w += n
+    dati['da_incassare_2w'] = da_incassare_2w
+    dati['da_incassare_3w'] = da_incassare_3w
+    dati['da_incassare_4w'] = da_incassare_4w
+    return dati
+
+
+def calcola_dashboard_summary(session, oggi):
+    """Calcola da zero i totali e i conteggi della dashboard admin."""
+    return dati_dashboard(somma_contributi(contributi_lavori(session).values()), oggi)
+
+
+def _salva_totali(session, totali):
+    summary = session.get(DashboardSummary, _SUMMARY_ID)
+    if summary is None:
+        summary = DashboardSummary(id=_SUMMARY_ID, dati=totali, data_riferimento=datetime.now().date())
+        session.add(summary)
+    else:
+        summary.dati = totali
+        summary.data_riferimento = datetime.now().date()
+    return summary
+
+
+def ricostruisci_dashboard_summary(session):
+    """
+    Ricalcola da zero (senza commit) i contributi di tutti i lavori e la riga
+    di DashboardSummary. Per la migrazione, i dati inseriti senza passare
+    dall'ORM e gli UPDATE massivi.
+    """
+    contributi = contributi_lavori(session)
+    t = DashboardContributo.__table__
+    session.execute(delete(t))
+    if contributi:
+        session.execute(insert(t), [{'lavoro_id': lavoro_id, 'dati': c} for lavoro_id, c in contributi.items()])
+    return _salva_totali(session, somma_contributi(contributi.values()))
+
+
+def aggiorna_contributi(session, ids):
+    """
+    Ricalcola (senza commit) i contributi dei lavori `ids` e applica alla riga
+    di DashboardSummary la differenza con quelli salvati.
+    """
+    summary = session.get(DashboardSummary, _SUMMARY_ID)
+    if summary is None:
+        return ricostruisci_dashboard_summary(session)
+
+    t = DashboardContributo.__table__
+    vecchi = dict(session.execute(select(t.c.lavoro_id, t.c.dati).where(t.c.lavoro_id.in_(ids))).all())
+    nuovi = contributi_lavori(session, ids)
+    totali = {**summary.dati, _DATE_FATTURA: dict(summary.dati.get(_DATE_FATTURA, {}))}
+    for lavoro_id in ids:
+        vecchio, nuovo = vecchi.get(lavoro_id), nuovi.get(lavoro_id)
+        if vecchio == nuovo:
+            continue
+        if vecchio is not None:
+            _applica(totali, vecchio, -1)
+        if nuovo is not None:
+            _applica(totali, nuovo, 1)
+            stmt = insert(t).values(lavoro_id=lavoro_id, dati=nuovo)
+            session.execute(stmt.on_conflict_do_update(index_elements=[t.c.lavoro_id], set_={'dati': nuovo}))
+        else:
+            session.execute(delete(t).where(t.c.lavoro_id == lavoro_id))
+    return _salva_totali(session, totali)
+
+
+def get_dashboard_summary():
+    """
+    Restituisce i dati della dashboard admin leggendo la riga precalcolata
+    (sola lettura). Se la riga manca, prima della migrazione, li calcola da
+    zero senza salvarli.
+    """
+    oggi = datetime.now().date()
+    summary = db.session.get(DashboardSummary, _SUMMARY_ID)
+    if summary is None:
+        return calcola_dashboard_summary(db.session, oggi)
+    return dati_dashboard(summary.dati, oggi)
+
+
+# --- AGGIORNAMENTO AL COMMIT ---
+
+def _lavori_toccati(session):
+    ids = set()
+    for obj in session.new | session.deleted:
+        if isinstance(obj, LavoroAdmin):
+            ids.add(obj.id)
+        elif isinstance(obj, Bene):
+            ids.add(obj.lavoro_id)
+            ids.update(inspect(obj).attrs.lavoro_id.history.deleted)
+    for obj in session.dirty:
+        colonne = _COLONNE.get(type(obj))
+        if not colonne or not colonne_modificate(obj, colonne):
+            continue
+        if isinstance(obj, LavoroAdmin):
+            ids.add(obj.id)
+        else:
+            ids.add(obj.lavoro_id)
+            ids.update(inspect(obj).attrs.lavoro_id.history.deleted)
+    ids.discard(None)
+    return ids
+
+
+@event.listens_for(Session, 'after_flush')
+def _segna_modifiche(session, flush_context):
+    ids = _lavori_toccati(session)
+    if ids and session.info.get(_FLAG) != _TUTTI:
+        session.info.setdefault(_FLAG, set()).update(ids)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _segna_modifiche_bulk(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    aggiornate = colonne_aggiornate(orm_execute_state)
+    for mapper in orm_execute_state.all_mappers:
+        colonne = _COLONNE.get(mapper.class_)
+        # DELETE o colonne non note: righe toccate sconosciute, si ricalcola tutto
+        if colonne and (aggiornate is None or aggiornate & colonne):
+            orm_execute_state.session.info[_FLAG] = _TUTTI
+
+
+@event.listens_for(Session, 'before_commit')
+def _aggiorna_al_commit(session):
+    session.flush()
+    ids = session.info.pop(_FLAG, None)
+    if ids == _TUTTI:
+        ricostruisci_dashboard_summary(session)
+    elif ids:
+        aggiorna_contributi(session, sorted(ids))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _annulla_flag(session):
+    session.info.pop(_FLAG, None)
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import json
+import queue
+import threading
+import time
+
+from app import db
+from app.services.versioni import versioni
+
+
+# Eventi in tempo reale per gli admin (Server-Sent Events su /api/eventi).
+# Le rotte delle note e del changelog pubblicano un evento dopo il commit e ogni
+# connessione aperta ha una coda in questo processo.
+# Con più worker gli altri processi non ricevono la pubblicazione. Per questo
+# lo stream controlla le versioni 'note' / 'changelog' (app/services/versioni.py)
+# a ogni keepalive e, se sono cambiate, invia 'aggiorna': il client ricarica quei
+# dati.
+# Ogni connessione si chiude dopo una durata massima e il browser (EventSource)
+# si riconnette da solo, così nessun thread resta occupato a tempo indeterminato.
+
+DOMINI_EVENTI = ('note', 'changelog')
+_DOMINIO_EVENTO = {'nota': 'note', 'changelog': 'changelog'}  # Ogni evento segue un commit del dominio
+_CODA_MAX = 100  # Eventi in attesa per connessione; oltre vengono scartati
+
+_iscritti = set()
+_lock = threading.Lock()
+
+
+def _iscrivi():
+    coda = queue.Queue(maxsize=_CODA_MAX)
+    with _lock:
+        _iscritti.add(coda)
+    return coda
+
+
+def _annulla_iscrizione(coda):
+    with _lock:
+        _iscritti.discard(coda)
+
+
+def connessioni_aperte():
+    """Numero di stream aperti in questo processo."""
+    with _lock:
+        return len(_iscritti)
+
+
+def pubblica(evento, dati):
+    """
+    Invia l'evento a tutte le connessioni aperte in questo processo. Da
+    chiamare dopo il commit. A un client che non legge (coda piena) l'evento
+    non arriva, ma riceverà comunque 'aggiorna' al controllo delle versioni.
+    """
+    with _lock:
+        code = list(_iscritti)
+    for coda in code:
+        try:
+            coda.put_nowait((evento, dati))
+        except queue.Full:
+            pass
+
+
+def formatta(evento, dati):
+    """Un evento nel formato text/event-stream."""
+    return f"event: {evento}\ndata: {json.dumps(dati, ensure_ascii=False)}\n\n"
+
+
+def _leggi_versioni():
+    # Connessione presa e restituita subito: lo stream non ne tiene una dal pool
+    with db.engine.connect() as conn:
+        return dict(zip(DOMINI_EVENTI, versioni(*DOMINI_EVENTI, conn=conn)))
+
+
+def stream_eventi(intervallo=15, durata=300):
+    """
+    Generatore del testo SSE di una connessione.
+    - Invia gli eventi pubblicati appena arrivano e considera già noti al
+      client i commit da cui provengono.
+    - Ogni `intervallo` secondi senza eventi invia 'aggiorna' con i domini le
+      cui versioni sono cambiate, oppure un commento di keepalive. Questo
+      tiene viva la connessione e fa notare subito un client disconnesso.
+    - Si chiude dopo `durata` secondi.
+    """
+    coda = _iscrivi()
+    try:
+        yield 'retry: 3000\n\n'
+        ultime = _leggi_versioni()
+        notificati = dict.fromkeys(DOMINI_EVENTI, 0)  # Commit già inviati come evento, non ancora in `ultime`
+        fine = time.monotonic() + durata
+        while (restante := fine - time.monotonic()) > 0:
+            try:
+                evento, dati = coda.get(timeout=min(intervallo, restante))
+            except queue.Empty:
+                attuali = _leggi_versioni()
+                cambiati = [dominio for dominio in DOMINI_EVENTI if attuali[dominio] != ultime[dominio]]
+                ultime = attuali
+                notificati = dict.fromkeys(DOMINI_EVENTI, 0)
+                yield formatta('aggiorna', {'domini': cambiati}) if cambiati else ': keepalive\n\n'
+                continue
+            yield formatta(evento, dati)
+            dominio = _DOMINIO_EVENTO.get(evento)
+            if dominio:
+                # Se la versione è avanzata solo dei commit già inviati come
+                # evento il client è aggiornato: niente 'aggiorna' al prossimo
+                # controllo. Un commit di un altro worker la fa avanzare di
+                # più e resta da segnalare.
+                notificati[dominio] += 1
+                attuale = _leggi_versioni()[dominio]
+                if attuale - ultime[dominio] == notificati[dominio]:
+                    ultime[dominio] = attuale
+                    notificati[dominio] = 0
+    finally:
+        _annulla_iscrizione(coda)
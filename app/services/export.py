@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import csv
+import io
+from datetime import date, datetime
+
+
+# Export di lavori_admin (/export/lavori.csv e /export/lavori.xlsx): una riga per
+# bene mostrato, con i dati del lavoro ripetuti. I compensi, già ricalcolati sui
+# beni mostrati come in tabella, sono solo sulla prima riga di ogni lavoro, così
+# le somme delle colonne restano corrette. Le righe arrivano da un generatore che
+# legge i lavori a blocchi: né il CSV né l'XLSX vengono mai tenuti in memoria.
+
+COLONNE = [
+    ('N.', lambda item, bene: item['numero_visualizzazione']),
+    ('Cliente', lambda item, bene: item['lavoro'].cliente_nome),
+    ('Categoria', lambda item, bene: item['lavoro'].categoria),
+    ('Stato lavoro', lambda item, bene: item['lavoro'].stato),
+    ('Origine', lambda item, bene: item['lavoro'].origine),
+    ('Redattore', lambda item, bene: item['lavoro'].redattore),
+    ('Collaboratore', lambda item, bene: item['lavoro'].collaboratore),
+    ('Esterno', lambda item, bene: item['lavoro'].nome_esterno),
+    ('Data offerta', lambda item, bene: item['lavoro'].data_offerta),
+    ('Data firma', lambda item, bene: item['lavoro'].data_firma),
+    ('Bene', lambda item, bene: bene.get('descrizione')),
+    ('Valore bene', lambda item, bene: bene.get('valore')),
+    ('Importo offerta', lambda item, bene: bene.get('importo_offerta')),
+    ('Stato bene', lambda item, bene: bene.get('stato')),
+    ('Data PEC', lambda item, bene: bene.get('data_pec')),
+    ('Motivo abbandono', lambda item, bene: bene.get('motivo_abbandono')),
+]
+
+COMPENSI = [
+    ('FE', 'c_fe'), ('AMIN', 'c_amin'), ('GALVAN', 'c_galvan'), ('FH', 'c_fh'),
+    ('BIANC', 'c_bianc'), ('DELOITTE', 'c_deloitte'), ('Esterno', 'c_ext'),
+    ('Revisore', 'c_revisore'), ('Caricamento', 'c_caricamento'), ('Sabatini', 'c_sabatini'),
+]
+
+INTESTAZIONE = [nome for nome, _ in COLONNE] + [f"Compenso {nome}" for nome, _ in COMPENSI]
+
+# Testi che Excel interpreterebbe come formula (es. un cliente_nome
+# "=HYPERLINK(...)"): nel CSV vengono preceduti da un apostrofo, nell'XLSX
+# scritti come celle di testo esplicite
+_INIZI_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _sembra_formula(valore):
+    return isinstance(valore, str) and valore.startswith(_INIZI_FORMULA)
+
+
+def righe_export(lavori_with_beni):
+    """Valori delle righe di export per le righe di lavori_admin indicate."""
+    for item in lavori_with_beni:
+        for i, bene in enumerate(item['beni']):
+            riga = [valore(item, bene) for _, valore in COLONNE]
+            riga += [(item[chiave] or 0) if i == 0 else None for _, chiave in COMPENSI]
+            yield riga
+
+
+def _cella_csv(valore):
+    # Formato italiano, come lo apre Excel: virgola decimale e date gg/mm/aaaa
+    if valore is None:
+        return ''
+    if isinstance(valore, bool):
+        return 'SI' if valore else 'NO'
+    if isinstance(valore, float):
+        return f"{valore:.2f}".replace('.', ',')
+    if isinstance(valore, (date, datetime)):
+        return valore.strftime('%d/%m/%Y')
+    if _sembra_formula(valore):
+        return "'" + valore
+    return valore
+
+
+def stream_csv(righe, blocco=500):
+    """Generatore dei byte di un CSV (separatore ';', UTF-8 con BOM per Excel)."""
+    buf = io.StringIO()
+    writer = csv.writer(buf, delimiter=';')
+
+    def preleva():
+        testo = buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+        return testo.encode('utf-8')
+
+    buf.write('\ufeff')
+    writer.writerow(INTESTAZIONE)
+    for n, riga in enumerate(righe, 1):
+        writer.writerow([_cella_csv(v) for v in riga])
+        if n % blocco == 0:
+            yield preleva()
+    yield preleva()
+
+
+def scrivi_xlsx(righe, destinazione):
+    """
+    Scrive le righe in un .xlsx con openpyxl in modalità write-only (le righe
+    finiscono subito su file temporanei, non restano in memoria).
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Lavori')
+    ws.freeze_panes = 'A2'
+    ws.append(INTESTAZIONE)
+
+    def cella(valore):
+        if isinstance(valore, (date, datetime)):
+            c = WriteOnlyCell(ws, value=valore)
+            c.number_format = 'DD/MM/YYYY'
+            return c
+        if isinstance(valore, float):
+            c = WriteOnlyCell(ws, value=valore)
+            c.number_format = '#,##0.00'
+            return c
+        if _sembra_formula(valore):
+            c = WriteOnlyCell(ws, value=valore)
+            c.data_type = 's'
+            return c
+        return valore
+
+    for riga in righe:
+        ws.append([cella(v) for v in riga])
+    wb.save(destinazione)
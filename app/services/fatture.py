@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+from itertools import chain
+from types import SimpleNamespace
+
+from sqlalchemy import String, delete, event, exists, func, inspect, select, type_coerce, update
+from sqlalchemy.orm import Session, contains_eager, selectinload
+
+from app import db
+from app.models import FATTURA_DATA_ORDINE, Bene, Fattura, FatturaRiga, LavoroAdmin
+from app.services.compensi import active_compensi_batch
+from app.services.paginazione import PER_PAGINA_DEFAULT, pagina_keyset
+
+
+# Le fatture restano scritte nelle colonne f_<soggetto> / data_fattura_<soggetto>
+# di LavoroAdmin (tutte le rotte continuano a usarle). Dopo ogni flush che tocca
+# lavori o beni, le tabelle fattura / fattura_riga dei lavori coinvolti vengono
+# riallineate nella stessa transazione: le letture per numero fattura diventano
+# ricerche su indice e gli elenchi delle fatture query raggruppate.
+# NB: gli UPDATE massivi (query.update) su colonne f_* non passano dal flush e
+# non vanno usati su quei campi.
+
+SOGGETTI_FATTURA = {
+    'fe': ('f_fe', 'data_fattura_fe', 'c_fe'),
+    'amin': ('f_amin', 'data_fattura_amin', 'c_amin'),
+    'galvan': ('f_galvan', 'data_fattura_galvan', 'c_galvan'),
+    'fh': ('f_fh', 'data_fattura_fh', 'c_fh'),
+    'bianc': ('f_bianc', 'data_fattura_bianc', 'c_bianc'),
+    'deloitte': ('f_deloitte', 'data_fattura_deloitte', 'c_deloitte'),
+    'ext': ('f_ext', 'data_fattura_ext', 'c_ext'),
+    'revisore': ('f_revisore', 'data_fattura_revisore', 'c_revisore'),
+    'caricamento': ('f_caricamento', 'data_fattura_caricamento', 'c_caricamento'),
+    'sabatini': ('f_sabatini', 'data_fattura_sabatini', 'c_sabatini'),
+}
+
+_BLOCCO = 500  # Lavori per blocco (limite parametri SQLite)
+
+
+def _ha_fattura(numero):
+    # Stessa condizione delle vecchie query: f_xxx != None AND f_xxx != ''
+    return numero is not None and numero != ''
+
+
+def _carica_lavori(connection, ids):
+    """Lavori e beni letti direttamente dal DB, nello stato post-flush."""
+    lt, bt = LavoroAdmin.__table__, Bene.__table__
+    lavori = {
+        row.id: SimpleNamespace(**row._mapping, beni_list=[])
+        for row in connection.execute(select(lt).where(lt.c.id.in_(ids)))
+    }
+    beni = connection.execute(
+        select(bt.c.lavoro_id, bt.c.stato, bt.c.importo_offerta)
+        .where(bt.c.lavoro_id.in_(ids))
+        .order_by(bt.c.lavoro_id, bt.c.ordine, bt.c.id)
+    )
+    for bene in beni:
+        if bene.lavoro_id in lavori:
+            lavori[bene.lavoro_id].beni_list.append(bene)
+    return list(lavori.values())
+
+
+def _risolvi_fatture(connection, chiavi, cache):
+    """
+    Mette in cache l'id della fattura per ogni (soggetto, numero), creando in
+    un solo INSERT multiplo quelle che non esistono ancora.
+    """
+    ft = Fattura.__table__
+    mancanti = set(chiavi) - cache.keys()
+    if not mancanti:
+        return
+
+    def leggi(chiavi):
+        per_soggetto = {}
+        for soggetto, numero in chiavi:
+            per_soggetto.setdefault(soggetto, []).append(numero)
+        for soggetto, numeri in per_soggetto.items():
+            for inizio in range(0, len(numeri), _BLOCCO):
+                righe = connection.execute(
+                    select(ft.c.id, ft.c.numero)
+                    .where(ft.c.soggetto == soggetto, ft.c.numero.in_(numeri[inizio:inizio + _BLOCCO]))
+                )
+                for fattura_id, numero in righe:
+                    cache[(soggetto, numero)] = fattura_id
+
+    leggi(mancanti)
+    nuove = sorted(mancanti - cache.keys())
+    if nuove:
+        connection.execute(ft.insert(), [{'soggetto': soggetto, 'numero': numero} for soggetto, numero in nuove])
+        leggi(nuove)
+
+
+def _sincronizza_blocco(connection, ids, cache):
+    ft, rt = Fattura.__table__, FatturaRiga.__table__
+
+    lavori = _carica_lavori(connection, ids)
+    compensi = active_compensi_batch(lavori) if lavori else {}
+    volute = {}
+    for i, lavoro in enumerate(lavori):
+        for soggetto, (campo_fattura, campo_data, campo_compenso) in SOGGETTI_FATTURA.items():
+            numero = getattr(lavoro, campo_fattura)
+            if _ha_fattura(numero):
+                volute[(lavoro.id, soggetto)] = (numero, getattr(lavoro, campo_data), float(compensi[campo_compenso][i]))
+
+    toccate = set()
+    esistenti = connection.execute(
+        select(rt.c.id, rt.c.fattura_id, rt.c.lavoro_id, rt.c.soggetto, rt.c.data, rt.c.compenso, ft.c.numero)
+        .join_from(rt, ft, rt.c.fattura_id == ft.c.id)
+        .where(rt.c.lavoro_id.in_(ids))
+    ).all()
+    for riga in esistenti:
+        chiave = (riga.lavoro_id, riga.soggetto)
+        voluta = volute.get(chiave)
+        if voluta is None or voluta[0] != riga.numero:
+            connection.execute(delete(rt).where(rt.c.id == riga.id))
+            toccate.add(riga.fattura_id)
+            continue
+        del volute[chiave]
+        if (voluta[1], voluta[2]) != (riga.data, riga.compenso):
+            connection.execute(update(rt).where(rt.c.id == riga.id).values(data=voluta[1], compenso=voluta[2]))
+            toccate.add(riga.fattura_id)
+
+    if volute:
+        _risolvi_fatture(connection, [(soggetto, numero) for (_, soggetto), (numero, _, _) in volute.items()], cache)
+        righe = [
+            {'fattura_id': cache[(soggetto, numero)], 'lavoro_id': lavoro_id, 'soggetto': soggetto,
+             'data': data, 'compenso': compenso}
+            for (lavoro_id, soggetto), (numero, data, compenso) in volute.items()
+        ]
+        connection.execute(rt.insert(), righe)
+        toccate.update(riga['fattura_id'] for riga in righe)
+    return toccate
+
+
+def _aggiorna_fatture(connection, fattura_ids):
+    """
+    Elimina le fatture rimaste senza lavori e ricalcola data (quella del primo
+    lavoro, come il vecchio raggruppamento per lavoro) e aggregati delle altre.
+    """
+    ft, rt = Fattura.__table__, FatturaRiga.__table__
+    fattura_ids = sorted(fattura_ids)
+    for inizio in range(0, len(fattura_ids), _BLOCCO):
+        blocco = fattura_ids[inizio:inizio + _BLOCCO]
+        connection.execute(delete(ft).where(
+            ft.c.id.in_(blocco),
+            ~exists().where(rt.c.fattura_id == ft.c.id),
+        ))
+        della_fattura = rt.c.fattura_id == ft.c.id
+        connection.execute(update(ft).where(ft.c.id.in_(blocco)).values(
+            data=select(rt.c.data).where(della_fattura).order_by(rt.c.lavoro_id).limit(1).scalar_subquery(),
+            totale_compensi=select(func.coalesce(func.sum(rt.c.compenso), 0.0)).where(della_fattura).scalar_subquery(),
+            n_lavori=select(func.count()).select_from(rt).where(della_fattura).scalar_subquery(),
+            primo_lavoro_id=select(func.min(rt.c.lavoro_id)).where(della_fattura).scalar_subquery(),
+        ))
+
+
+def sincronizza_fatture(connection, lavoro_ids):
+    """Riallinea fattura / fattura_riga alle colonne f_* dei lavori indicati."""
+    ids = sorted({i for i in lavoro_ids if i is not None})
+    toccate = set()
+    cache = {}
+    for inizio in range(0, len(ids), _BLOCCO):
+        toccate |= _sincronizza_blocco(connection, ids[inizio:inizio + _BLOCCO], cache)
+    if toccate:
+        _aggiorna_fatture(connection, toccate)
+
+
+def ricostruisci_fatture(session):
+    """Backfill: riallinea le fatture di tutti i lavori (senza commit)."""
+    ids = session.execute(select(LavoroAdmin.id)).scalars().all()
+    # Le righe di lavori non più esistenti vengono rimosse passando anche i loro id
+    ids_righe = session.execute(select(FatturaRiga.lavoro_id).distinct()).scalars().all()
+    sincronizza_fatture(session.connection(), set(ids) | set(ids_righe))
+    _aggiorna_fatture(session.connection(), session.execute(select(Fattura.id)).scalars().all())
+
+
+# --- LETTURE ---
+
+def criterio_fattura(soggetto, numero):
+    """Criterio su LavoroAdmin: lavori presenti nella fattura `numero` del soggetto."""
+    return LavoroAdmin.id.in_(
+        select(FatturaRiga.lavoro_id)
+        .join(Fattura, Fattura.id == FatturaRiga.fattura_id)
+        .where(Fattura.soggetto == soggetto, Fattura.numero == numero)
+    )
+
+
+def pagina_fatture(soggetto, *criteria, dopo=None, per_pagina=PER_PAGINA_DEFAULT):
+    """
+    Una pagina delle fatture del soggetto, dalla più recente (data DESC, senza
+    data in fondo, a parità di data per primo lavoro). Senza `criteria` legge
+    solo la tabella fattura con gli aggregati precalcolati; con `criteria` sui
+    lavori raggruppa in SQL le sole righe dei lavori filtrati.
+    Ritorna ([(Fattura, totale_compensi, n_lavori)], chiave_ultima, altre_pagine).
+    """
+    data = type_coerce(FATTURA_DATA_ORDINE, String)
+    query = db.session.query(Fattura).filter(Fattura.soggetto == soggetto)
+    if not criteria:
+        fatture, ultima, altre_pagine = pagina_keyset(
+            query, [data, Fattura.primo_lavoro_id], dopo, per_pagina, discendenti=(0,)
+        )
+        return [(f, f.totale_compensi or 0.0, f.n_lavori or 0) for f in fatture], ultima, altre_pagine
+
+    query = (
+        query.join(FatturaRiga, FatturaRiga.fattura_id == Fattura.id)
+        .join(LavoroAdmin, LavoroAdmin.id == FatturaRiga.lavoro_id)
+        .filter(*criteria)
+        .group_by(Fattura.id)
+    )
+    fatture, ultima, altre_pagine = pagina_keyset(
+        query, [data, func.min(FatturaRiga.lavoro_id)], dopo, per_pagina, discendenti=(0,), aggregata=True
+    )
+    totali = {}
+    if fatture:
+        totali = {
+            fattura_id: (totale, n_lavori)
+            for fattura_id, totale, n_lavori in db.session.query(
+                FatturaRiga.fattura_id, func.sum(FatturaRiga.compenso), func.count(FatturaRiga.id)
+            )
+            .join(LavoroAdmin, LavoroAdmin.id == FatturaRiga.lavoro_id)
+            .filter(FatturaRiga.fattura_id.in_([f.id for f in fatture]), *criteria)
+            .group_by(FatturaRiga.fattura_id)
+        }
+    return [(f, *totali[f.id]) for f in fatture], ultima, altre_pagine
+
+
+def righe_fatture(fattura_ids, *criteria):
+    """Righe delle fatture indicate con lavoro e beni precaricati, per lavoro."""
+    if not fattura_ids:
+        return []
+    return (
+        db.session.query(FatturaRiga)
+        .join(LavoroAdmin, LavoroAdmin.id == FatturaRiga.lavoro_id)
+        .filter(FatturaRiga.fattura_id.in_(fattura_ids), *criteria)
+        .options(contains_eager(FatturaRiga.lavoro).selectinload(LavoroAdmin.beni_list))
+        .order_by(FatturaRiga.fattura_id, FatturaRiga.lavoro_id)
+        .all()
+    )
+
+
+# --- SCRITTURA PARALLELA ---
+
+@event.listens_for(Session, 'after_flush')
+def _sincronizza_dopo_flush(session, flush_context):
+    ids = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, LavoroAdmin):
+            ids.add(obj.id)
+        elif isinstance(obj, Bene):
+            ids.add(obj.lavoro_id)
+            ids.update(inspect(obj).attrs.lavoro_id.history.deleted)
+    if ids - {None}:
+        sincronizza_fatture(session.connection(), ids)
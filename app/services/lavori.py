@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import selectinload
+
+from app.models import Bene, LavoroAdmin
+
+
+def with_beni(query):
+    """
+    Aggiunge a una query su LavoroAdmin il caricamento anticipato dei beni.
+    I beni arrivano già ordinati per Bene.ordine (vedi backref `beni_list`) con
+    un'unica SELECT ... WHERE lavoro_id IN (...), invece di una SELECT per lavoro.
+    """
+    return query.options(selectinload(LavoroAdmin.beni_list))
+
+
+def query_lavori_con_beni(*criteria):
+    """Query su LavoroAdmin filtrata per `criteria`, con i beni precaricati."""
+    return with_beni(LavoroAdmin.query.filter(*criteria))
+
+
+def criterio_beni_in_stato(*stati):
+    """
+    Criterio su LavoroAdmin: lavori con almeno un bene attivo (non abbandonato)
+    e tutti i beni attivi in uno degli `stati`. È un'unica GROUP BY sulla
+    tabella bene (coperta dall'indice ix_bene_lavoro_stato):
+        lavoro_id IN (SELECT lavoro_id FROM bene GROUP BY lavoro_id
+                      HAVING SUM(stato NOT IN (:stati) AND stato != 'abbandonato') = 0
+                         AND SUM(stato != 'abbandonato') > 0)
+    """
+    # Un bene senza stato conta come attivo e fuori stato (come nel controllo in Python)
+    stato = func.coalesce(Bene.stato, '')
+    attivo = stato != 'abbandonato'
+    return LavoroAdmin.id.in_(
+        select(Bene.lavoro_id)
+        .group_by(Bene.lavoro_id)
+        .having(
+            func.sum(and_(stato.notin_(stati), attivo)) == 0,
+            func.sum(attivo) > 0,
+        )
+    )
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+from sqlalchemy import update
+
+from app import db
+from app.models import LavoroAdmin
+
+
+# La numerazione "attiva" è 1..N sui lavori non chiusi e non completamente
+# abbandonati, ordinati per (numero, id). Le funzioni incrementali qui sotto
+# mantengono questa invariante con un solo UPDATE per transizione, invece di
+# riscrivere tutti i numeri come fa ricalcola_numeri_sequenziali().
+
+def _criteri_attivi():
+    return (
+        LavoroAdmin.stato != 'chiusa',
+        LavoroAdmin.is_fully_abbandonato == False,
+    )
+
+
+def ricalcola_numeri_sequenziali():
+    """
+    Ricalcola i numeri sequenziali dei lavori escludendo quelli con stato 'chiusa'
+    e quelli con TUTTI i beni abbandonati. Lavori con solo alcuni beni abbandonati
+    restano nella numerazione attiva.
+
+    Riscrive l'intera numerazione: usarla solo per riallineare dati incoerenti
+    (vedi verifica_numerazione); per i singoli cambi di stato ci sono
+    esci_da_numerazione / entra_in_numerazione.
+    """
+    db.session.flush()
+    db.session.expire_all()
+
+    lavori_attivi = LavoroAdmin.query.filter(*_criteri_attivi()).order_by(
+        LavoroAdmin.numero.asc(), LavoroAdmin.id.asc()
+    ).all()
+
+    for idx, lav in enumerate(lavori_attivi, start=1):
+        lav.numero = idx
+
+
+def esci_da_numerazione(numero):
+    """
+    Compatta la numerazione dopo che il lavoro con `numero` è uscito dai lavori
+    attivi (chiuso, completamente abbandonato o eliminato): un solo
+    UPDATE ... SET numero = numero - 1 WHERE numero > :numero.
+
+    Idempotente: se un lavoro attivo occupa ancora `numero` (il lavoro non è
+    davvero uscito, oppure la compattazione è già avvenuta) non fa nulla.
+    """
+    if numero is None:
+        return
+    occupato = db.session.query(LavoroAdmin.id).filter(
+        *_criteri_attivi(),
+        LavoroAdmin.numero == numero
+    ).first()
+    if occupato:
+        return
+    db.session.execute(
+        update(LavoroAdmin)
+        .where(*_criteri_attivi(), LavoroAdmin.numero > numero)
+        .values(numero=LavoroAdmin.numero - 1)
+        .execution_options(synchronize_session='fetch', colonne_aggiornate=('numero',))
+    )
+
+
+def entra_in_numerazione(lavoro):
+    """
+    Reinserisce `lavoro` nella numerazione attiva (es. lavoro chiuso che viene
+    riaperto), nella stessa posizione che gli darebbe il ricalcolo completo:
+    i lavori successivi scalano di uno con un solo UPDATE.
+    """
+    attivo = db.session.query(LavoroAdmin.id).filter(
+        *_criteri_attivi(),
+        LavoroAdmin.id == lavoro.id
+    ).first()
+    if not attivo:
+        return
+    if lavoro.numero is None:
+        ricalcola_numeri_sequenziali()
+        return
+
+    altri = (*_criteri_attivi(), LavoroAdmin.id != lavoro.id)
+    n_altri = db.session.query(LavoroAdmin.id).filter(*altri).count()
+    if lavoro.numero > n_altri:
+        lavoro.numero = n_altri + 1
+        return
+
+    rivale = db.session.query(LavoroAdmin.id).filter(
+        *altri,
+        LavoroAdmin.numero == lavoro.numero
+    ).first()
+    if not rivale:
+        # Posizione già libera: il lavoro è già al suo posto
+        return
+
+    # A parità di numero il ricalcolo completo ordina per id
+    posizione = lavoro.numero if lavoro.id < rivale[0] else lavoro.numero + 1
+    db.session.execute(
+        update(LavoroAdmin)
+        .where(*altri, LavoroAdmin.numero >= posizione)
+        .values(numero=LavoroAdmin.numero + 1)
+        .execution_options(synchronize_session='fetch', colonne_aggiornate=('numero',))
+    )
+    lavoro.numero = posizione
+
+
+def in_numerazione(lavoro):
+    """True se il lavoro, con i valori attualmente caricati, è nella numerazione attiva."""
+    return lavoro.stato != 'chiusa' and not lavoro.is_fully_abbandonato
+
+
+def riallinea_numerazione(usciti, entrati):
+    """
+    Aggiorna la numerazione dopo più cambi di stato nella stessa transazione
+    (`usciti` / `entrati`: lavori usciti dalla / rientrati nella numerazione
+    attiva, con il numero che avevano prima). Le uscite vengono compattate in
+    ordine di numero decrescente, così ognuna non sposta i numeri di quelle
+    ancora da fare; con più rientri, o rientri insieme a uscite, un solo
+    ricalcolo completo.
+    """
+    if len(entrati) > 1 or (entrati and usciti):
+        ricalcola_numeri_sequenziali()
+        return
+    for lavoro in entrati:
+        entra_in_numerazione(lavoro)
+    for numero in sorted((l.numero for l in usciti if l.numero is not None), reverse=True):
+        esci_da_numerazione(numero)
+
+
+def verifica_numerazione():
+    """
+    Confronta la numerazione attuale con quella che produrrebbe
+    ricalcola_numeri_sequenziali(), senza modificare nulla.
+    Restituisce la lista delle discrepanze come (id, numero_attuale, numero_atteso).
+    """
+    db.session.flush()
+    righe = db.session.query(LavoroAdmin.id, LavoroAdmin.numero).filter(
+        *_criteri_attivi()
+    ).order_by(LavoroAdmin.numero.asc(), LavoroAdmin.id.asc()).all()
+    return [
+        (lavoro_id, numero, atteso)
+        for atteso, (lavoro_id, numero) in enumerate(righe, start=1)
+        if numero != atteso
+    ]
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import io
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+# Generazione massiva delle offerte: i .docx vengono prodotti in un pool di
+# processi (python-docx è CPU-bound e non rilascia il GIL) a partire da input
+# già estratti dal DB (dict semplici, serializzabili), poi impacchettati in un
+# unico ZIP inviato in streaming. Il pool resta vivo tra le richieste così
+# ogni worker conserva la propria cache dei template.
+
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+def numero_workers(configurati=None):
+    """Worker del pool: da config se indicati, altrimenti CPU disponibili (max 4)."""
+    if configurati is not None:
+        return max(1, int(configurati))
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+def render_offerta(template_path, dati):
+    """Genera un'offerta e ne restituisce i byte (eseguita nei worker)."""
+    from app.utils.offerta_docx import generate_offerta_docx
+
+    return generate_offerta_docx(template_path, **dati).getvalue()
+
+
+def _get_executor(workers):
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ProcessPoolExecutor(max_workers=workers)
+            _executor_workers = workers
+        return _executor
+
+
+def _reset_executor():
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _executor = None
+        _executor_workers = 0
+
+
+def render_offerte(jobs, workers=1):
+    """
+    Genera in parallelo le offerte descritte da `jobs` (lista di coppie
+    (template_path, dati)) restituendo i byte dei documenti nello stesso ordine.
+    Con un solo worker, un solo documento o se i processi non sono disponibili
+    la generazione avviene nel processo corrente.
+    """
+    if workers <= 1 or len(jobs) <= 1:
+        return [render_offerta(path, dati) for path, dati in jobs]
+
+    try:
+        executor = _get_executor(workers)
+        paths, dati = zip(*jobs)
+        return list(executor.map(render_offerta, paths, dati, chunksize=max(1, len(jobs) // (workers * 4))))
+    except (BrokenProcessPool, OSError, NotImplementedError):
+        # Ambienti senza multiprocessing (o pool morto): ripiego sequenziale
+        _reset_executor()
+        return [render_offerta(path, dati) for path, dati in jobs]
+
+
+def nomi_univoci(nomi):
+    """Rende univoci i nomi dei file nello ZIP aggiungendo _2, _3, ... ai duplicati."""
+    usati = set()
+    risultato = []
+    for nome in nomi:
+        base, ext = os.path.splitext(nome)
+        candidato, n = nome, 1
+        while candidato.lower() in usati:
+            n += 1
+            candidato = f"{base}_{n}{ext}"
+        usati.add(candidato.lower())
+        risultato.append(candidato)
+    return risultato
+
+
+class _BufferStream(io.RawIOBase):
+    """Destinazione non seekable per ZipFile: accumula i byte fino al prelievo."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def preleva(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(files):
+    """Generatore dei byte di uno ZIP con i file (nome, contenuto) indicati."""
+    buf = _BufferStream()
+    with zipfile.ZipFile(buf, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for nome, contenuto in files:
+            zf.writestr(nome, contenuto)
+            yield buf.preleva()
+    yield buf.preleva()
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import base64
+import json
+
+from sqlalchemy import and_, or_, tuple_
+
+
+# Paginazione keyset: invece di OFFSET la pagina successiva parte dalla chiave
+# di ordinamento dell'ultima riga vista (WHERE (k1, k2) > (:v1, :v2)), quindi il
+# costo di una pagina non cresce con la sua posizione nell'elenco.
+
+PER_PAGINA_DEFAULT = 50
+PER_PAGINA_MAX = 500
+
+
+class CursoreNonValido(ValueError):
+    pass
+
+
+def codifica_cursore(dati):
+    raw = json.dumps(dati, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decodifica_cursore(cursore):
+    """Decodifica un cursore prodotto da codifica_cursore; None se assente."""
+    if not cursore:
+        return None
+    try:
+        padding = '=' * (-len(cursore) % 4)
+        dati = json.loads(base64.urlsafe_b64decode(cursore + padding))
+    except (ValueError, TypeError) as e:
+        raise CursoreNonValido(str(e)) from e
+    if not isinstance(dati, dict) or not isinstance(dati.get('k'), list):
+        raise CursoreNonValido('cursore malformato')
+    return dati
+
+
+def leggi_per_pagina(valore, default=PER_PAGINA_DEFAULT):
+    try:
+        per_pagina = int(valore)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(per_pagina, PER_PAGINA_MAX))
+
+
+def _dopo_chiave(chiavi, dopo, discendenti):
+    if not discendenti:
+        return tuple_(*chiavi) > tuple_(*dopo)
+    # Con chiavi in ordine misto il confronto tra tuple non basta: espando
+    # (k1 < v1) OR (k1 = v1 AND k2 > v2) OR ...
+    condizioni = []
+    for i, (chiave, valore) in enumerate(zip(chiavi, dopo)):
+        confronto = chiave < valore if i in discendenti else chiave > valore
+        uguali = [k == v for k, v in zip(chiavi[:i], dopo[:i])]
+        condizioni.append(and_(*uguali, confronto))
+    return or_(*condizioni)
+
+
+def pagina_keyset(query, chiavi, dopo=None, per_pagina=PER_PAGINA_DEFAULT, discendenti=(), aggregata=False):
+    """
+    Esegue `query` ordinata per `chiavi` (espressioni non NULL, l'ultima
+    univoca) restituendo al massimo `per_pagina` entità successive alla chiave
+    `dopo`. Ritorna (entità, chiave_ultima, altre_pagine).
+    `discendenti` contiene gli indici delle chiavi ordinate in modo decrescente;
+    con `aggregata` le chiavi sono aggregati di una query GROUP BY e il filtro
+    sulla chiave va in HAVING.
+    """
+    query = query.add_columns(*chiavi)
+    if dopo is not None:
+        condizione = _dopo_chiave(chiavi, dopo, discendenti)
+        query = query.having(condizione) if aggregata else query.filter(condizione)
+    ordine = [chiave.desc() if i in discendenti else chiave for i, chiave in enumerate(chiavi)]
+    righe = query.order_by(*ordine).limit(per_pagina + 1).all()
+
+    altre_pagine = len(righe) > per_pagina
+    righe = righe[:per_pagina]
+    entita = [riga[0] for riga in righe]
+    ultima = list(righe[-1][1:]) if righe else None
+    return entita, ultima, altre_pagine
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import re
+
+from markupsafe import escape
+from sqlalchemy import text
+
+from app import db
+
+
+# Ricerca full-text (SQLite FTS5) su lavori, beni, clienti e note admin.
+# La tabella virtuale `ricerca` ha una riga per ogni record indicizzato, con
+# rowid = id * 4 + codice del tipo: i trigger AFTER INSERT / UPDATE / DELETE
+# sulle quattro tabelle la tengono allineata cancellando e reinserendo per
+# rowid (le uniche scritture efficienti su una tabella FTS5), quindi anche gli
+# UPDATE massivi e gli script che scrivono in SQL restano coperti.
+# Tabella e trigger vengono creati dalla migrazione 18 (app/migrazioni.py);
+# ricostruisci_indice_ricerca.py riallinea da zero un database esistente.
+# Il numero del lavoro non è indicizzato: la rinumerazione lo cambia a molti
+# lavori con un solo UPDATE e i trigger riscriverebbero tutte le loro righe.
+# Un testo di sole cifre cerca invece numero = :numero (indice
+# ix_lavoro_admin_numero), con i lavori trovati prima dei risultati FTS.
+
+# tipo -> (codice rowid, tabella, lavoro_id, titolo, colonne del testo)
+SORGENTI = {
+    'lavoro': (0, 'lavoro_admin', 'id', ['cliente_nome'], [
+        'bene', 'note', 'categoria', 'origine', 'redattore', 'collaboratore',
+        'nome_esterno', 'nome_revisore', 'nome_caricamento', 'nome_sabatini',
+    ]),
+    'bene': (1, 'bene', 'lavoro_id', ['descrizione'], ['commento_abbandono']),
+    'cliente': (2, 'cliente', None, ['nome'], ['p_iva', 'indirizzo', 'civico', 'cap', 'comune', 'provincia', 'pec']),
+    'nota': (3, 'note_admin', None, [], ['contenuto']),
+}
+
+_TIPI = len(SORGENTI)
+_INIZIO, _FINE = '\x02', '\x03'  # Delimitatori dei termini trovati, sostituiti da <mark> dopo l'escape
+_MAX_TERMINI = 8
+_NUMERO = re.compile(r'[0-9]{1,9}')
+
+
+def _concatena(alias, colonne):
+    if not colonne:
+        return "''"
+    return " || ' ' || ".join(f"coalesce({alias}.{c}, '')" for c in colonne)
+
+
+def _valori(tipo, alias):
+    codice, _, lavoro_id, titolo, testo = SORGENTI[tipo]
+    return (
+        f"{alias}.id * {_TIPI} + {codice}",
+        f"'{tipo}'",
+        f"{alias}.{lavoro_id}" if lavoro_id else 'NULL',
+        _concatena(alias, titolo),
+        _concatena(alias, testo),
+    )
+
+
+def _ddl():
+    istruzioni = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS ricerca USING fts5("
+        "tipo UNINDEXED, lavoro_id UNINDEXED, titolo, testo, "
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    ]
+    for tipo, (codice, tabella, lavoro_id, titolo, testo) in SORGENTI.items():
+        inserisci = "INSERT INTO ricerca (rowid, tipo, lavoro_id, titolo, testo) VALUES ({})".format(
+            ', '.join(_valori(tipo, 'NEW'))
+        )
+        cancella = f"DELETE FROM ricerca WHERE rowid = OLD.id * {_TIPI} + {codice}"
+        colonne = ', '.join(dict.fromkeys(['id'] + ([lavoro_id] if lavoro_id else []) + titolo + testo))
+        trigger = {
+            'ai': f"AFTER INSERT ON {tabella} BEGIN {inserisci}; END",
+            'ad': f"AFTER DELETE ON {tabella} BEGIN {cancella}; END",
+            'au': f"AFTER UPDATE OF {colonne} ON {tabella} BEGIN {cancella}; {inserisci}; END",
+        }
+        # Ricreati ogni volta: un database esistente prende le colonne attuali
+        for suffisso, corpo in trigger.items():
+            istruzioni += [
+                f"DROP TRIGGER IF EXISTS ricerca_{tabella}_{suffisso}",
+                f"CREATE TRIGGER ricerca_{tabella}_{suffisso} {corpo}",
+            ]
+    return istruzioni
+
+
+def crea_indice_ricerca(conn):
+    """Crea (se manca) la tabella FTS5 e ricrea i trigger che la mantengono."""
+    for istruzione in _ddl():
+        conn.exec_driver_sql(istruzione)
+
+
+def ricostruisci_indice_ricerca(conn):
+    """Svuota e ripopola l'indice da tutte le tabelle. Ritorna le righe per tipo."""
+    conn.exec_driver_sql("DELETE FROM ricerca")
+    conteggi = {}
+    for tipo, (_, tabella, _, _, _) in SORGENTI.items():
+        risultato = conn.exec_driver_sql(
+            "INSERT INTO ricerca (rowid, tipo, lavoro_id, titolo, testo) SELECT {} FROM {} AS t".format(
+                ', '.join(_valori(tipo, 't')), tabella
+            )
+        )
+        conteggi[tipo] = risultato.rowcount
+    conn.exec_driver_sql("INSERT INTO ricerca (ricerca) VALUES ('optimize')")
+    return conteggi
+
+
+def espressione_match(testo):
+    """
+    Query FTS5 dal testo digitato: ogni parola diventa un prefisso tra
+    virgolette, tutte obbligatorie. Stringa vuota se non ci sono parole.
+    """
+    parole = re.findall(r'\w+', testo or '')[:_MAX_TERMINI]
+    return ' '.join(f'"{p}"*' for p in parole)
+
+
+def _evidenzia(valore):
+    return str(escape(valore or '')).replace(_INIZIO, '<mark>').replace(_FINE, '</mark>')
+
+
+_CERCA = text(f"""
+    SELECT r.tipo, r.rowid / {_TIPI} AS id, r.lavoro_id,
+           highlight(ricerca, 2, :inizio, :fine) AS titolo,
+           snippet(ricerca, 3, :inizio, :fine, '…', 12) AS estratto,
+           bm25(ricerca, 0, 0, 5.0, 1.0) AS punteggio,
+           l.numero, l.cliente_nome, l.stato
+    FROM ricerca AS r
+    LEFT JOIN lavoro_admin AS l ON l.id = r.lavoro_id
+    WHERE ricerca MATCH :q
+    ORDER BY punteggio
+    LIMIT :limite
+""")
+
+_CERCA_NUMERO = text("""
+    SELECT id, numero, cliente_nome, stato
+    FROM lavoro_admin
+    WHERE numero = :numero
+    ORDER BY id
+    LIMIT :limite
+""")
+
+
+def cerca(testo, limite=20):
+    """
+    Risultati della ricerca, dal più pertinente (BM25, il titolo pesa più del
+    testo), con i termini trovati evidenziati da <mark> su testo già escapato.
+    Un testo di sole cifre trova per primi i lavori con quel numero.
+    """
+    testo = (testo or '').strip()
+    risultati = []
+    if _NUMERO.fullmatch(testo):
+        righe = db.session.execute(_CERCA_NUMERO, {'numero': int(testo), 'limite': limite})
+        risultati = [
+            {
+                'tipo': 'lavoro',
+                'id': r.id,
+                'lavoro_id': r.id,
+                'numero': r.numero,
+                'cliente': r.cliente_nome,
+                'stato': r.stato,
+                'titolo': _evidenzia(r.cliente_nome),
+                'estratto': _evidenzia(f"Lavoro n. {_INIZIO}{r.numero}{_FINE}"),
+                'punteggio': None,
+            }
+            for r in righe
+        ]
+
+    q = espressione_match(testo)
+    if not q or len(risultati) >= limite:
+        return risultati
+    trovati = {r['id'] for r in risultati}
+    righe = db.session.execute(_CERCA, {'q': q, 'limite': limite, 'inizio': _INIZIO, 'fine': _FINE})
+    risultati += [
+        {
+            'tipo': r.tipo,
+            'id': r.id,
+            'lavoro_id': r.lavoro_id,
+            'numero': r.numero,
+            'cliente': r.cliente_nome,
+            'stato': r.stato,
+            'titolo': _evidenzia(r.titolo),
+            'estratto': _evidenzia(r.estratto),
+            'punteggio': round(r.punteggio, 4),
+        }
+        for r in righe
+        if not (r.tipo == 'lavoro' and r.id in trovati)
+    ]
+    return risultati[:limite]
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import func, select, union_all
+
+from app import db
+
+
+MESI_IT = ['Gen', 'Feb', 'Mar', 'Apr', 'Mag', 'Giu', 'Lug', 'Ago', 'Set', 'Ott', 'Nov', 'Dic']
+COLORI = ['var(--primary)', '#ff9f43', '#00A651']  # Blu, Arancio, Verde
+FINESTRE_MESI = (3, 12, 24)
+
+
+def _primo_del_mese(anno, mese, delta=0):
+    """Primo giorno del mese spostato di `delta` mesi rispetto ad anno/mese."""
+    indice = anno * 12 + (mese - 1) + delta
+    return datetime(indice // 12, indice % 12 + 1, 1)
+
+
+def conta_per_mese(models, inizio, fine):
+    """
+    Conta i record creati in [inizio, fine) raggruppati per mese 'YYYY-MM',
+    sommando tutti i modelli indicati con un'unica query GROUP BY.
+    """
+    parti = [
+        select(func.strftime('%Y-%m', model.created_at).label('mese'))
+        .where(model.created_at >= inizio, model.created_at < fine)
+        for model in models
+        if hasattr(model, 'created_at')
+    ]
+    if not parti:
+        return {}
+    righe = union_all(*parti).subquery()
+    query = select(righe.c.mese, func.count()).group_by(righe.c.mese)
+    return dict(db.session.execute(query).all())
+
+
+def get_timeline(models, mesi=3, now=None):
+    """
+    Timeline dei lavori creati negli ultimi `mesi` mesi (mese corrente per primo).
+    Ogni voce ha label, count, color e width (percentuale rispetto al mese massimo).
+    """
+    now = now or datetime.now()
+    fine = _primo_del_mese(now.year, now.month, 1)
+    inizio = _primo_del_mese(now.year, now.month, 1 - mesi)
+    conteggi = conta_per_mese(models, inizio, fine)
+
+    months_data = []
+    for i in range(mesi):
+        mese = _primo_del_mese(now.year, now.month, -i)
+        label = MESI_IT[mese.month - 1]
+        if mesi > 12:
+            # Oltre i 12 mesi i nomi si ripetono: aggiungo l'anno
+            label = f"{label} {mese.strftime('%y')}"
+        months_data.append({
+            'label': label,
+            'count': conteggi.get(mese.strftime('%Y-%m'), 0),
+            'color': COLORI[i % len(COLORI)],
+        })
+
+    max_count = max((m['count'] for m in months_data), default=0)
+    for m in months_data:
+        m['width'] = (m['count'] / max_count) * 100 if max_count > 0 else 0
+    return months_data
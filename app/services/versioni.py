@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+from datetime import date
+from functools import wraps
+from itertools import chain
+
+from flask import current_app, make_response, request
+from flask_login import current_user
+from sqlalchemy import event, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import (
+    Bene, Changelog, Cliente, DashboardContributo, DashboardSummary, Fattura, FatturaRiga,
+    LavoroAdmin, NoteAdmin, User, VersioneDati,
+)
+
+
+# Versioni dei dati per gli ETag delle API JSON in GET. La tabella
+# versione_dati ha un contatore per dominio più 'tutti': before_commit li
+# incrementa, nella stessa transazione, per i domini toccati dal flush (o da
+# UPDATE / DELETE massivi). Sta nel database e non in memoria, così vale per
+# tutti i worker.
+# Le API decorate con @con_etag leggono le versioni con una sola SELECT. Se
+# l'If-None-Match del client coincide rispondono 304 senza eseguire la vista.
+# Il polling di un client senza modifiche costa quindi una query, oltre al
+# caricamento dell'utente.
+
+TUTTI = 'tutti'
+_FLAG = 'versioni_da_incrementare'
+
+# Modello -> dominio; i modelli non elencati incrementano solo 'tutti'
+DOMINI = {
+    LavoroAdmin: 'lavori',
+    Bene: 'lavori',
+    Cliente: 'lavori',
+    Fattura: 'lavori',
+    FatturaRiga: 'lavori',
+    NoteAdmin: 'note',
+    Changelog: 'changelog',
+    User: 'utenti',
+}
+# Dati derivati: contatori stessi e totali della dashboard, aggiornati dagli
+# stessi commit che modificano i dati da cui dipendono
+_IGNORATI = (VersioneDati, DashboardSummary, DashboardContributo)
+
+
+def versioni(*domini, conn=None):
+    """
+    Versioni correnti dei domini indicati, nello stesso ordine (0 se mai
+    modificati). Lette da `conn` se indicata, altrimenti dalla sessione.
+    """
+    t = VersioneDati.__table__
+    righe = dict((conn or db.session).execute(select(t.c.dominio, t.c.versione).where(t.c.dominio.in_(domini))).all())
+    return tuple(righe.get(dominio, 0) for dominio in domini)
+
+
+def incrementa(session, domini):
+    """Incrementa (senza commit) le versioni dei domini indicati e di 'tutti'."""
+    t = VersioneDati.__table__
+    stmt = insert(t).values([{'dominio': dominio, 'versione': 1} for dominio in sorted({TUTTI, *domini})])
+    session.execute(stmt.on_conflict_do_update(index_elements=[t.c.dominio], set_={'versione': t.c.versione + 1}))
+
+
+def calcola_etag(domini, giornaliero=False):
+    parti = ['.'.join(str(v) for v in versioni(*domini)), f"u{current_user.get_id()}"]
+    if giornaliero:
+        parti.append(date.today().isoformat())
+    return '-'.join(parti)
+
+
+def con_etag(*domini, giornaliero=False):
+    """
+    Decoratore delle API JSON in GET (da mettere sotto @login_required): ETag
+    dalle versioni dei domini da cui dipende la risposta e dall'utente, più la
+    data odierna se `giornaliero` (risposte con ritardi calcolati su oggi).
+    Con If-None-Match uguale risponde 304 senza eseguire la vista; le altre
+    risposte 200 ricevono ETag e Cache-Control: no-cache, così il browser le
+    conserva e le rivalida da solo.
+    """
+    def decoratore(vista):
+        @wraps(vista)
+        def wrapper(*args, **kwargs):
+            etag = calcola_etag(domini, giornaliero)
+            if request.if_none_match.contains(etag):
+                resp = current_app.response_class(status=304)
+            else:
+                resp = make_response(vista(*args, **kwargs))
+                if resp.status_code != 200:
+                    return resp
+            resp.set_etag(etag)
+            resp.headers['Cache-Control'] = 'private, no-cache'
+            return resp
+        return wrapper
+    return decoratore
+
+
+# --- INCREMENTO AL COMMIT ---
+
+def _dominio(classe):
+    return DOMINI.get(classe, TUTTI)
+
+
+@event.listens_for(Session, 'after_flush')
+def _segna_modifiche(session, flush_context):
+    modificati = chain(session.new, session.deleted, (obj for obj in session.dirty if session.is_modified(obj)))
+    domini = {_dominio(type(obj)) for obj in modificati if not isinstance(obj, _IGNORATI)}
+    if domini:
+        session.info.setdefault(_FLAG, set()).update(domini)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _segna_modifiche_bulk(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        domini = {
+            _dominio(mapper.class_)
+            for mapper in orm_execute_state.all_mappers
+            if not issubclass(mapper.class_, _IGNORATI)
+        }
+        if domini:
+            orm_execute_state.session.info.setdefault(_FLAG, set()).update(domini)
+
+
+@event.listens_for(Session, 'before_commit')
+def _incrementa_al_commit(session):
+    session.flush()
+    domini = session.info.pop(_FLAG, None)
+    if domini:
+        incrementa(session, domini)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _annulla_flag(session):
+    session.info.pop(_FLAG, None)
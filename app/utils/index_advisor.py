@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import threading
+
+from flask import current_app, has_request_context, request
+from sqlalchemy import event
+
+
+# Advisor degli indici (solo sviluppo): durante una richiesta ogni SELECT
+# eseguita viene ripassata a EXPLAIN QUERY PLAN e, se SQLite legge per intero
+# una tabella senza usare indici (riga "SCAN <tabella>"), nel log dell'app
+# compaiono rotta, query e piano. Ogni query viene segnalata una sola volta
+# per processo. Si attiva con app.config['INDEX_ADVISOR'] (None = solo in debug).
+
+_segnalate = set()
+_lock = threading.Lock()
+
+
+def _attivo():
+    if not has_request_context():
+        return False
+    configurato = current_app.config.get('INDEX_ADVISOR')
+    return current_app.debug if configurato is None else bool(configurato)
+
+
+def scansioni_complete(piano):
+    """Righe di EXPLAIN QUERY PLAN che leggono una tabella intera senza indice."""
+    return [
+        dettaglio for dettaglio in piano
+        if dettaglio.startswith('SCAN ') and ' USING ' not in dettaglio
+        and 'CONSTANT ROW' not in dettaglio and 'subquery' not in dettaglio
+    ]
+
+
+def _dopo_query(conn, cursor, statement, parameters, context, executemany):
+    if executemany or not _attivo():
+        return
+    if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return
+    with _lock:
+        if statement in _segnalate:
+            return
+        _segnalate.add(statement)
+
+    try:
+        # Cursore DBAPI diretto: l'EXPLAIN non ripassa dagli eventi di SQLAlchemy
+        raw = conn.connection.dbapi_connection.cursor()
+        try:
+            raw.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+            piano = [riga[-1] for riga in raw.fetchall()]
+        finally:
+            raw.close()
+    except Exception:
+        return
+
+    scansioni = scansioni_complete(piano)
+    if scansioni:
+        current_app.logger.warning(
+            "[index advisor] %s %s: scansione completa (%s)\n%s\n%s",
+            request.method, request.path, '; '.join(scansioni), statement.strip(),
+            '\n'.join(f'  {riga}' for riga in piano),
+        )
+
+
+def init_index_advisor(engine):
+    """Registra l'advisor sull'engine (se attivo lo decide ogni query)."""
+    event.listen(engine, 'after_cursor_execute', _dopo_query)
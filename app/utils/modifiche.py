@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+from sqlalchemy import inspect
+
+
+# Quali colonne ha cambiato una modifica, per gli hook di sessione che
+# invalidano dati derivati (dashboard, autocompletamento) solo quando cambia
+# una colonna che leggono.
+
+
+def colonne_modificate(obj, colonne):
+    """
+    Quali di `colonne` sono cambiate in un oggetto dirty. Da usare in
+    after_flush, quando la history degli attributi non è ancora azzerata.
+    """
+    attrs = inspect(obj).attrs
+    return {colonna for colonna in colonne if attrs[colonna].history.has_changes()}
+
+
+def colonne_aggiornate(orm_execute_state):
+    """
+    Nomi delle colonne assegnate da un UPDATE massivo, dichiarati da chi lo
+    esegue con l'opzione di esecuzione `colonne_aggiornate`:
+        update(...).values(...).execution_options(colonne_aggiornate=('numero',))
+    None se non si possono sapere (DELETE o UPDATE senza l'opzione): gli hook
+    invalidano allora tutto quello che dipende dalle classi toccate.
+    """
+    if not orm_execute_state.is_update:
+        return None
+    colonne = orm_execute_state.execution_options.get('colonne_aggiornate')
+    return None if colonne is None else set(colonne)
@@ -5,9 +5,13 @@ from datetime import date
 from io import BytesIO
 from pathlib import Path
 import re
+import threading
 from typing import Any
 
 from docx import Document
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.table import Table
+from docx.text.paragraph import Paragraph
 
 
 MONTHS_IT_FULL = [
@@ -40,17 +44,195 @@ def format_date_it_long(d: date) -> str:
     return f"{d.day} {MONTHS_IT_FULL[d.month]} {d.year}"
 
 
+# --- CACHE DEI TEMPLATE ---
+# Ogni template viene letto e parsato una sola volta per processo (chiave:
+# percorso + mtime, quindi un template modificato su disco viene riletto).
+# Ogni richiesta riceve una copia in cui sono duplicate solo le parti che la
+# generazione modifica (corpo, header, footer); stili, tema, immagini ecc.
+# restano condivisi con il documento in cache, che non viene mai modificato.
+# Insieme al documento viene salvato l'indice dei nodi da modificare
+# (vedi _TemplateIndex).
+
+_template_cache: dict[str, tuple[int, Any, "_TemplateIndex"]] = {}
+_template_cache_lock = threading.Lock()
+_template_cache_stats = {"hits": 0, "misses": 0}
+
+# Paragrafi rimossi quando il relativo importo è 0
+_PTO_PATTERNS = ("pto c)", "pto d)", "pto e)")
+
+
+def _mutable_parts(doc) -> dict:
+    """Parti modificate dalla generazione (corpo, header, footer) -> contenitore python-docx."""
+    parts = {doc.part.partname: doc._body}
+    for rel in doc.part.rels.values():
+        if not rel.is_external and rel.reltype in (RT.HEADER, RT.FOOTER):
+            parts.setdefault(rel.target_part.partname, None)
+    for section in doc.sections:
+        for hf in (section.header, section.footer, section.even_page_header, section.even_page_footer,
+                   section.first_page_header, section.first_page_footer):
+            if hf._has_definition:
+                parts[hf.part.partname] = hf
+    return parts
+
+
+def _clone_document(doc):
+    mutable = _mutable_parts(doc)
+    # Le parti nel memo vengono riusate da deepcopy invece di essere copiate
+    memo = {
+        id(part): part
+        for part in doc.part.package.iter_parts()
+        if part.partname not in mutable
+    }
+    return deepcopy(doc, memo)
+
+
+class _TemplateIndex:
+    """
+    Posizioni, calcolate una volta per template, dei soli nodi che la
+    generazione tocca: paragrafi con placeholder "[...]", riga "[bene 1]" e
+    paragrafi "pto c)/d)/e)". Ogni nodo è salvato come (parte, percorso di
+    indici dei figli dalla radice della parte), così può essere ritrovato in
+    qualunque copia del documento.
+    """
+
+    def __init__(self, doc):
+        # Stesse visite della generazione completa (_replace_everywhere,
+        # _find_beni_table_and_row, _remove_paragraphs_matching)
+        placeholders = []
+        for p in _iter_replace_paragraphs(doc):
+            if "[" in "".join(r.text for r in p.runs) and p._p not in placeholders:
+                placeholders.append(p._p)
+
+        table, row_idx = _find_beni_table_and_row(doc)
+
+        pto = {pat: [] for pat in _PTO_PATTERNS}
+        for p in _iter_removal_paragraphs(doc):
+            text = (p.text or "").lower()
+            for pat in _PTO_PATTERNS:
+                if pat in text and p._p not in pto[pat]:
+                    pto[pat].append(p._p)
+
+        mutable = _mutable_parts(doc)
+        roots = {
+            part._element: part.partname
+            for part in doc.part.package.iter_parts()
+            if part.partname in mutable
+        }
+
+        def locate(element):
+            path = []
+            while (parent := element.getparent()) is not None:
+                path.append(parent.index(element))
+                element = parent
+            return roots[element], tuple(reversed(path))
+
+        self.placeholders = [locate(el) for el in placeholders]
+        self.beni = (locate(table._tbl), row_idx) if table is not None else None
+        self.pto = {pat: [locate(el) for el in els] for pat, els in pto.items()}
+
+    def resolve(self, doc) -> "_TemplateNodes":
+        containers = _mutable_parts(doc)
+        roots = {
+            part.partname: part._element
+            for part in doc.part.package.iter_parts()
+            if part.partname in containers
+        }
+
+        def find(location):
+            partname, path = location
+            element = roots[partname]
+            for i in path:
+                element = element[i]
+            return element, containers[partname] or doc._body
+
+        def paragraph(location):
+            return Paragraph(*find(location))
+
+        beni = (None, None)  # nessuna tabella beni nel template
+        if self.beni is not None:
+            location, row_idx = self.beni
+            beni = (Table(*find(location)), row_idx)
+        return _TemplateNodes(
+            placeholders=[paragraph(loc) for loc in self.placeholders],
+            beni=beni,
+            pto={pat: [paragraph(loc) for loc in locs] for pat, locs in self.pto.items()},
+        )
+
+
+class _TemplateNodes:
+    """Nodi di _TemplateIndex ritrovati in una copia del documento."""
+
+    def __init__(self, *, placeholders, beni, pto):
+        self.placeholders = placeholders
+        self.beni = beni
+        self.pto = pto
+
+
+def _load_template_indexed(template_path: Path):
+    path = Path(template_path).resolve()
+    key = str(path)
+    mtime = path.stat().st_mtime_ns
+
+    with _template_cache_lock:
+        cached = _template_cache.get(key)
+        if cached is not None and cached[0] == mtime:
+            _template_cache_stats["hits"] += 1
+            _mtime, doc, index = cached
+        else:
+            doc = None
+
+    if doc is None:
+        doc = Document(key)
+        index = _TemplateIndex(doc)
+        with _template_cache_lock:
+            _template_cache[key] = (mtime, doc, index)
+            _template_cache_stats["misses"] += 1
+
+    clone = _clone_document(doc)
+    return clone, index.resolve(clone)
+
+
+def load_template(template_path: Path):
+    """Restituisce una copia modificabile del template, parsato al massimo una volta."""
+    return _load_template_indexed(template_path)[0]
+
+
+def template_cache_info() -> dict[str, int]:
+    with _template_cache_lock:
+        return {**_template_cache_stats, "size": len(_template_cache)}
+
+
+def clear_template_cache() -> None:
+    with _template_cache_lock:
+        _template_cache.clear()
+        _template_cache_stats["hits"] = 0
+        _template_cache_stats["misses"] = 0
+
+
 def _replace_in_paragraph(paragraph, mapping: dict[str, str]) -> None:
     """
     Sostituisce placeholder preservando la formattazione dei RUN del placeholder.
     Supporta placeholder spezzati su più run (caso tipico nei .docx).
     """
-    if not getattr(paragraph, "runs", None):
+    runs = getattr(paragraph, "runs", None)
+    if not runs:
         return
 
+    # I run non cambiano durante le sostituzioni: testi letti una volta sola
+    # e riletti solo per i run modificati.
+    texts = [r.text for r in runs]
+    # Tutti i placeholder iniziano con "[": senza parentesi non c'è nulla da cercare
+    bracketed = all(k.startswith("[") for k in mapping)
+
+    def set_text(i: int, text: str) -> None:
+        runs[i].text = text
+        texts[i] = runs[i].text
+
     # Loop finché troviamo sostituzioni (per gestire più placeholder nello stesso paragrafo)
     while True:
-        full = "".join(r.text for r in paragraph.runs)
+        full = "".join(texts)
+        if bracketed and "[" not in full:
+            break
         found = None  # (start, end, key, replacement)
         for k, v in mapping.items():
             idx = full.find(k)
@@ -65,8 +247,8 @@ def _replace_in_paragraph(paragraph, mapping: dict[str, str]) -> None:
         # Mappa posizioni globali -> run index + offset
         cur = 0
         s_run = s_off = e_run = e_off = None
-        for i, run in enumerate(paragraph.runs):
-            nxt = cur + len(run.text)
+        for i, text in enumerate(texts):
+            nxt = cur + len(text)
             if s_run is None and start < nxt:
                 s_run = i
                 s_off = start - cur
@@ -80,56 +262,55 @@ def _replace_in_paragraph(paragraph, mapping: dict[str, str]) -> None:
             break
 
         if s_run == e_run:
-            run = paragraph.runs[s_run]
-            run.text = run.text[:s_off] + repl + run.text[e_off:]
+            text = texts[s_run]
+            set_text(s_run, text[:s_off] + repl + text[e_off:])
         else:
-            start_run = paragraph.runs[s_run]
-            end_run = paragraph.runs[e_run]
-
             # Mantieni lo stile: il testo sostituito resta nel run iniziale (stile placeholder)
-            start_run.text = start_run.text[:s_off] + repl
+            set_text(s_run, texts[s_run][:s_off] + repl)
             # Il resto del testo dopo il placeholder resta nel run finale (stile originale)
-            end_run.text = end_run.text[e_off:]
+            set_text(e_run, texts[e_run][e_off:])
 
             # Svuota i run intermedi (parte del placeholder)
             for j in range(s_run + 1, e_run):
-                paragraph.runs[j].text = ""
+                set_text(j, "")
 
 
-def _replace_in_cell(cell, mapping: dict[str, str]) -> None:
-    for p in cell.paragraphs:
-        _replace_in_paragraph(p, mapping)
+def _iter_cell_paragraphs(cell):
+    yield from cell.paragraphs
     # Tabelle annidate dentro la cella (Word permette nested tables)
     for t in getattr(cell, "tables", []):
         for row in t.rows:
             for c in row.cells:
-                _replace_in_cell(c, mapping)
+                yield from _iter_cell_paragraphs(c)
 
 
-def _replace_everywhere(doc: Document, mapping: dict[str, str]) -> None:
-    for p in doc.paragraphs:
-        _replace_in_paragraph(p, mapping)
+def _iter_replace_paragraphs(doc: Document):
+    """Paragrafi in cui cercare i placeholder: corpo, tabelle, header e footer."""
+    yield from doc.paragraphs
 
     for t in doc.tables:
         for row in t.rows:
             for cell in row.cells:
-                _replace_in_cell(cell, mapping)
+                yield from _iter_cell_paragraphs(cell)
 
     # Header / footer
     for section in doc.sections:
-        for p in section.header.paragraphs:
-            _replace_in_paragraph(p, mapping)
-        for t in section.header.tables:
-            for row in t.rows:
-                for cell in row.cells:
-                    _replace_in_cell(cell, mapping)
+        for hf in (section.header, section.footer):
+            yield from hf.paragraphs
+            for t in hf.tables:
+                for row in t.rows:
+                    for cell in row.cells:
+                        yield from _iter_cell_paragraphs(cell)
 
-        for p in section.footer.paragraphs:
-            _replace_in_paragraph(p, mapping)
-        for t in section.footer.tables:
-            for row in t.rows:
-                for cell in row.cells:
-                    _replace_in_cell(cell, mapping)
+
+def _replace_in_cell(cell, mapping: dict[str, str]) -> None:
+    for p in _iter_cell_paragraphs(cell):
+        _replace_in_paragraph(p, mapping)
+
+
+def _replace_everywhere(doc: Document, mapping: dict[str, str]) -> None:
+    for p in _iter_replace_paragraphs(doc):
+        _replace_in_paragraph(p, mapping)
 
 
 def _iter_all_tables(doc: Document):
@@ -154,12 +335,13 @@ def _find_beni_table_and_row(doc: Document) -> tuple[Any, int] | tuple[None, Non
     return None, None
 
 
-def _populate_beni_table(doc: Document, beni: list[dict[str, Any]]) -> None:
+def _populate_beni_table(doc: Document, beni: list[dict[str, Any]], location=None) -> None:
     """
     Cerca la riga che contiene [bene 1] e la usa come template.
     Se ci sono N beni, duplica la riga N-1 volte e sostituisce i placeholder.
+    `location` (tabella, indice riga) evita la ricerca se già nota dall'indice del template.
     """
-    table, row_idx = _find_beni_table_and_row(doc)
+    table, row_idx = location if location is not None else _find_beni_table_and_row(doc)
     if table is None or row_idx is None:
         # Nessuna tabella beni trovata: niente da fare
         return
@@ -238,14 +420,25 @@ def _populate_beni_table(doc: Document, beni: list[dict[str, Any]]) -> None:
             table._tbl.remove(row._tr)
 
 
-def _remove_paragraphs_matching(doc: Document, patterns: list[str]) -> None:
+def _iter_removal_paragraphs(doc: Document):
+    """Paragrafi del corpo e delle celle di tutte le tabelle (incluse annidate)."""
+    # Copie delle liste: i paragrafi possono essere rimossi durante l'iterazione
+    yield from list(doc.paragraphs)
+    for table in _iter_all_tables(doc):
+        for row in table.rows:
+            for cell in row.cells:
+                yield from list(cell.paragraphs)
+
+
+def _remove_paragraphs_matching(doc: Document, patterns: list[str], candidates=None) -> None:
     """
     Rimuove dal documento i paragrafi il cui testo contiene almeno uno dei
     pattern indicati (confronto case-insensitive).
-    Cerca sia nel corpo del documento sia dentro le celle di tutte le tabelle.
+    Cerca sia nel corpo del documento sia dentro le celle di tutte le tabelle,
+    oppure solo tra i paragrafi `candidates` se indicati.
     """
-    # Paragrafi nel corpo del documento
-    for p in list(doc.paragraphs):
+    paragraphs = candidates if candidates is not None else _iter_removal_paragraphs(doc)
+    for p in paragraphs:
         text = (p.text or "").lower()
         for pat in patterns:
             if pat.lower() in text:
@@ -254,19 +447,6 @@ def _remove_paragraphs_matching(doc: Document, patterns: list[str]) -> None:
                     parent.remove(p._element)
                 break
 
-    # Paragrafi dentro le tabelle (incluse tabelle annidate)
-    for table in _iter_all_tables(doc):
-        for row in table.rows:
-            for cell in row.cells:
-                for p in list(cell.paragraphs):
-                    text = (p.text or "").lower()
-                    for pat in patterns:
-                        if pat.lower() in text:
-                            parent = p._element.getparent()
-                            if parent is not None:
-                                parent.remove(p._element)
-                            break
-
 
 def generate_offerta_docx(
     template_path: Path,
@@ -283,8 +463,17 @@ def generate_offerta_docx(
     importo_revisione: float,
     importo_sabatini: float = 0,
     beni: list[dict[str, Any]],
+    use_cache: bool = True,
 ) -> BytesIO:
-    doc = Document(str(template_path))
+    """
+    Compila il template offerta. Con use_cache il template arriva dalla cache
+    di processo e vengono visitati solo i nodi dell'indice del template; senza,
+    il file viene riletto e l'intero documento viene scandito.
+    """
+    if use_cache:
+        doc, nodes = _load_template_indexed(template_path)
+    else:
+        doc, nodes = Document(str(template_path)), None
 
     mapping = {
         "[Cliente]": cliente_nome or "",
@@ -300,8 +489,12 @@ def generate_offerta_docx(
         "[importo sabatini]": format_eur(importo_sabatini),
     }
 
-    _replace_everywhere(doc, mapping)
-    _populate_beni_table(doc, beni)
+    if nodes is not None:
+        for p in nodes.placeholders:
+            _replace_in_paragraph(p, mapping)
+    else:
+        _replace_everywhere(doc, mapping)
+    _populate_beni_table(doc, beni, nodes.beni if nodes is not None else None)
 
     # ── Rimuovi righe relative a caricamento / revisione / sabatini se importo è 0 ──
     caricamento_val = float(importo_caricamento or 0)
@@ -309,13 +502,13 @@ def generate_offerta_docx(
     sabatini_val = float(importo_sabatini or 0)
 
     if caricamento_val == 0:
-        _remove_paragraphs_matching(doc, ["pto c)"])
+        _remove_paragraphs_matching(doc, ["pto c)"], nodes.pto["pto c)"] if nodes is not None else None)
 
     if revisione_val == 0:
-        _remove_paragraphs_matching(doc, ["pto d)"])
+        _remove_paragraphs_matching(doc, ["pto d)"], nodes.pto["pto d)"] if nodes is not None else None)
 
     if sabatini_val == 0:
-        _remove_paragraphs_matching(doc, ["pto e)"])
+        _remove_paragraphs_matching(doc, ["pto e)"], nodes.pto["pto e)"] if nodes is not None else None)
 
     buf = BytesIO()
     doc.save(buf)
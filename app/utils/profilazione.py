@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app, g, has_request_context, request
+from flask_login import current_user
+from sqlalchemy import event
+
+
+# Profilazione per richiesta: gli hook before/after_cursor_execute contano le
+# query e il tempo SQL della richiesta in corso (in flask.g), before/after_request
+# misurano il tempo totale. Ogni risposta riceve l'header Server-Timing (visibile
+# nel pannello Network del browser); le richieste oltre SLOW_REQUEST_MS vengono
+# aggiunte, una riga JSON ciascuna, a SLOW_REQUEST_LOG nella cartella instance.
+# In memoria restano anche i totali per endpoint di questo processo.
+
+_statistiche = {}
+_lock_statistiche = threading.Lock()
+_lock_log = threading.Lock()
+
+
+def _prima_della_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        conn.info.setdefault('profilazione_inizio', []).append(time.perf_counter())
+
+
+def _dopo_la_query(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context():
+        return
+    inizi = conn.info.get('profilazione_inizio')
+    if not inizi:
+        return
+    durata = time.perf_counter() - inizi.pop()
+    profilo = g.get('profilazione')
+    if profilo is not None:
+        profilo['query'] += 1
+        profilo['sql'] += durata
+
+
+def _errore_query(exception_context):
+    # La query fallita non arriva ad after_cursor_execute: toglie il suo inizio
+    conn = exception_context.connection
+    inizi = conn.info.get('profilazione_inizio') if conn is not None else None
+    if inizi:
+        inizi.pop()
+
+
+def _inizio_richiesta():
+    g.profilazione = {'inizio': time.perf_counter(), 'query': 0, 'sql': 0.0}
+
+
+def _registra(endpoint, totale_ms, sql_ms, query):
+    with _lock_statistiche:
+        s = _statistiche.setdefault(endpoint, {
+            'richieste': 0, 'totale_ms': 0.0, 'sql_ms': 0.0, 'query': 0, 'max_ms': 0.0,
+        })
+        s['richieste'] += 1
+        s['totale_ms'] += totale_ms
+        s['sql_ms'] += sql_ms
+        s['query'] += query
+        s['max_ms'] = max(s['max_ms'], totale_ms)
+
+
+def _scrivi_richiesta_lenta(riga):
+    percorso = current_app.config.get('SLOW_REQUEST_LOG')
+    if not percorso:
+        return
+    percorso = os.path.join(current_app.instance_path, percorso)
+    try:
+        with _lock_log, open(percorso, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(riga, ensure_ascii=False) + '\n')
+    except OSError:
+        current_app.logger.exception("Impossibile scrivere il log delle richieste lente")
+
+
+def _server_timing_attivo():
+    # None = in debug, altrimenti solo per gli admin: tempi e numero di query
+    # non vanno mostrati agli utenti base
+    configurato = current_app.config.get('SERVER_TIMING')
+    if configurato is not None:
+        return bool(configurato)
+    return current_app.debug or (current_user.is_authenticated and current_user.role == 'admin')
+
+
+def _fine_richiesta(response):
+    profilo = g.pop('profilazione', None)
+    if profilo is None:
+        return response
+    totale_ms = (time.perf_counter() - profilo['inizio']) * 1000
+    sql_ms = profilo['sql'] * 1000
+    endpoint = request.endpoint or '-'
+    _registra(endpoint, totale_ms, sql_ms, profilo['query'])
+
+    if _server_timing_attivo():
+        response.headers.add(
+            'Server-Timing',
+            f'sql;dur={sql_ms:.1f};desc="{profilo["query"]} query", app;dur={totale_ms - sql_ms:.1f}, total;dur={totale_ms:.1f}',
+        )
+
+    soglia = current_app.config.get('SLOW_REQUEST_MS')
+    if soglia is not None and totale_ms >= soglia:
+        _scrivi_richiesta_lenta({
+            'ts': datetime.now().isoformat(timespec='seconds'),
+            'metodo': request.method,
+            'path': request.full_path.rstrip('?'),
+            'endpoint': endpoint,
+            'status': response.status_code,
+            'totale_ms': round(totale_ms, 1),
+            'sql_ms': round(sql_ms, 1),
+            'query': profilo['query'],
+            'pid': os.getpid(),
+        })
+    return response
+
+
+def statistiche_endpoint():
+    """Totali e medie per endpoint registrati da questo processo, dal più costoso."""
+    with _lock_statistiche:
+        copia = {endpoint: dict(s) for endpoint, s in _statistiche.items()}
+    risultato = []
+    for endpoint, s in copia.items():
+        n = s['richieste']
+        risultato.append({
+            'endpoint': endpoint,
+            'richieste': n,
+            'totale_ms': round(s['totale_ms'], 1),
+            'medio_ms': round(s['totale_ms'] / n, 1),
+            'sql_medio_ms': round(s['sql_ms'] / n, 1),
+            'query_medie': round(s['query'] / n, 1),
+            'max_ms': round(s['max_ms'], 1),
+        })
+    return sorted(risultato, key=lambda r: -r['totale_ms'])
+
+
+def init_profilazione(app, engine):
+    """Registra gli hook SQL sull'engine e quelli di richiesta sull'app."""
+    event.listen(engine, 'before_cursor_execute', _prima_della_query)
+    event.listen(engine, 'after_cursor_execute', _dopo_la_query)
+    event.listen(engine, 'handle_error', _errore_query)
+    app.before_request(_inizio_richiesta)
+    app.after_request(_fine_richiesta)
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+from sqlalchemy import event
+
+
+# Pragmas applicati ad ogni nuova connessione SQLite del pool. Con il journal
+# WAL le letture non bloccano la scrittura (e viceversa): una modifica di un
+# admin non ferma più le dashboard degli altri, e busy_timeout fa attendere
+# le scritture concorrenti invece di fallire subito con "database is locked".
+
+PRAGMAS_DEFAULT = {
+    'busy_timeout': 5000,        # ms di attesa su un lock prima dell'errore (per primo: vale anche per il cambio di journal)
+    'journal_mode': 'WAL',       # persistente nel file; 'DELETE' per tornare al journal classico
+    'synchronous': 'NORMAL',     # con WAL resta consistente, fsync solo ai checkpoint
+    'cache_size': -20000,        # negativo = KiB (circa 20 MB di cache pagine per connessione)
+    'mmap_size': 268435456,      # 256 MB letti tramite memory map
+    'temp_store': 'MEMORY',
+}
+
+
+def imposta_pragmas(dbapi_connection, pragmas):
+    """Esegue i PRAGMA indicati (quelli a None vengono saltati)."""
+    cursor = dbapi_connection.cursor()
+    try:
+        for nome, valore in pragmas.items():
+            if valore is not None:
+                cursor.execute(f'PRAGMA {nome} = {valore}')
+    finally:
+        cursor.close()
+
+
+def init_sqlite_pragmas(engine, pragmas=None):
+    """Registra i pragmas sull'engine (solo se SQLite)."""
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = dict(PRAGMAS_DEFAULT if pragmas is None else pragmas)
+
+    @event.listens_for(engine, 'connect')
+    def _alla_connessione(dbapi_connection, connection_record):
+        imposta_pragmas(dbapi_connection, pragmas)
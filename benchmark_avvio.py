@@ -0,0 +1,83 @@
+"""
+Benchmark dell'avvio a freddo di un worker: esegue più volte, ognuna in un
+processo Python nuovo con `-X importtime`, l'import dell'app e create_app().
+
+Riporta (mediana sulle ripetizioni):
+- tempo di create_app() compresi gli import
+- tempo totale degli import e numero di moduli caricati
+- i moduli più pesanti dell'ultima esecuzione
+
+e verifica che i moduli usati solo da alcune funzionalità (python-docx / lxml
+per le offerte, numpy per i calcoli dei compensi, multiprocessing per la
+generazione massiva, openpyxl per l'export Excel) non vengano caricati all'avvio.
+
+Una prima esecuzione non misurata applica le eventuali migrazioni mancanti,
+così viene misurato il percorso veloce dei worker.
+
+Istruzioni:
+1. Assicurati di essere nella directory del progetto
+2. Esegui: python benchmark_avvio.py [ripetizioni]
+   (default 5 ripetizioni)
+"""
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+PROGETTO = Path(__file__).resolve().parent
+
+# Moduli che devono arrivare solo al primo utilizzo della relativa funzionalità
+SOLO_SU_RICHIESTA = ['docx', 'lxml', 'numpy', 'multiprocessing', 'openpyxl']
+
+CODICE = """
+import time
+t0 = time.perf_counter()
+from app import create_app
+create_app()
+print(f"{(time.perf_counter() - t0) * 1000:.3f}")
+"""
+
+
+def _esegui():
+    r = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CODICE],
+        cwd=PROGETTO, capture_output=True, text=True, check=True,
+    )
+    moduli = []
+    for riga in r.stderr.splitlines():
+        if not riga.startswith('import time:') or 'cumulative' in riga:
+            continue
+        _, cumulativo, nome = riga[len('import time:'):].split('|')
+        moduli.append((nome.rstrip(), int(cumulativo)))
+    return float(r.stdout.strip().splitlines()[-1]), moduli
+
+
+def main():
+    ripetizioni = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    _esegui()
+
+    tempi, import_ms, n_moduli = [], [], []
+    for _ in range(ripetizioni):
+        ms, moduli = _esegui()
+        radici = [(nome.strip(), us) for nome, us in moduli if not nome.startswith('  ')]
+        tempi.append(ms)
+        import_ms.append(sum(us for _, us in radici) / 1000)
+        n_moduli.append(len(moduli))
+
+    print(f"[i] create_app() a freddo:  {statistics.median(tempi):8.1f} ms")
+    print(f"[i] Import totali:          {statistics.median(import_ms):8.1f} ms")
+    print(f"[i] Moduli caricati:        {statistics.median(n_moduli):8.0f}")
+    print()
+    print("Moduli più pesanti (cumulativo, ultima esecuzione):")
+    for nome, us in sorted(radici, key=lambda x: -x[1])[:10]:
+        print(f"  {us / 1000:8.1f} ms  {nome}")
+    print()
+
+    caricati = {nome.strip().split('.')[0] for nome, _ in moduli}
+    for modulo in SOLO_SU_RICHIESTA:
+        stato = "[!] caricato all'avvio" if modulo in caricati else "[OK] non caricato"
+        print(f"{stato:<24} {modulo}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark della generazione offerte .docx su tutti i template in
+app/doc_templates/offerte/.
+
+Confronta, per ogni template:
+- generazione completa: file riletto e intero documento scandito ad ogni offerta
+- generazione con cache: template parsato una volta per processo e indice dei
+  nodi con placeholder (vengono toccati solo quei paragrafi / righe)
+
+e verifica che i due .docx prodotti siano identici.
+
+Istruzioni:
+1. Assicurati di essere nella directory del progetto
+2. Esegui: python benchmark_offerte.py [ripetizioni]
+   (default 30 ripetizioni per template)
+"""
+import statistics
+import sys
+import time
+import zipfile
+from pathlib import Path
+
+from app.utils.offerta_docx import generate_offerta_docx, template_cache_info
+
+TEMPLATES_DIR = Path(__file__).resolve().parent / "app" / "doc_templates" / "offerte"
+
+DATI_OFFERTA = dict(
+    cliente_nome="Cliente Benchmark S.r.l.",
+    indirizzo="Via Roma",
+    civico="10",
+    cap="20100",
+    comune="Milano",
+    prov="MI",
+    piva="01234567890",
+    data_emissione_text="15 marzo 2026",
+    importo_caricamento=0,
+    importo_revisione=350,
+    importo_sabatini=0,
+    beni=[
+        {"descrizione": f"Bene strumentale {i}", "valore": 25000 * i, "importo_offerta": 1200 * i}
+        for i in range(1, 4)
+    ],
+)
+
+
+def _parti(buf):
+    with zipfile.ZipFile(buf) as z:
+        return {nome: z.read(nome) for nome in z.namelist()}
+
+
+def _misura(template, use_cache, ripetizioni):
+    tempi = []
+    for _ in range(ripetizioni):
+        t0 = time.perf_counter()
+        generate_offerta_docx(template, use_cache=use_cache, **DATI_OFFERTA)
+        tempi.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(tempi)
+
+
+def main():
+    ripetizioni = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    templates = sorted(TEMPLATES_DIR.glob("off_*.docx"))
+    if not templates:
+        print(f"[!] Nessun template trovato in {TEMPLATES_DIR}")
+        return
+
+    print(f"{'Template':<22}{'Completa (ms)':>15}{'Cache (ms)':>13}{'Speedup':>10}  Output")
+    print("-" * 70)
+    for template in templates:
+        identico = _parti(generate_offerta_docx(template, use_cache=False, **DATI_OFFERTA)) == \
+            _parti(generate_offerta_docx(template, use_cache=True, **DATI_OFFERTA))
+        completa = _misura(template, False, ripetizioni)
+        cache = _misura(template, True, ripetizioni)
+        print(f"{template.name:<22}{completa:>15.2f}{cache:>13.2f}{completa / cache:>9.1f}x  "
+              f"{'identico' if identico else 'DIVERSO'}")
+
+    print()
+    print(f"[i] Mediana su {ripetizioni} ripetizioni per template. Cache: {template_cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
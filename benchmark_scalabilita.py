@@ -0,0 +1,126 @@
+"""
+Benchmark di scalabilità delle viste principali: per ogni dimensione (default
+1k / 10k / 100k lavori) crea un database temporaneo con genera_dati_sintetici.py
+e chiama tramite il test client di Flask, con l'utente admin:
+- dashboard
+- lavori_admin (tutti i filtro_stato)
+- fatturazione/<tipo> e l'elenco fatture (lista_fatture)
+- api_da_incassare
+- genera_offerta (su lavori diversi a ogni ripetizione)
+
+Per ogni vista riporta mediana e 95° percentile della latenza, numero di query
+e tempo SQL (dall'header Server-Timing aggiunto da app/utils/profilazione.py).
+La prima chiamata di ogni vista non viene misurata. gestionale.db non viene toccato.
+
+Istruzioni:
+1. Assicurati di essere nella directory del progetto
+2. Esegui: python benchmark_scalabilita.py [ripetizioni] [dimensioni...]
+   (default 10 ripetizioni, dimensioni 1000 10000 100000)
+"""
+import re
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from app import create_app, db
+from app.migrazioni import PASSWORD_DEFAULT, UTENTI_DEFAULT
+from app.models import LavoroAdmin
+from genera_dati_sintetici import genera_dati
+
+VISTE = [
+    ('dashboard', 'GET', '/dashboard'),
+    *[(f'lavori_admin {filtro or "(tutti)"}', 'GET', f'/lavori_admin?filtro_stato={filtro}')
+      for filtro in ('', 'in_lavorazione', 'da_incassare', 'completati', 'abbandonati')],
+    *[(f'fatturazione/{tipo}', 'GET', f'/fatturazione/{tipo}') for tipo in ('fe', 'amin', 'galvan', 'fh')],
+    *[(f'lista_fatture {tipo}', 'GET', f'/api/fatturazione/lista/{tipo}') for tipo in ('fe', 'amin')],
+    ('api_da_incassare', 'GET', '/api/da-incassare'),
+    ('genera_offerta', 'POST', '/api/lavoro/{id}/genera_offerta'),
+]
+
+_SERVER_TIMING = re.compile(r'sql;dur=([\d.]+);desc="(\d+) query"')
+
+
+def _percentile(valori, p):
+    valori = sorted(valori)
+    return valori[min(len(valori) - 1, int(round(p / 100 * (len(valori) - 1))))]
+
+
+def _misura_dimensione(n_lavori, ripetizioni):
+    risultati = {}
+    with tempfile.TemporaryDirectory() as cartella:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{Path(cartella) / 'benchmark.db'}",
+            'SLOW_REQUEST_MS': None,
+            'INDEX_ADVISOR': False,
+        })
+        with app.app_context():
+            t0 = time.perf_counter()
+            genera_dati(db.engine, n_lavori)
+            print(f"[i] {n_lavori} lavori generati in {time.perf_counter() - t0:.1f}s")
+            # Lavori per genera_offerta: uno diverso a ogni chiamata
+            ids_offerta = db.session.execute(
+                db.select(LavoroAdmin.id)
+                .where(LavoroAdmin.stato != 'chiusa', LavoroAdmin.categoria.is_not(None))
+                .limit(ripetizioni + 1)
+            ).scalars().all()
+            db.session.remove()
+
+        client = app.test_client()
+        client.post('/login', data={'username': UTENTI_DEFAULT['admin'][0], 'password': PASSWORD_DEFAULT})
+
+        for nome, metodo, url in VISTE:
+            tempi, query, sql = [], [], []
+            for i in range(ripetizioni + 1):
+                t0 = time.perf_counter()
+                r = client.open(url.format(id=ids_offerta[i % len(ids_offerta)]), method=metodo)
+                ms = (time.perf_counter() - t0) * 1000
+                if r.status_code != 200:
+                    raise RuntimeError(f"{nome}: HTTP {r.status_code}")
+                if i == 0:
+                    continue  # Riscaldamento
+                tempi.append(ms)
+                trovato = _SERVER_TIMING.search(r.headers.get('Server-Timing', ''))
+                if trovato:
+                    sql.append(float(trovato.group(1)))
+                    query.append(int(trovato.group(2)))
+            risultati[nome] = {
+                'p50': statistics.median(tempi),
+                'p95': _percentile(tempi, 95),
+                'query': statistics.median(query) if query else None,
+                'sql': statistics.median(sql) if sql else None,
+            }
+
+        with app.app_context():
+            db.engine.dispose()
+    return risultati
+
+
+def main():
+    args = [int(a) for a in sys.argv[1:]]
+    ripetizioni = args[0] if args else 10
+    dimensioni = args[1:] or [1000, 10000, 100000]
+
+    tutti = {}
+    for n_lavori in dimensioni:
+        tutti[n_lavori] = risultati = _misura_dimensione(n_lavori, ripetizioni)
+        print()
+        print(f"{'Vista':<32}{'p50 ms':>10}{'p95 ms':>10}{'Query':>8}{'SQL ms':>10}")
+        print("-" * 70)
+        for nome, r in risultati.items():
+            query = f"{r['query']:.0f}" if r['query'] is not None else '-'
+            sql = f"{r['sql']:.1f}" if r['sql'] is not None else '-'
+            print(f"{nome:<32}{r['p50']:>10.1f}{r['p95']:>10.1f}{query:>8}{sql:>10}")
+        print()
+
+    if len(dimensioni) > 1:
+        print("Mediana (ms) per dimensione:")
+        print(f"{'Vista':<32}" + "".join(f"{n:>12}" for n in dimensioni))
+        print("-" * (32 + 12 * len(dimensioni)))
+        for nome, _, _ in VISTE:
+            print(f"{nome:<32}" + "".join(f"{tutti[n][nome]['p50']:>12.1f}" for n in dimensioni))
+
+
+if __name__ == "__main__":
+    main()
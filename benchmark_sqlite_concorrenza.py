@@ -0,0 +1,144 @@
+"""
+Benchmark di concorrenza SQLite: N thread lettori (query da dashboard /
+elenco lavori) e M thread scrittori (modifiche di stato dei beni, come
+update_bene_field) lavorano insieme sullo stesso file per qualche secondo.
+
+Confronta:
+- pragmas di default (journal classico, come prima del tuning)
+- pragmas di produzione (app/utils/sqlite_pragmas.py: WAL, synchronous=NORMAL,
+  cache_size, mmap_size, busy_timeout)
+
+riportando operazioni al secondo di lettori e scrittori ed errori
+"database is locked". Il database è un file temporaneo con lo schema dei
+modelli: gestionale.db non viene toccato.
+
+Istruzioni:
+1. Assicurati di essere nella directory del progetto
+2. Esegui: python benchmark_sqlite_concorrenza.py [lettori] [scrittori] [secondi] [lavori]
+   (default 8 lettori, 2 scrittori, 5 secondi, 2000 lavori)
+"""
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app import models  # noqa: F401  (registra le tabelle nei metadata)
+from app.utils.sqlite_pragmas import PRAGMAS_DEFAULT, init_sqlite_pragmas
+
+STATI = ['vuoto', 'In corso', 'da fatturare', 'da incassare', 'incassata', 'chiusa']
+
+LETTURE = [
+    text("SELECT stato, COUNT(*), SUM(importo_offerta) FROM lavoro_admin GROUP BY stato"),
+    text("SELECT b.stato, COUNT(*) FROM bene b JOIN lavoro_admin l ON l.id = b.lavoro_id "
+         "WHERE l.stato != 'chiusa' GROUP BY b.stato"),
+    text("SELECT id, numero, cliente_nome FROM lavoro_admin WHERE stato != 'chiusa' ORDER BY numero LIMIT 50"),
+]
+
+
+def _crea_database(percorso, n_lavori):
+    engine = create_engine(f"sqlite:///{percorso}")
+    db.metadata.create_all(engine)
+    rnd = random.Random(1)
+    with engine.begin() as conn:
+        conn.execute(db.metadata.tables['lavoro_admin'].insert(), [
+            {'id': i, 'numero': i, 'cliente_nome': f'Cliente {i}', 'stato': rnd.choice(STATI),
+             'importo_offerta': rnd.randint(500, 20000), 'beni_totali': 2, 'beni_abbandonati': 0,
+             'is_fully_abbandonato': False}
+            for i in range(1, n_lavori + 1)
+        ])
+        conn.execute(db.metadata.tables['bene'].insert(), [
+            {'lavoro_id': i, 'descrizione': f'Bene {i}-{j}', 'stato': rnd.choice(STATI), 'ordine': j}
+            for i in range(1, n_lavori + 1) for j in range(2)
+        ])
+    engine.dispose()
+
+
+def _esegui(percorso, pragmas, lettori, scrittori, secondi, n_lavori):
+    engine = create_engine(f"sqlite:///{percorso}", pool_size=lettori + scrittori)
+    if pragmas is not None:
+        init_sqlite_pragmas(engine, pragmas)
+    else:
+        # Come prima del tuning: rimette il journal classico sul file
+        with engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA journal_mode = DELETE")
+
+    conteggi = {'letture': 0, 'scritture': 0, 'locked': 0}
+    lock = threading.Lock()
+    fine = time.perf_counter() + secondi
+
+    def lettore():
+        n = 0
+        with engine.connect() as conn:
+            while time.perf_counter() < fine:
+                try:
+                    for query in LETTURE:
+                        conn.execute(query).fetchall()
+                    conn.commit()
+                    n += 1
+                except OperationalError:
+                    conn.rollback()
+                    with lock:
+                        conteggi['locked'] += 1
+        with lock:
+            conteggi['letture'] += n
+
+    def scrittore(seme):
+        rnd = random.Random(seme)
+        n = 0
+        with engine.connect() as conn:
+            while time.perf_counter() < fine:
+                try:
+                    conn.execute(
+                        text("UPDATE bene SET stato = :stato WHERE lavoro_id = :id"),
+                        {'stato': rnd.choice(STATI), 'id': rnd.randint(1, n_lavori)},
+                    )
+                    conn.commit()
+                    n += 1
+                except OperationalError:
+                    conn.rollback()
+                    with lock:
+                        conteggi['locked'] += 1
+        with lock:
+            conteggi['scritture'] += n
+
+    threads = [threading.Thread(target=lettore) for _ in range(lettori)]
+    threads += [threading.Thread(target=scrittore, args=(i,)) for i in range(scrittori)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    engine.dispose()
+    return {k: v / secondi if k != 'locked' else v for k, v in conteggi.items()}
+
+
+def main():
+    args = [int(a) for a in sys.argv[1:]]
+    lettori, scrittori, secondi, n_lavori = args + [8, 2, 5, 2000][len(args):]
+
+    print(f"[i] {lettori} lettori, {scrittori} scrittori, {secondi}s per configurazione, {n_lavori} lavori")
+    print()
+    print(f"{'Configurazione':<16}{'Letture/s':>12}{'Scritture/s':>14}{'Locked':>9}")
+    print("-" * 51)
+    risultati = {}
+    with tempfile.TemporaryDirectory() as cartella:
+        for nome, pragmas in (('default', None), ('produzione', PRAGMAS_DEFAULT)):
+            percorso = Path(cartella) / f"{nome}.db"
+            _crea_database(percorso, n_lavori)
+            r = risultati[nome] = _esegui(percorso, pragmas, lettori, scrittori, secondi, n_lavori)
+            print(f"{nome:<16}{r['letture']:>12.1f}{r['scritture']:>14.1f}{r['locked']:>9}")
+
+    base, nuovo = risultati['default'], risultati['produzione']
+    print()
+    for chiave in ('letture', 'scritture'):
+        if base[chiave]:
+            print(f"[i] {chiave.capitalize()}: {nuovo[chiave] / base[chiave]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
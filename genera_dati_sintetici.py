@@ -0,0 +1,275 @@
+"""
+Generatore di dati sintetici per i benchmark: crea N lavori admin (es. 1k /
+10k / 100k) con distribuzioni realistiche di:
+- beni per lavoro (quasi sempre 1-2, qualche lavoro fino a 10)
+- stati di lavori e beni lungo il ciclo vuoto -> ... -> incassata / chiusa
+- abbandoni (singoli beni o lavori interi, con ordine_abbandono progressivo)
+- origini / redattori / esterni e relativi compensi
+- numeri fattura per soggetto, condivisi da più lavori
+
+Gli inserimenti sono massivi (executemany di SQLAlchemy Core): i contatori dei
+beni sono calcolati qui, mentre fatture e riepilogo della dashboard vengono
+ricostruiti alla fine con i servizi dell'app, come farebbe una migrazione.
+
+Istruzioni:
+1. Assicurati di essere nella directory del progetto
+2. Esegui: python genera_dati_sintetici.py <n_lavori> <percorso_db> [seme]
+   Il database indicato viene creato da zero (non usare instance/gestionale.db).
+"""
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Bene, Cliente, LavoroAdmin, NoteAdmin
+
+_BLOCCO = 5000  # Righe per executemany
+
+# Ciclo di vita: indice della fase -> stato del bene (e del lavoro)
+FASI = ['vuoto', 'In corso', 'da firmare', 'da fatturare', 'da incassare', 'incassata']
+PESI_FASI = [6, 18, 12, 14, 20, 30]
+QUOTA_CHIUSI = 0.6  # Lavori incassati già chiusi
+
+ORIGINI = [('AMIN', 30), ('GALVAN', 25), ('FH', 20), ('EXT', 15), ('BIANC', 5), ('DELOITTE', 5)]
+REDATTORI = [('AMIN', 35), ('GALVAN', 35), ('FH', 20), ('BIANC', 5), ('DELOITTE', 5)]
+CATEGORIE = [('old', 35), ('iperamm', 35), ('rsid', 15), ('varie', 15)]
+ESTERNI = ['Rossi', 'Bianchi', 'Verdi', 'Studio Neri', 'Colombo & Associati']
+MOTIVI_ABBANDONO = ['assegnato_altro_studio', 'abbandonato_cliente', 'altro']
+COLLABORATORI = ['Gianmarco', 'Francescos', 'Francescou', 'Giovanni', 'Marco']
+
+TIPOLOGIE_BENI = ['Tornio CNC', 'Centro di lavoro', 'Pressa piegatrice', 'Impianto fotovoltaico',
+                  'Linea di confezionamento', 'Magazzino automatico', 'Robot di saldatura',
+                  'Software gestionale', 'Carrello elevatore', 'Impianto di aspirazione']
+
+
+def _scegli(rnd, pesati):
+    return rnd.choices([v for v, _ in pesati], weights=[p for _, p in pesati])[0]
+
+
+def _n_beni(rnd):
+    r = rnd.random()
+    if r < 0.60:
+        return 1
+    if r < 0.85:
+        return 2
+    if r < 0.97:
+        return rnd.randint(3, 5)
+    return rnd.randint(6, 10)
+
+
+def _compensi_manuali(importo, origine, redattore, importo_ext):
+    """
+    Compensi inseriti a mano per i lavori con BIANC / DELOITTE, che il form non
+    calcola; per gli altri lavori restano a zero e li calcola _calcola_compensi.
+    """
+    c = dict.fromkeys(('c_fe', 'c_amin', 'c_galvan', 'c_fh', 'c_bianc', 'c_deloitte'), 0.0)
+    if origine not in ('BIANC', 'DELOITTE') and redattore not in ('BIANC', 'DELOITTE'):
+        return c
+    base = max(0.0, importo - importo_ext)
+    c['c_fe'] = round(base * 0.15, 2)
+    resto = base - c['c_fe']
+    c[f'c_{redattore.lower()}'] = round(resto * 0.70, 2)
+    c['c_fh'] += round(resto * 0.30, 2)
+    return c
+
+
+def _calcola_compensi(lavori):
+    """
+    Compensi automatici come li salva il form alla creazione, con il motore
+    dell'app (recalc_compensi_batch) su tutti i lavori in una passata.
+    """
+    from app.services.compensi import COMPENSI_KEYS, recalc_compensi_batch
+
+    colonna = lambda chiave: [lavoro.get(chiave) or 0 for lavoro in lavori]
+    flag = lambda chiave: [bool(lavoro.get(chiave)) for lavoro in lavori]
+    importi = colonna('importo_offerta')
+    comp = recalc_compensi_batch(
+        shown_importo=importi, total_importo=importi,
+        origine=[lavoro['origine'] for lavoro in lavori], redattore=[lavoro['redattore'] for lavoro in lavori],
+        **{chiave: colonna(chiave) for chiave in (*COMPENSI_KEYS, 'importo_revisione', 'importo_caricamento', 'importo_sabatini')},
+        **{chiave: flag(chiave) for chiave in ('has_revisore', 'has_caricamento', 'has_sabatini', 'spese_amministrative')},
+        calcolo_automatico=True,
+    )
+    for i, lavoro in enumerate(lavori):
+        for chiave in COMPENSI_KEYS:
+            lavoro[chiave] = round(float(comp[chiave][i]), 2)
+
+
+class _Fatturatore:
+    """Numeri fattura per soggetto: ogni fattura raccoglie da 1 a 4 lavori."""
+
+    def __init__(self, rnd):
+        self.rnd = rnd
+        self.correnti = {}
+
+    def numero(self, soggetto, giorno):
+        numero, data, restanti = self.correnti.get(soggetto, (0, None, 0))
+        if restanti == 0:
+            numero, data, restanti = numero + 1, giorno, self.rnd.choice([1, 1, 1, 2, 2, 3, 4])
+        self.correnti[soggetto] = (numero, data, restanti - 1)
+        return f"{soggetto.upper()}-{data.year}/{numero}", data
+
+
+def _lavori_e_beni(n_lavori, rnd, oggi, clienti):
+    fatturatore = _Fatturatore(rnd)
+    entro_oggi = lambda giorno, giorni: min(oggi, giorno + timedelta(days=giorni))
+    ordine_abbandono = 0
+    attivi = 0  # Numerazione attiva: 1..N sui lavori non chiusi e non del tutto abbandonati
+    lavori, beni, fatturati = [], [], []
+    for i in range(1, n_lavori + 1):
+        origine = _scegli(rnd, ORIGINI)
+        redattore = _scegli(rnd, REDATTORI)
+        fase = rnd.choices(range(len(FASI)), weights=PESI_FASI)[0]
+        creato = oggi - timedelta(days=int((n_lavori - i) * 730 / n_lavori) + rnd.randint(0, 5))
+        cliente_id, cliente_nome = clienti[rnd.randrange(len(clienti))]
+
+        # Beni: per lo più nella fase del lavoro, qualcuno una fase indietro
+        n = _n_beni(rnd)
+        abbandono = rnd.random()
+        tutti_abbandonati = abbandono < 0.05
+        beni_lavoro = []
+        for j in range(n):
+            stato = FASI[max(0, fase - (rnd.random() < 0.15))]
+            bene = {
+                'lavoro_id': i, 'ordine': j, 'stato': stato,
+                'descrizione': f"{rnd.choice(TIPOLOGIE_BENI)} matr. {i:06d}-{j + 1}",
+                'valore': float(rnd.randrange(5_000, 400_000, 500)),
+                'importo_offerta': float(rnd.randrange(300, 12_000, 50)),
+                'data_pec': entro_oggi(creato, rnd.randint(20, 90)) if fase >= 3 else None,
+            }
+            if tutti_abbandonati or (abbandono < 0.13 and j == n - 1 and n > 1):
+                ordine_abbandono += 1
+                motivo = rnd.choice(MOTIVI_ABBANDONO)
+                bene.update(
+                    stato='abbandonato', motivo_abbandono=motivo,
+                    commento_abbandono='Cliente non più interessato' if motivo == 'altro' else None,
+                    data_abbandono=entro_oggi(creato, rnd.randint(5, 120)),
+                    ordine_abbandono=ordine_abbandono,
+                )
+            beni_lavoro.append(bene)
+        beni.extend(beni_lavoro)
+
+        n_abbandonati = sum(b['stato'] == 'abbandonato' for b in beni_lavoro)
+        importo = sum(b['importo_offerta'] for b in beni_lavoro)
+        stato = FASI[fase]
+        if fase == len(FASI) - 1 and rnd.random() < QUOTA_CHIUSI:
+            stato = 'chiusa'
+        # Un lavoro uscito dalla numerazione tiene il numero che aveva all'uscita
+        attivo = stato != 'chiusa' and n_abbandonati < n
+        attivi += attivo
+
+        has_revisore = rnd.random() < 0.3
+        importo_revisione = float(rnd.choice([250, 350, 500])) if has_revisore else 0.0
+        has_caricamento = rnd.random() < 0.2
+        importo_caricamento = float(rnd.choice([150, 200])) if has_caricamento else 0.0
+        c_ext = round(importo * 0.10, 2) if origine == 'EXT' else 0.0
+
+        lavoro = {
+            'id': i, 'numero': attivi if attivo else attivi + 1, 'cliente_id': cliente_id, 'cliente_nome': cliente_nome,
+            'bene': beni_lavoro[0]['descrizione'],
+            'valore_bene': sum(b['valore'] for b in beni_lavoro), 'importo_offerta': importo,
+            'origine': origine, 'redattore': redattore,
+            'nome_esterno': rnd.choice(ESTERNI) if origine == 'EXT' else None,
+            'collaboratore': rnd.choice(COLLABORATORI) if rnd.random() < 0.25 else None,
+            'categoria': _scegli(rnd, CATEGORIE), 'stato': stato,
+            'data_offerta_check': fase >= 2, 'data_offerta': entro_oggi(creato, 3) if fase >= 2 else None,
+            'data_firma_check': fase >= 3, 'data_firma': entro_oggi(creato, 15) if fase >= 3 else None,
+            'firma_esito': 'OK' if fase >= 3 else None,
+            'beni_totali': n, 'beni_abbandonati': n_abbandonati, 'is_fully_abbandonato': n_abbandonati == n,
+            'has_revisore': has_revisore, 'nome_revisore': 'Revisore Srl' if has_revisore else None,
+            'importo_revisione': importo_revisione, 'c_revisore': round(importo_revisione * 0.8, 2),
+            'has_caricamento': has_caricamento, 'importo_caricamento': importo_caricamento,
+            'c_caricamento': importo_caricamento, 'c_ext': c_ext,
+            'created_at': datetime.combine(creato, datetime.min.time()),
+            **_compensi_manuali(importo, origine, redattore, c_ext),
+        }
+        if fase >= 4:
+            fatturati.append((lavoro, entro_oggi(creato, rnd.randint(60, 150))))
+        lavori.append(lavoro)
+
+    _calcola_compensi(lavori)
+    # Fatture: emesse da 'da incassare' in poi per ogni soggetto con compenso
+    for lavoro, giorno_fattura in fatturati:
+        for campo in ('c_fe', 'c_amin', 'c_galvan', 'c_fh', 'c_bianc', 'c_deloitte', 'c_ext', 'c_revisore'):
+            if lavoro[campo] > 0:
+                soggetto = campo[2:]
+                lavoro[f'f_{soggetto}'], lavoro[f'data_fattura_{soggetto}'] = fatturatore.numero(soggetto, giorno_fattura)
+    return lavori, beni
+
+
+def _inserisci(conn, tabella, righe):
+    # In un executemany tutte le righe devono avere le stesse chiavi
+    chiavi = dict.fromkeys(k for riga in righe for k in riga)
+    for inizio in range(0, len(righe), _BLOCCO):
+        conn.execute(tabella.insert(), [{**chiavi, **riga} for riga in righe[inizio:inizio + _BLOCCO]])
+
+
+def genera_dati(engine, n_lavori, seme=1, oggi=None):
+    """
+    Popola un database vuoto (schema già creato) con n_lavori lavori sintetici.
+    Restituisce i conteggi delle righe inserite.
+    """
+    from app.services.dashboard import ricostruisci_dashboard_summary
+    from app.services.fatture import ricostruisci_fatture
+
+    rnd = random.Random(seme)
+    oggi = oggi or date.today()
+    n_clienti = max(10, n_lavori // 4)
+    clienti = [
+        {'id': i, 'nome': f"Cliente Sintetico {i:06d} S.r.l.", 'p_iva': f"IT{rnd.randrange(10**10, 10**11)}",
+         'indirizzo': 'Via Roma', 'civico': str(rnd.randint(1, 200)), 'cap': '20100',
+         'comune': rnd.choice(['Milano', 'Roma', 'Torino', 'Bologna', 'Padova']), 'provincia': 'MI',
+         'pec': f"cliente{i}@pec.it"}
+        for i in range(1, n_clienti + 1)
+    ]
+    lavori, beni = _lavori_e_beni(n_lavori, rnd, oggi, [(c['id'], c['nome']) for c in clienti])
+
+    with engine.begin() as conn:
+        autore_id = conn.exec_driver_sql("SELECT min(id) FROM user WHERE role = 'admin'").scalar()
+        _inserisci(conn, Cliente.__table__, clienti)
+        _inserisci(conn, LavoroAdmin.__table__, lavori)
+        _inserisci(conn, Bene.__table__, beni)
+        if autore_id is not None:
+            _inserisci(conn, NoteAdmin.__table__, [
+                {'contenuto': f"Nota di prova {i}", 'autore_id': autore_id,
+                 'created_at': datetime.combine(oggi - timedelta(days=i), datetime.min.time())}
+                for i in range(50)
+            ])
+
+        session = Session(bind=conn)
+        try:
+            ricostruisci_fatture(session)
+            ricostruisci_dashboard_summary(session)
+            session.flush()
+        finally:
+            session.close()
+
+    return {'clienti': len(clienti), 'lavori': len(lavori), 'beni': len(beni)}
+
+
+def main():
+    if len(sys.argv) < 3:
+        print(__doc__)
+        return
+    n_lavori, percorso = int(sys.argv[1]), Path(sys.argv[2]).resolve()
+    seme = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    if percorso.exists():
+        print(f"[!] {percorso} esiste già: indica un file nuovo")
+        return
+
+    from app import create_app
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{percorso}"})
+    with app.app_context():
+        t0 = time.perf_counter()
+        conteggi = genera_dati(db.engine, n_lavori, seme)
+        secondi = time.perf_counter() - t0
+    print(f"[OK] {conteggi['lavori']} lavori, {conteggi['beni']} beni, {conteggi['clienti']} clienti "
+          f"in {secondi:.1f}s -> {percorso}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""
+Applica le migrazioni versionate dello schema (app/migrazioni.py).
+
+L'app le applica già da sola all'avvio se il database è indietro; eseguire lo
+script dopo un deploy evita che sia il primo worker a farlo e mostra la
+versione raggiunta. Sostituisce l'esecuzione a mano dei singoli migrate_*.py
+(che restano comunque utilizzabili).
+
+Istruzioni:
+1. Assicurati di essere nella directory del progetto
+2. Esegui: python migrate.py
+"""
+import logging
+
+from app import create_app, db
+from app.migrazioni import MIGRAZIONI, SCHEMA_VERSION, versione_corrente
+
+# Mostra i passi applicati, registrati da create_app con app.logger.info
+logging.basicConfig(level=logging.INFO, format="[+] %(message)s")
+
+app = create_app()
+
+with app.app_context():
+    versione = versione_corrente(db.engine)
+    print(f"[i] Schema alla versione {versione} di {SCHEMA_VERSION}")
+    for numero, nome, _ in MIGRAZIONI:
+        print(f"    {'[x]' if numero <= versione else '[ ]'} {numero:>2}. {nome}")
+    if versione >= SCHEMA_VERSION:
+        print("[OK] Database aggiornato")
@@ -0,0 +1,90 @@
+"""
+Script di migrazione per aggiungere l'indice su bene (lavoro_id, stato) usato
+per trovare i lavori idonei alla fatturazione (tutti i beni attivi nello stato
+richiesto) con un'unica GROUP BY lavoro_id coperta dall'indice:
+- ix_bene_lavoro_stato
+
+Sui database nuovi l'indice viene creati da db.create_all(); questo script
+serve solo per i database già esistenti.
+
+Istruzioni:
+1. Assicurati di essere nella directory del progetto
+2. Esegui: python migrate_add_bene_stato_index.py
+   (o python3 a seconda del tuo sistema)
+
+NOTA: Questo script si connette direttamente al database senza importare l'intera app
+per evitare problemi con dipendenze mancanti.
+"""
+import sqlite3
+from pathlib import Path
+
+def find_database():
+    """Trova il percorso del database gestionale.db"""
+    # Prova prima nella directory corrente
+    current_dir = Path.cwd()
+    db_path = current_dir / 'instance' / 'gestionale.db'
+    if db_path.exists():
+        return str(db_path)
+    
+    # Prova nella root del progetto
+    db_path = current_dir / 'gestionale.db'
+    if db_path.exists():
+        return str(db_path)
+    
+    # Prova in instance/
+    db_path = current_dir.parent / 'instance' / 'gestionale.db'
+    if db_path.exists():
+        return str(db_path)
+    
+    return None
+
+def table_exists(cursor, table_name):
+    """Verifica se una tabella esiste nel database"""
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
+    return cursor.fetchone() is not None
+
+def add_bene_stato_index():
+    """Crea l'indice su bene (lavoro_id, stato)"""
+    db_path = find_database()
+    
+    if not db_path:
+        print("[!] ERRORE: Database gestionale.db non trovato!")
+        print("    Cerca manualmente il percorso del database e modifica lo script.")
+        return False
+    
+    print(f"[i] Database trovato: {db_path}")
+    print()
+    
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    try:
+        if not table_exists(cursor, 'bene'):
+            print("[!] ERRORE: Tabella bene non presente!")
+            return False
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_bene_lavoro_stato ON bene (lavoro_id, stato)")
+        print("[+] Indice ix_bene_lavoro_stato pronto")
+        
+        conn.commit()
+        print("\n[OK] Migrazione completata con successo!")
+        return True
+    
+    except Exception as e:
+        conn.rollback()
+        print(f"[!] ERRORE durante la migrazione: {e}")
+        return False
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Migrazione Database: Indice stato beni per la fatturazione")
+    print("=" * 60)
+    print()
+    
+    success = add_bene_stato_index()
+    
+    if success:
+        print("\n[SUCCESS] Il database è stato aggiornato correttamente!")
+    else:
+        print("\n[ERROR] Si sono verificati errori durante la migrazione.")
+        print("Controlla i messaggi sopra per i dettagli.")
@@ -0,0 +1,125 @@
+"""
+Script di migrazione per aggiungere i contatori beni alla tabella lavoro_admin
+- beni_totali (INTEGER, default 0)
+- beni_abbandonati (INTEGER, default 0)
+- is_fully_abbandonato (BOOLEAN, default 0) + indice
+
+Dopo la migrazione i contatori vengono mantenuti automaticamente dagli event hook
+su Bene (vedi app/models.py); questo script li inizializza una sola volta
+ricontando i beni già presenti.
+
+Istruzioni:
+1. Assicurati di essere nella directory del progetto
+2. Esegui: python migrate_add_beni_counters.py
+   (o python3 a seconda del tuo sistema)
+
+NOTA: Questo script si connette direttamente al database senza importare l'intera app
+per evitare problemi con dipendenze mancanti.
+"""
+import sqlite3
+from pathlib import Path
+
+def find_database():
+    """Trova il percorso del database gestionale.db"""
+    # Prova prima nella directory corrente
+    current_dir = Path.cwd()
+    db_path = current_dir / 'instance' / 'gestionale.db'
+    if db_path.exists():
+        return str(db_path)
+    
+    # Prova nella root del progetto
+    db_path = current_dir / 'gestionale.db'
+    if db_path.exists():
+        return str(db_path)
+    
+    # Prova in instance/
+    db_path = current_dir.parent / 'instance' / 'gestionale.db'
+    if db_path.exists():
+        return str(db_path)
+    
+    return None
+
+def column_exists(cursor, table_name, column_name):
+    """Verifica se una colonna esiste già nella tabella"""
+    cursor.execute(f"PRAGMA table_info({table_name})")
+    columns = [row[1] for row in cursor.fetchall()]
+    return column_name in columns
+
+def add_beni_counters():
+    """Aggiunge e inizializza i contatori beni sulla tabella lavoro_admin"""
+    db_path = find_database()
+    
+    if not db_path:
+        print("[!] ERRORE: Database gestionale.db non trovato!")
+        print("    Cerca manualmente il percorso del database e modifica lo script.")
+        return False
+    
+    print(f"[i] Database trovato: {db_path}")
+    print()
+    
+    columns_to_add = [
+        ('beni_totali', 'INTEGER NOT NULL DEFAULT 0'),
+        ('beni_abbandonati', 'INTEGER NOT NULL DEFAULT 0'),
+        ('is_fully_abbandonato', 'BOOLEAN NOT NULL DEFAULT 0'),
+    ]
+    
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    try:
+        for column_name, column_type in columns_to_add:
+            if column_exists(cursor, 'lavoro_admin', column_name):
+                print(f"[i] Colonna {column_name} già esistente, skip...")
+            else:
+                cursor.execute(f"ALTER TABLE lavoro_admin ADD COLUMN {column_name} {column_type}")
+                print(f"[+] Colonna {column_name} aggiunta con successo")
+        
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS ix_lavoro_admin_is_fully_abbandonato "
+            "ON lavoro_admin (is_fully_abbandonato)"
+        )
+        print("[+] Indice ix_lavoro_admin_is_fully_abbandonato pronto")
+        
+        # Backfill: ricalcola i contatori da zero (idempotente, si può rieseguire)
+        print("[i] Ricalcolo contatori beni...")
+        cursor.execute("""
+            UPDATE lavoro_admin SET
+                beni_totali = (
+                    SELECT COUNT(*) FROM bene WHERE bene.lavoro_id = lavoro_admin.id
+                ),
+                beni_abbandonati = (
+                    SELECT COUNT(*) FROM bene
+                    WHERE bene.lavoro_id = lavoro_admin.id AND bene.stato = 'abbandonato'
+                )
+        """)
+        cursor.execute("""
+            UPDATE lavoro_admin
+            SET is_fully_abbandonato = (beni_totali > 0 AND beni_abbandonati = beni_totali)
+        """)
+        
+        cursor.execute("SELECT COUNT(*) FROM lavoro_admin WHERE is_fully_abbandonato = 1")
+        print(f"[i] Lavori con tutti i beni abbandonati: {cursor.fetchone()[0]}")
+        
+        conn.commit()
+        print("\n[OK] Migrazione completata con successo!")
+        return True
+    
+    except Exception as e:
+        conn.rollback()
+        print(f"[!] ERRORE durante la migrazione: {e}")
+        return False
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Migrazione Database: Contatori beni su lavoro_admin")
+    print("=" * 60)
+    print()
+    
+    success = add_beni_counters()
+    
+    if success:
+        print("\n[SUCCESS] Il database è stato aggiornato correttamente!")
+    else:
+        print("\n[ERROR] Si sono verificati errori durante la migrazione.")
+        print("Controlla i messaggi sopra per i dettagli.")
@@ -0,0 +1,93 @@
+"""
+Script di migrazione per aggiungere gli indici su created_at usati dalla
+timeline della dashboard (conteggio lavori per mese con un'unica GROUP BY):
+- ix_lavoro_admin_created_at
+- ix_lavoro40_created_at
+- ix_lavoro50_created_at
+
+Sui database nuovi gli indici vengono creati da db.create_all(); questo script
+serve solo per i database già esistenti.
+
+Istruzioni:
+1. Assicurati di essere nella directory del progetto
+2. Esegui: python migrate_add_created_at_indexes.py
+   (o python3 a seconda del tuo sistema)
+
+NOTA: Questo script si connette direttamente al database senza importare l'intera app
+per evitare problemi con dipendenze mancanti.
+"""
+import sqlite3
+from pathlib import Path
+
+def find_database():
+    """Trova il percorso del database gestionale.db"""
+    # Prova prima nella directory corrente
+    current_dir = Path.cwd()
+    db_path = current_dir / 'instance' / 'gestionale.db'
+    if db_path.exists():
+        return str(db_path)
+    
+    # Prova nella root del progetto
+    db_path = current_dir / 'gestionale.db'
+    if db_path.exists():
+        return str(db_path)
+    
+    # Prova in instance/
+    db_path = current_dir.parent / 'instance' / 'gestionale.db'
+    if db_path.exists():
+        return str(db_path)
+    
+    return None
+
+def table_exists(cursor, table_name):
+    """Verifica se una tabella esiste nel database"""
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
+    return cursor.fetchone() is not None
+
+def add_created_at_indexes():
+    """Crea gli indici su created_at per lavoro_admin, lavoro40 e lavoro50"""
+    db_path = find_database()
+    
+    if not db_path:
+        print("[!] ERRORE: Database gestionale.db non trovato!")
+        print("    Cerca manualmente il percorso del database e modifica lo script.")
+        return False
+    
+    print(f"[i] Database trovato: {db_path}")
+    print()
+    
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    try:
+        for table_name in ('lavoro_admin', 'lavoro40', 'lavoro50'):
+            if not table_exists(cursor, table_name):
+                print(f"[i] Tabella {table_name} non presente, skip...")
+                continue
+            index_name = f"ix_{table_name}_created_at"
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} (created_at)")
+            print(f"[+] Indice {index_name} pronto")
+        
+        conn.commit()
+        print("\n[OK] Migrazione completata con successo!")
+        return True
+    
+    except Exception as e:
+        conn.rollback()
+        print(f"[!] ERRORE durante la migrazione: {e}")
+        return False
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Migrazione Database: Indici created_at per la timeline")
+    print("=" * 60)
+    print()
+    
+    success = add_created_at_indexes()
+    
+    if success:
+        print("\n[SUCCESS] Il database è stato aggiornato correttamente!")
+    else:
+        print("\n[ERROR] Si sono verificati errori durante la migrazione.")
+        print("Controlla i messaggi sopra per i dettagli.")
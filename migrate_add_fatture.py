@@ -0,0 +1,44 @@
+"""
+Migrazione: Crea le tabelle fattura / fattura_riga e le popola dalle colonne
+f_* / data_fattura_* di LavoroAdmin.
+
+- fattura (soggetto, numero, data) con indici su (soggetto, numero) e (soggetto, data)
+- fattura_riga (fattura_id, lavoro_id, soggetto, data, compenso) con indici su
+  (lavoro_id, soggetto) e (fattura_id, lavoro_id)
+
+Le colonne f_* restano la fonte dei dati: dopo la migrazione le tabelle vengono
+riallineate automaticamente dall'applicazione ad ogni modifica di lavori e beni.
+Lo script ricostruisce le righe da zero e può essere eseguito più volte.
+
+Eseguire questo script sul server PythonAnywhere:
+1. Vai su PythonAnywhere Dashboard
+2. Apri una Bash console
+3. Vai nella directory del progetto: cd ~/fe-gestionale
+4. Attiva il virtualenv: source ~/.virtualenvs/my-venv/bin/activate
+5. Esegui: python migrate_add_fatture.py
+"""
+
+from app import create_app, db
+from app.models import Fattura, FatturaRiga
+from app.services.fatture import ricostruisci_fatture
+
+# create_app() crea anche le tabelle mancanti (db.create_all)
+app = create_app()
+
+with app.app_context():
+    try:
+        print("Popolo fattura / fattura_riga dalle colonne f_* dei lavori...")
+        ricostruisci_fatture(db.session)
+        db.session.commit()
+
+        print(f"  Fatture: {Fattura.query.count()}")
+        print(f"  Righe fattura: {FatturaRiga.query.count()}")
+        print("[OK] Migrazione completata con successo!")
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"[ERRORE] Errore durante la migrazione: {e}")
+        import traceback
+
+        traceback.print_exc()
+        raise
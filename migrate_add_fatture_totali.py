@@ -0,0 +1,62 @@
+"""
+Migrazione: Aggiunge gli aggregati alla tabella fattura
+- totale_compensi (FLOAT) - Somma dei compensi dei lavori della fattura
+- n_lavori (INTEGER) - Numero di lavori inclusi
+- primo_lavoro_id (INTEGER) - Lavoro con id più basso (spareggio dell'ordinamento per data)
+- indice ix_fattura_elenco su (soggetto, data DESC, primo_lavoro_id)
+
+Servono all'elenco paginato delle fatture emesse, che legge una pagina di
+intestazioni dalla sola tabella fattura. Da eseguire dopo migrate_add_fatture.py
+(sui database in cui la tabella fattura esiste già); può essere eseguito più volte.
+
+Eseguire questo script sul server PythonAnywhere:
+1. Vai su PythonAnywhere Dashboard
+2. Apri una Bash console
+3. Vai nella directory del progetto: cd ~/fe-gestionale
+4. Attiva il virtualenv: source ~/.virtualenvs/my-venv/bin/activate
+5. Esegui: python migrate_add_fatture_totali.py
+"""
+
+from app import create_app, db
+from sqlalchemy import text
+from app.services.fatture import ricostruisci_fatture
+
+app = create_app()
+
+NUOVE_COLONNE = {
+    'totale_compensi': 'FLOAT',
+    'n_lavori': 'INTEGER',
+    'primo_lavoro_id': 'INTEGER',
+}
+
+with app.app_context():
+    try:
+        inspector = db.inspect(db.engine)
+        columns = [col['name'] for col in inspector.get_columns('fattura')]
+
+        for nome, tipo in NUOVE_COLONNE.items():
+            if nome not in columns:
+                print(f"Aggiungo colonna {nome}...")
+                db.session.execute(text(f'ALTER TABLE fattura ADD COLUMN {nome} {tipo}'))
+            else:
+                print(f"Colonna {nome} già esistente")
+
+        db.session.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_fattura_elenco "
+            "ON fattura (soggetto, coalesce(data, '') DESC, primo_lavoro_id)"
+        ))
+        print("Indice ix_fattura_elenco pronto")
+
+        print("Ricalcolo fatture e aggregati...")
+        ricostruisci_fatture(db.session)
+
+        db.session.commit()
+        print("[OK] Migrazione completata con successo!")
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"[ERRORE] Errore durante la migrazione: {e}")
+        import traceback
+
+        traceback.print_exc()
+        raise
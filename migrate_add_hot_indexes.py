@@ -0,0 +1,107 @@
+"""
+Script di migrazione per aggiungere gli indici sulle colonne filtrate od
+ordinate da quasi tutte le viste:
+- ix_lavoro_admin_numero, ix_lavoro_admin_cliente_id
+- ix_lavoro_admin_stato_numero, ix_lavoro_admin_collaboratore_numero
+- ix_bene_lavoro_stato, ix_bene_stato_lavoro, ix_bene_ordine_abbandono
+- ix_note_admin_created_at
+- ix_changelog_attivo_ordine
+
+Sui database nuovi gli indici vengono creati da db.create_all(); questo script
+serve solo per i database già esistenti.
+
+Istruzioni:
+1. Assicurati di essere nella directory del progetto
+2. Esegui: python migrate_add_hot_indexes.py
+   (o python3 a seconda del tuo sistema)
+
+NOTA: Questo script si connette direttamente al database senza importare l'intera app
+per evitare problemi con dipendenze mancanti.
+"""
+import sqlite3
+from pathlib import Path
+
+def find_database():
+    """Trova il percorso del database gestionale.db"""
+    # Prova prima nella directory corrente
+    current_dir = Path.cwd()
+    db_path = current_dir / 'instance' / 'gestionale.db'
+    if db_path.exists():
+        return str(db_path)
+    
+    # Prova nella root del progetto
+    db_path = current_dir / 'gestionale.db'
+    if db_path.exists():
+        return str(db_path)
+    
+    # Prova in instance/
+    db_path = current_dir.parent / 'instance' / 'gestionale.db'
+    if db_path.exists():
+        return str(db_path)
+    
+    return None
+
+def table_exists(cursor, table_name):
+    """Verifica se una tabella esiste nel database"""
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
+    return cursor.fetchone() is not None
+
+# (nome indice, tabella, colonne): stessi nomi dichiarati in app/models.py
+INDICI = [
+    ('ix_lavoro_admin_numero', 'lavoro_admin', 'numero'),
+    ('ix_lavoro_admin_cliente_id', 'lavoro_admin', 'cliente_id'),
+    ('ix_lavoro_admin_stato_numero', 'lavoro_admin', 'stato, numero'),
+    ('ix_lavoro_admin_collaboratore_numero', 'lavoro_admin', 'collaboratore, numero'),
+    ('ix_bene_lavoro_stato', 'bene', 'lavoro_id, stato'),
+    ('ix_bene_stato_lavoro', 'bene', 'stato, lavoro_id'),
+    ('ix_bene_ordine_abbandono', 'bene', 'ordine_abbandono'),
+    ('ix_note_admin_created_at', 'note_admin', 'created_at'),
+    ('ix_changelog_attivo_ordine', 'changelog', 'attivo, ordine'),
+]
+
+def add_hot_indexes():
+    """Crea gli indici elencati in INDICI sulle tabelle presenti"""
+    db_path = find_database()
+    
+    if not db_path:
+        print("[!] ERRORE: Database gestionale.db non trovato!")
+        print("    Cerca manualmente il percorso del database e modifica lo script.")
+        return False
+    
+    print(f"[i] Database trovato: {db_path}")
+    print()
+    
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    try:
+        for index_name, table_name, columns in INDICI:
+            if not table_exists(cursor, table_name):
+                print(f"[i] Tabella {table_name} non presente, skip {index_name}...")
+                continue
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({columns})")
+            print(f"[+] Indice {index_name} pronto")
+        
+        conn.commit()
+        print("\n[OK] Migrazione completata con successo!")
+        return True
+    
+    except Exception as e:
+        conn.rollback()
+        print(f"[!] ERRORE durante la migrazione: {e}")
+        return False
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("Migrazione Database: Indici sulle colonne più filtrate")
+    print("=" * 60)
+    print()
+    
+    success = add_hot_indexes()
+    
+    if success:
+        print("\n[SUCCESS] Il database è stato aggiornato correttamente!")
+    else:
+        print("\n[ERROR] Si sono verificati errori durante la migrazione.")
+        print("Controlla i messaggi sopra per i dettagli.")
@@ -0,0 +1,29 @@
+"""
+Ricostruisce da zero l'indice della ricerca full-text (tabella FTS5 `ricerca`
+su lavori, beni, clienti e note admin, vedi app/services/ricerca.py).
+
+Non serve nell'uso normale: la migrazione 18 crea e popola l'indice e i trigger
+lo tengono aggiornato. Va eseguito se il database è stato modificato con i
+trigger assenti (es. un backup ripristinato su uno schema più vecchio) o se la
+ricerca restituisce risultati non coerenti con i dati. La tabella viene
+creata se manca e i trigger vengono ricreati.
+
+Istruzioni:
+1. Assicurati di essere nella directory del progetto
+2. Esegui: python ricostruisci_indice_ricerca.py
+"""
+import time
+
+from app import create_app, db
+from app.services.ricerca import crea_indice_ricerca, ricostruisci_indice_ricerca
+
+app = create_app()
+
+with app.app_context():
+    t0 = time.perf_counter()
+    with db.engine.begin() as conn:
+        crea_indice_ricerca(conn)
+        conteggi = ricostruisci_indice_ricerca(conn)
+    for tipo, n in conteggi.items():
+        print(f"[+] {tipo:<8} {n} righe indicizzate")
+    print(f"[OK] Indice di ricerca ricostruito in {time.perf_counter() - t0:.1f}s")
@@ -0,0 +1,92 @@
+"""
+Verifica della parità tra il calcolo vettoriale dei compensi
+(active_compensi_batch, app/services/compensi.py) e quello lavoro per lavoro
+(_active_compensi in app/routes/main_routes.py).
+Genera lavori casuali, senza database, che coprono origini e redattori
+manuali (BIANC / DELOITTE), mancanti, vuoti, con spazi o minuscoli, beni
+tutti attivi (ratio 1), parzialmente o tutti abbandonati, importi a zero o
+None, lavori senza beni, revisore / caricamento / Sabatini e spese
+amministrative. I dieci compensi devono coincidere esattamente.
+
+Istruzioni:
+1. Assicurati di essere nella directory del progetto
+2. Esegui: python verifica_compensi_batch.py [n_lavori] [seme]
+   (default 20000 lavori, seme 1)
+"""
+import random
+import sys
+
+from app.models import Bene, LavoroAdmin
+from app.routes.main_routes import _active_compensi
+from app.services.compensi import COMPENSI_KEYS, active_compensi_batch
+
+SOGGETTI = ['AMIN', 'GALVAN', 'FH', 'EXT', 'BIANC', 'DELOITTE']
+# Valori anomali di origine / redattore, trattati come nel calcolo per lavoro
+ANOMALI = [None, '', ' ', 'amin', 'Ext', 'FH ', 'deloitte', 'ALTRO']
+STATI_BENI = ['vuoto', 'In corso', 'da firmare', 'da fatturare', 'da incassare', 'incassata', 'abbandonato']
+
+
+def _importo(rnd):
+    r = rnd.random()
+    if r < 0.05:
+        return None
+    if r < 0.12:
+        return 0.0
+    return round(rnd.uniform(50, 20_000), rnd.choice([0, 2, 7]))
+
+
+def _soggetto(rnd):
+    return rnd.choice(SOGGETTI) if rnd.random() < 0.8 else rnd.choice(ANOMALI)
+
+
+def _lavoro(rnd):
+    lavoro = LavoroAdmin(
+        origine=_soggetto(rnd), redattore=_soggetto(rnd), importo_offerta=_importo(rnd),
+        **{chiave: _importo(rnd) if rnd.random() < 0.7 else None for chiave in COMPENSI_KEYS},
+        has_revisore=rnd.random() < 0.3, importo_revisione=_importo(rnd),
+        has_caricamento=rnd.random() < 0.2, importo_caricamento=_importo(rnd),
+        has_sabatini=rnd.random() < 0.15, importo_sabatini=_importo(rnd),
+        spese_amministrative=rnd.random() < 0.25,
+    )
+    caso = rnd.random()
+    n_beni = 0 if caso < 0.1 else rnd.randint(1, 5)
+    beni = []
+    for _ in range(n_beni):
+        if caso < 0.3:
+            stato = rnd.choice(STATI_BENI[:-1])  # Nessun abbandono: ratio 1
+        elif caso < 0.4:
+            stato = 'abbandonato'  # Tutti abbandonati
+        else:
+            stato = rnd.choice(STATI_BENI)
+        importo = 0.0 if caso > 0.95 else _importo(rnd)  # Totale a zero
+        beni.append(Bene(stato=stato, importo_offerta=importo))
+    lavoro.beni_list = beni
+    return lavoro
+
+
+def main():
+    n_lavori = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    seme = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    rnd = random.Random(seme)
+    lavori = [_lavoro(rnd) for _ in range(n_lavori)]
+
+    batch = active_compensi_batch(lavori)
+    differenze = []
+    for i, lavoro in enumerate(lavori):
+        atteso = _active_compensi(lavoro)
+        for chiave in COMPENSI_KEYS:
+            if float(batch[chiave][i]) != float(atteso[chiave]):
+                differenze.append((i, chiave, atteso[chiave], float(batch[chiave][i])))
+
+    if differenze:
+        print(f"[ERRORE] {len(differenze)} compensi diversi su {n_lavori} lavori:")
+        for i, chiave, atteso, ottenuto in differenze[:20]:
+            lavoro = lavori[i]
+            print(f"    lavoro {i} ({lavoro.origine!r} / {lavoro.redattore!r}) {chiave}: "
+                  f"atteso {atteso!r}, batch {ottenuto!r}")
+        sys.exit(1)
+    print(f"[OK] {n_lavori} lavori: compensi vettoriali identici al calcolo per lavoro")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+"""
+Verifica locale degli eventi in tempo reale (/api/eventi, Server-Sent Events).
+Avvia l'app con il server di sviluppo multi-thread su un database temporaneo
+e apre uno stream SSE come admin. Un secondo admin crea, modifica ed elimina
+una nota e pubblica un changelog: per ognuno controlla che l'evento arrivi e,
+dopo, che i keepalive non inviino un 'aggiorna' ridondante.
+Poi scrive una nota con un'altra istanza dell'app, come farebbe un altro
+worker che non pubblica nello stesso processo, e controlla che arrivi
+'aggiorna'.
+Controlla anche che più stream aperti non blocchino le altre richieste, che
+gli stream chiusi dal client vengano rilasciati e che un utente base riceva
+403. gestionale.db non viene toccato.
+
+Istruzioni:
+1. Assicurati di essere nella directory del progetto
+2. Esegui: python verifica_eventi_sse.py
+"""
+import json
+import logging
+import queue
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+from pathlib import Path
+
+from werkzeug.serving import make_server
+
+from app import create_app, db
+from app.migrazioni import PASSWORD_DEFAULT, UTENTI_DEFAULT
+from app.models import NoteAdmin, User
+from app.services.eventi import connessioni_aperte
+
+ATTESA = 5  # Secondi massimi di attesa per ogni evento
+INTERVALLO = 1  # EVENTI_SSE_INTERVALLO della verifica (15 in produzione)
+
+
+def _client(base, username):
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+    dati = urllib.parse.urlencode({'username': username, 'password': PASSWORD_DEFAULT}).encode()
+    opener.open(base + '/login', dati).read()
+    return opener
+
+
+def _richiesta(opener, url, metodo='GET', dati=None):
+    richiesta = urllib.request.Request(
+        url, method=metodo, data=json.dumps(dati).encode() if dati is not None else None,
+        headers={'Content-Type': 'application/json'},
+    )
+    with opener.open(richiesta) as risposta:
+        return json.loads(risposta.read() or b'null')
+
+
+def _leggi_eventi(risposta, eventi):
+    evento, dati = None, []
+    try:
+        for riga in risposta:
+            riga = riga.decode().rstrip('\n')
+            if riga.startswith('event: '):
+                evento = riga[len('event: '):]
+            elif riga.startswith('data: '):
+                dati.append(riga[len('data: '):])
+            elif riga == '' and evento:
+                eventi.put((time.perf_counter(), evento, json.loads('\n'.join(dati))))
+                evento, dati = None, []
+    except (OSError, ValueError, AttributeError):
+        pass  # Stream chiuso (anche da un altro thread)
+
+
+def _attendi(eventi, condizione):
+    """Primo evento che soddisfa `condizione` entro ATTESA secondi (gli altri vengono saltati)."""
+    scadenza = time.perf_counter() + ATTESA
+    while (restante := scadenza - time.perf_counter()) > 0:
+        try:
+            arrivo, evento, dati = eventi.get(timeout=restante)
+        except queue.Empty:
+            break
+        if condizione(evento, dati):
+            return arrivo
+    return None
+
+
+def _svuota(eventi):
+    while True:
+        try:
+            eventi.get_nowait()
+        except queue.Empty:
+            return
+
+
+def main():
+    esiti = []
+
+    def controlla(nome, ok, dettaglio=''):
+        esiti.append(ok)
+        print(f"[{'OK' if ok else 'ERRORE'}] {nome}{' - ' + dettaglio if dettaglio else ''}")
+
+    with tempfile.TemporaryDirectory() as cartella:
+        uri = f"sqlite:///{Path(cartella) / 'eventi.db'}"
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': uri,
+            'EVENTI_SSE': True,
+            'EVENTI_SSE_INTERVALLO': INTERVALLO,
+            'SLOW_REQUEST_MS': None,
+        })
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_port}"
+        lettore, scrittore = UTENTI_DEFAULT['admin'][:2]
+
+        stream = _client(base, lettore).open(base + '/api/eventi', timeout=30)
+        controlla('stream aperto', stream.headers.get_content_type() == 'text/event-stream')
+        eventi = queue.Queue()
+        threading.Thread(target=_leggi_eventi, args=(stream, eventi), daemon=True).start()
+
+        # Altri stream aperti: il server multi-thread deve continuare a servire le richieste
+        altri_stream = [_client(base, lettore).open(base + '/api/eventi', timeout=30) for _ in range(3)]
+        admin = _client(base, scrittore)
+        t0 = time.perf_counter()
+        _richiesta(admin, base + '/api/note')
+        controlla('richieste servite con 4 stream aperti', True, f"{(time.perf_counter() - t0) * 1000:.0f} ms")
+
+        def verifica_evento(nome, invia, condizione):
+            inizio = time.perf_counter()
+            risultato = invia()
+            arrivo = _attendi(eventi, lambda evento, dati: condizione(evento, dati, risultato))
+            controlla(nome, arrivo is not None, f"{(arrivo - inizio) * 1000:.0f} ms" if arrivo else 'non arrivato')
+            return risultato
+
+        nota = verifica_evento(
+            'nota creata',
+            lambda: _richiesta(admin, base + '/api/note', 'POST', {'contenuto': 'Prima nota'}),
+            lambda evento, dati, nota: evento == 'nota' and dati['azione'] == 'creata' and dati['nota']['id'] == nota['id'],
+        )
+        verifica_evento(
+            'nota modificata',
+            lambda: _richiesta(admin, f"{base}/api/note/{nota['id']}", 'PUT', {'contenuto': 'Nota corretta'}),
+            lambda evento, dati, _: evento == 'nota' and dati['azione'] == 'modificata' and dati['nota']['contenuto'] == 'Nota corretta',
+        )
+        verifica_evento(
+            'nota eliminata',
+            lambda: _richiesta(admin, f"{base}/api/note/{nota['id']}", 'DELETE'),
+            lambda evento, dati, _: evento == 'nota' and dati['azione'] == 'eliminata' and dati['nota']['id'] == nota['id'],
+        )
+        verifica_evento(
+            'changelog creato',
+            lambda: _richiesta(admin, base + '/api/changelog', 'POST', {'versione': '9.9', 'titolo': 'Prova', 'contenuto': '<p>x</p>'}),
+            lambda evento, dati, ch: evento == 'changelog' and dati['azione'] == 'creato' and dati['changelog']['id'] == ch['id'],
+        )
+
+        # I commit arrivati come evento sono già noti al client: ai keepalive
+        # successivi non deve arrivare un 'aggiorna' ridondante
+        ridondanti = []
+        scadenza = time.perf_counter() + 2 * INTERVALLO + 0.5
+        while (restante := scadenza - time.perf_counter()) > 0:
+            try:
+                _, evento, dati = eventi.get(timeout=restante)
+            except queue.Empty:
+                break
+            if evento == 'aggiorna':
+                ridondanti.append(dati['domini'])
+        controlla("nessun 'aggiorna' dopo gli eventi", not ridondanti, str(ridondanti) if ridondanti else '')
+
+        # Altro worker: scrive senza pubblicare in questo processo
+        _svuota(eventi)
+        altro_worker = create_app({'SQLALCHEMY_DATABASE_URI': uri, 'SLOW_REQUEST_MS': None})
+
+        def scrivi_da_altro_worker():
+            with altro_worker.app_context():
+                autore = User.query.filter_by(username=scrittore).one()
+                db.session.add(NoteAdmin(contenuto='Da un altro worker', autore_id=autore.id))
+                db.session.commit()
+
+        verifica_evento(
+            "'aggiorna' per una nota di un altro worker",
+            scrivi_da_altro_worker,
+            lambda evento, dati, _: evento == 'aggiorna' and 'note' in dati['domini'],
+        )
+
+        base_user = _client(base, UTENTI_DEFAULT['base'][0])
+        try:
+            base_user.open(base + '/api/eventi').read()
+            controlla('utente base escluso', False, 'stream aperto')
+        except urllib.error.HTTPError as errore:
+            controlla('utente base escluso', errore.code == 403, f"HTTP {errore.code}")
+
+        # Chiusi dal client, gli stream se ne accorgono al keepalive successivo
+        for risposta in [stream, *altri_stream]:
+            risposta.close()
+        time.sleep(2 * INTERVALLO + 0.5)
+        controlla('stream chiusi rilasciati', connessioni_aperte() == 0, f"{connessioni_aperte()} ancora aperti")
+        server.shutdown()
+
+    if not all(esiti):
+        sys.exit(1)
+    print("\n[OK] Eventi SSE verificati")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+"""
+Script di controllo della numerazione dei lavori attivi.
+
+Confronta i numeri attuali (mantenuti in modo incrementale dall'applicazione)
+con quelli che produrrebbe il ricalcolo completo ricalcola_numeri_sequenziali().
+
+Eseguire con:
+    python verifica_numerazione.py          # solo verifica
+    python verifica_numerazione.py --fix    # riallinea con il ricalcolo completo
+"""
+import sys
+
+from app import create_app, db
+from app.services.numerazione import ricalcola_numeri_sequenziali, verifica_numerazione
+
+app = create_app()
+
+with app.app_context():
+    discrepanze = verifica_numerazione()
+    if not discrepanze:
+        print("[OK] La numerazione coincide con il ricalcolo completo.")
+        sys.exit(0)
+
+    print(f"[!] {len(discrepanze)} lavori con numero diverso dal ricalcolo completo:")
+    for lavoro_id, numero, atteso in discrepanze[:50]:
+        print(f"    lavoro id={lavoro_id}: numero {numero} -> atteso {atteso}")
+    if len(discrepanze) > 50:
+        print(f"    ... e altri {len(discrepanze) - 50}")
+
+    if '--fix' in sys.argv:
+        ricalcola_numeri_sequenziali()
+        db.session.commit()
+        print("[OK] Numerazione riallineata.")
+    else:
+        print("Riesegui con --fix per riallineare la numerazione.")
+        sys.exit(1)
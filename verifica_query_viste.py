@@ -0,0 +1,116 @@
+"""
+Verifica locale del numero di query SQL delle viste con i lavori (caricamento
+anticipato dei beni, app/services/lavori.py).
+Genera due database temporanei con dati sintetici di dimensioni diverse e, su
+ognuno, apre ogni vista contando le istruzioni SQL eseguite (hook
+before_cursor_execute sull'engine). Fa anche da prova di rendering delle due
+viste che usano main/lavori_admin.html (lavori_admin e lavori_focus). Per ogni
+vista controlla che la risposta sia 200 e che il numero di query sia lo stesso con entrambe le dimensioni e
+non superi QUERY_MAX: una query per riga (N+1) lo farebbe crescere con i dati.
+gestionale.db non viene toccato.
+
+Istruzioni:
+1. Assicurati di essere nella directory del progetto
+2. Esegui: python verifica_query_viste.py
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+from sqlalchemy import event, text
+
+from app import create_app, db
+from app.migrazioni import PASSWORD_DEFAULT, UTENTI_DEFAULT
+from genera_dati_sintetici import genera_dati
+
+# Lavori dei due database: entrambi sotto i 500 id per SELECT ... IN che
+# selectinload usa per i beni, così le viste senza paginazione (lavori_focus)
+# fanno la stessa singola query dei beni con tutte e due le dimensioni
+DIMENSIONI = (200, 450)
+QUERY_MAX = 25
+
+ADMIN = UTENTI_DEFAULT['admin'][0]  # Admin di default: vista 'extra2', apre anche /lavori_focus
+BASE = 'Gianmarco'  # Utente base con collaboratore 'Passiatore'
+
+# (utente, url): {fattura_fe} viene sostituito con un numero di fattura esistente
+VISTE = [
+    (ADMIN, '/dashboard'),
+    (ADMIN, '/lavori_admin'),
+    (ADMIN, '/lavori_admin?filtro_stato=in_lavorazione'),
+    (ADMIN, '/lavori_admin?filtro_stato=da_incassare'),
+    (ADMIN, '/lavori_admin?filtro_stato=completati'),
+    (ADMIN, '/lavori_admin?filtro_stato=abbandonati'),
+    (ADMIN, '/lavori_focus'),
+    (ADMIN, '/lavori_focus?show=chiusi'),
+    (ADMIN, '/fatturazione/fe'),
+    (ADMIN, '/fatturazione/amin'),
+    (ADMIN, '/fatturazione_esterni/ext'),
+    (ADMIN, '/api/fatturazione/lista/fe'),
+    (ADMIN, '/api/fatturazione_esterni/lista/ext'),
+    (ADMIN, '/api/da-incassare'),
+    (ADMIN, '/api/fatturazione/lavori-disponibili/amin'),
+    (ADMIN, '/api/fatturazione_esterni/lavori-disponibili/bianc'),
+    (ADMIN, '/api/fatturazione/dettaglio/fe/{fattura_fe}'),
+    (BASE, '/lavori'),
+]
+
+
+def conta_query(cartella, n_lavori):
+    """Numero di query (e status) di ogni vista su un database con n_lavori lavori."""
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{Path(cartella) / f'viste_{n_lavori}.db'}",
+        'SLOW_REQUEST_MS': None,
+    })
+    with app.app_context():
+        genera_dati(db.engine, n_lavori)
+        with db.engine.begin() as conn:
+            conn.execute(text("UPDATE lavoro_admin SET collaboratore = 'Passiatore' WHERE id % 4 = 0"))
+            fattura_fe = conn.execute(text(
+                'SELECT f_fe FROM lavoro_admin WHERE f_fe IS NOT NULL ORDER BY id LIMIT 1'
+            )).scalar()
+        engine = db.engine
+
+    conteggio = {'n': 0}
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _conta(*args):
+        conteggio['n'] += 1
+
+    client = {}
+    for username in (ADMIN, BASE):
+        client[username] = app.test_client()
+        client[username].post('/login', data={'username': username, 'password': PASSWORD_DEFAULT})
+
+    risultati = {}
+    for username, url in VISTE:
+        url = url.format(fattura_fe=fattura_fe)
+        conteggio['n'] = 0
+        risposta = client[username].get(url)
+        risultati[url.replace(fattura_fe, '{fattura_fe}')] = (risposta.status_code, conteggio['n'])
+    return risultati
+
+
+def main():
+    with tempfile.TemporaryDirectory() as cartella:
+        misure = [conta_query(cartella, n) for n in DIMENSIONI]
+
+    ok = True
+    print(f"{'vista':<55}" + ''.join(f"{n:>8}" for n in DIMENSIONI))
+    for url in misure[0]:
+        valori = [m[url] for m in misure]
+        stati = {status for status, _ in valori}
+        query = [n for _, n in valori]
+        errore = stati != {200} or len(set(query)) > 1 or max(query) > QUERY_MAX
+        ok &= not errore
+        print(f"{'[ERRORE] ' if errore else ''}{url:<55}" + ''.join(
+            f"{n:>8}" if status == 200 else f"{'HTTP ' + str(status):>8}" for status, n in valori
+        ))
+
+    if not ok:
+        print(f"\n[ERRORE] Query diverse tra le dimensioni, oltre {QUERY_MAX} o risposte non 200")
+        sys.exit(1)
+    print(f"\n[OK] Numero di query costante (massimo {QUERY_MAX}) per tutte le viste")
+
+
+if __name__ == '__main__':
+    main()